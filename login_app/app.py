@@ -1,6 +1,8 @@
 from flask import Flask
-from .extensions import db, login_manager, cors, get_supabase
+from .extensions import db, login_manager, cors, supabase_pool
 from .models import User
+from .supabase_jwt import token_verifier
+from .user_cache import user_cache
 from .auth import auth as auth_blueprint
 from .main import main as main_blueprint
 from .characters import characters as characters_blueprint
@@ -24,17 +26,24 @@ def create_app():
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     
+    # Verify the Supabase access token locally on every request (optional)
+    app.config['SUPABASE_JWT_VERIFY'] = os.environ.get('SUPABASE_JWT_VERIFY', '').lower() in ('1', 'true', 'yes')
+    app.config['SUPABASE_JWT_SECRET'] = os.environ.get('SUPABASE_JWT_SECRET')
+    
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     cors.init_app(app)
+    user_cache.init_app(app)
+    supabase_pool.init_app(app)
+    token_verifier.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(user_id, lambda: User.query.get(int(user_id)))
     
     # Register blueprints
     app.register_blueprint(auth_blueprint)
@@ -1,15 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort, jsonify, session, Response, make_response, stream_with_context, g
 from flask_login import LoginManager, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
+from sqlalchemy import bindparam, delete, event, exists, func, insert, inspect, literal, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session, Session as SQLASession
+from collections import namedtuple
 import os
+import json
+import time
+import hashlib
 import uuid
-from .extensions import db, login_manager, migrate, cors
+import click
+from .extensions import db, login_manager, migrate, cors, get_supabase_auth, supabase_pool
 from .models import User, init_db
 from .auth import auth as auth_blueprint
 from .main import main as main_blueprint
 from .storage import allowed_file
+from .chat_events import chat_broker, format_sse
+from .chat_cache import chat_cache, invalidate_sender, sender_profiles
+from .chat_writer import chat_writer
+from .chat_search import ensure_chat_search_index, search_chat_messages
+from .npc_search import ensure_npc_search_index, search_npcs
+from .chat_archive import DEFAULT_CODEC, pack_messages, unpack_messages
+from .dice import DiceError, dice_distribution, parse_dice
+from .dice_log import dice_log_writer, dice_stats, pack_faces, unpack_faces
+from .encounter import EncounterError, parse_encounter, simulate_encounter
+from .fragment_cache import fragment_cache
+from .membership import membership_index
+from .ttl_cache import TTLCache
+from .supabase_jwt import token_verifier
+from .user_cache import user_cache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -17,6 +40,16 @@ load_dotenv()
 
 import os
 
+# Nav badge count per user; changes invalidate it, the TTL bounds staleness across workers
+pending_actions_cache = TTLCache(ttl=60, config_prefix='PENDING_ACTIONS_CACHE')
+# Campaign page view models; committed writes drop them, the TTL bounds staleness across workers
+campaign_snapshots = TTLCache(ttl=30, max_entries=256, config_prefix='CAMPAIGN_SNAPSHOT_CACHE')
+# A campaign's DM never changes, so the chat read path can keep it for a while
+campaign_dm_ids = TTLCache(ttl=600, config_prefix='CAMPAIGN_DM_CACHE')
+# Newest chat message id per campaign as last read from the database; bounds how
+# late messages committed by other worker processes show up on a cache hit
+chat_newest_ids = TTLCache(ttl=2, config_prefix='CHAT_NEWEST_ID_CACHE')
+
 def create_app():
     app = Flask(__name__)
     
@@ -33,18 +66,49 @@ def create_app():
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     
+    # Chat ring buffer: recent messages kept per campaign and total memory cap
+    app.config['CHAT_CACHE_PER_CAMPAIGN'] = int(os.environ.get('CHAT_CACHE_PER_CAMPAIGN', 200))
+    app.config['CHAT_CACHE_MAX_BYTES'] = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    # Messages older than this are moved to the compressed archive by `flask compact-chat`
+    app.config['CHAT_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 90))
+    # Chat streams and long-polls held open per worker process; each one pins a
+    # gthread worker thread, so together they must leave some of --threads free
+    # for page requests. Clients without a stream slot long-poll instead
+    app.config['CHAT_MAX_OPEN_STREAMS'] = int(os.environ.get('CHAT_MAX_OPEN_STREAMS', 20))
+    app.config['CHAT_MAX_LONG_POLLS'] = int(os.environ.get('CHAT_MAX_LONG_POLLS', 8))
+    # Worker processes for large encounter simulations (0 = simulate in the request thread)
+    app.config['ENCOUNTER_PROCESSES'] = int(os.environ.get('ENCOUNTER_PROCESSES', 0))
+    # Keep-alive connections to Supabase held open per worker process
+    app.config['SUPABASE_POOL_MAX_CONNECTIONS'] = int(os.environ.get('SUPABASE_POOL_MAX_CONNECTIONS', 20))
+    # Verify the Supabase access token locally on every request (optional)
+    app.config['SUPABASE_JWT_VERIFY'] = os.environ.get('SUPABASE_JWT_VERIFY', '').lower() in ('1', 'true', 'yes')
+    app.config['SUPABASE_JWT_SECRET'] = os.environ.get('SUPABASE_JWT_SECRET')
+    
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     cors.init_app(app)
+    chat_cache.init_app(app)
+    chat_broker.init_app(app)
+    membership_index.init_app(app)
+    pending_actions_cache.init_app(app)
+    campaign_snapshots.init_app(app)
+    campaign_dm_ids.init_app(app)
+    chat_newest_ids.init_app(app)
+    fragment_cache.init_app(app)
+    user_cache.init_app(app)
+    supabase_pool.init_app(app)
+    token_verifier.init_app(app)
+    chat_writer.init_app(app, insert_chat_messages)
+    dice_log_writer.init_app(app, insert_dice_rolls)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(user_id)
+        return user_cache.load(user_id, lambda: User.query.get(user_id))
     
     # Register blueprints
     app.register_blueprint(auth_blueprint)
@@ -85,6 +149,17 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime, nullable=True)
     supabase_uid = db.Column(db.String(255), unique=True, nullable=True)  # Supabase user ID
     
+    # Case-insensitive prefix search for the player typeahead; text_pattern_ops
+    # lets Postgres use them for LIKE 'abc%' under any collation
+    __table_args__ = (
+        db.Index('ix_user_username_lower', func.lower(username).label('username_lower'),
+                 postgresql_ops={'username_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_full_name_lower', func.lower(full_name).label('full_name_lower'),
+                 postgresql_ops={'full_name_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_email_lower', func.lower(email).label('email_lower'),
+                 postgresql_ops={'email_lower': 'text_pattern_ops'}),
+    )
+    
     @classmethod
     def get_or_create_from_supabase(cls, supabase_user):
         """Get or create a user from Supabase auth data"""
@@ -148,6 +223,85 @@ class Message(db.Model):
     user = db.relationship('User', backref=db.backref('messages', lazy=True))
     campaign = db.relationship('Campaign', backref=db.backref('messages', lazy=True, order_by='Message.timestamp'))
     character = db.relationship('Character', backref=db.backref('messages', lazy=True))
+    
+    # Keyset pagination of chat history walks this index backwards
+    __table_args__ = (
+        db.Index('ix_message_campaign_timestamp_id', 'campaign_id', 'timestamp', 'id'),
+    )
+
+@event.listens_for(Message, 'after_insert')
+def _queue_chat_notification(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('chat_notifications', []).append((target.campaign_id, target.id))
+
+@event.listens_for(SQLASession, 'after_commit')
+def _publish_chat_notifications(session):
+    for campaign_id, message_id in session.info.pop('chat_notifications', []):
+        chat_broker.notify(campaign_id, message_id)
+
+@event.listens_for(SQLASession, 'after_rollback')
+def _discard_chat_notifications(session):
+    session.info.pop('chat_notifications', None)
+
+class ChatSendKey(db.Model):
+    """Idempotency key of a sent chat message, so a retried send can't post it twice"""
+    __tablename__ = 'chat_send_key'
+    campaign_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    # Chosen by the browser per message and reused when it retries the send
+    client_id = db.Column(db.String(64), primary_key=True)
+    message_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class MessageArchive(db.Model):
+    """Compressed block of old chat messages moved out of the message table"""
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    codec = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_message_archive_campaign_last', 'campaign_id', 'last_timestamp', 'last_message_id'),
+    )
+
+class ArchivedMessageText(db.Model):
+    """Plain text of an archived message, kept only so chat search still finds it"""
+    __tablename__ = 'archived_message_text'
+    # Same id the message had in the message table
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False, index=True)
+    archive_id = db.Column(db.Integer, db.ForeignKey('message_archive.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+
+# Read-only stand-in for archived messages; has the attributes chat serialization uses
+ArchivedMessage = namedtuple('ArchivedMessage', 'id content timestamp user_id character_id')
+
+class DiceNotation(db.Model):
+    """Distinct normalized dice expressions, referenced by id from the roll log"""
+    id = db.Column(db.Integer, primary_key=True)
+    notation = db.Column(db.String(200), unique=True, nullable=False)
+
+class DiceRoll(db.Model):
+    """One logged roll; its dice are packed into ``faces`` (see dice_log.pack_faces)"""
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=True)
+    notation_id = db.Column(db.Integer, db.ForeignKey('dice_notation.id'), nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    faces = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_dice_roll_campaign_id', 'campaign_id', 'id'),
+    )
 
 class NPC(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -169,6 +323,13 @@ class NPC(db.Model):
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    # Page validators aggregate updated_at per campaign straight from the first
+    # index; the second serves the alphabetical, paginated NPC list
+    __table_args__ = (
+        db.Index('ix_npc_campaign_updated', 'campaign_id', 'updated_at'),
+        db.Index('ix_npc_campaign_name', 'campaign_id', 'name'),
+    )
+    
     def __repr__(self):
         return f"NPC('{self.name}', '{self.race}')"
 
@@ -188,9 +349,207 @@ class Quest(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     campaign = db.relationship('Campaign', backref=db.backref('quests', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_quest_campaign_updated', 'campaign_id', 'updated_at'),
+    )
+
     def __repr__(self):
         return f"Quest('{self.title}', status='{self.status}')"
 
+class Tag(db.Model):
+    """A distinct tag within a campaign; ``key`` is the case-folded name used for matching"""
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'key', name='uq_tag_campaign_key'),
+    )
+
+# Which NPCs and quests carry which tag. The primary key answers "everything
+# with tag X", the second index "all tags of this NPC/quest".
+entity_tag = db.Table('entity_tag',
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Column('entity_type', db.String(10), primary_key=True),
+    db.Column('entity_id', db.Integer, primary_key=True),
+    db.Index('ix_entity_tag_entity', 'entity_type', 'entity_id')
+)
+
+TAG_MAX_LENGTH = 100
+
+def tag_key(name):
+    return name.strip().casefold()
+
+def normalize_tags(tags):
+    """
+    Tag names from a list or a comma-separated string: trimmed, without
+    empties, de-duplicated case-insensitively, first spelling and order kept
+    """
+    parts = tags if isinstance(tags, (list, tuple)) else str(tags or '').split(',')
+    seen = set()
+    normalized = []
+    for part in parts:
+        name = str(part or '').strip()[:TAG_MAX_LENGTH]
+        if name and tag_key(name) not in seen:
+            seen.add(tag_key(name))
+            normalized.append(name)
+    return normalized
+
+def _insert_ignoring_conflicts(connection, table):
+    # Concurrent writers may create the same campaign tag; the unique key decides
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if connection.dialect.name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def _tag_ids(connection, campaign_id, names):
+    """Ids of the campaign's tags with these names, creating missing ones"""
+    tag_table = Tag.__table__
+    by_key = {tag_key(name): name for name in names}
+    lookup = select(tag_table.c.key, tag_table.c.id).where(
+        tag_table.c.campaign_id == campaign_id, tag_table.c.key.in_(by_key)
+    )
+    ids = dict(connection.execute(lookup).all())
+    missing = [key for key in by_key if key not in ids]
+    if missing:
+        connection.execute(_insert_ignoring_conflicts(connection, tag_table), [
+            {'campaign_id': campaign_id, 'name': by_key[key], 'key': key} for key in missing
+        ])
+        ids = dict(connection.execute(lookup).all())
+    return [ids[key] for key in by_key if key in ids]
+
+def sync_entity_tags(connection, entity_type, entity_id, campaign_id, tags):
+    """Make the tag index of one NPC or quest match its ``tags`` string"""
+    connection.execute(delete(entity_tag).where(
+        entity_tag.c.entity_type == entity_type, entity_tag.c.entity_id == entity_id
+    ))
+    names = normalize_tags(tags)
+    if names:
+        connection.execute(insert(entity_tag), [
+            {'tag_id': tag_id, 'entity_type': entity_type, 'entity_id': entity_id}
+            for tag_id in _tag_ids(connection, campaign_id, names)
+        ])
+
+def rebuild_tag_index(connection):
+    """Index the tags of every NPC and quest, e.g. for databases from before the index"""
+    for model, entity_type in ((NPC, 'npc'), (Quest, 'quest')):
+        rows = connection.execute(
+            select(model.id, model.campaign_id, model.tags).where(model.tags.isnot(None), model.tags != '')
+        ).all()
+        for row in rows:
+            sync_entity_tags(connection, entity_type, row.id, row.campaign_id, row.tags)
+
+def _register_tag_index(model, entity_type):
+    # Mapper events run inside the flush, so the index commits or rolls back with the row
+    @event.listens_for(model, 'after_insert')
+    def _index_new_tags(mapper, connection, target):
+        if target.tags:
+            sync_entity_tags(connection, entity_type, target.id, target.campaign_id, target.tags)
+
+    @event.listens_for(model, 'after_update')
+    def _reindex_tags(mapper, connection, target):
+        state = inspect(target)
+        if state.attrs.tags.history.has_changes() or state.attrs.campaign_id.history.has_changes():
+            sync_entity_tags(connection, entity_type, target.id, target.campaign_id, target.tags)
+
+    @event.listens_for(model, 'after_delete')
+    def _unindex_tags(mapper, connection, target):
+        connection.execute(delete(entity_tag).where(
+            entity_tag.c.entity_type == entity_type, entity_tag.c.entity_id == target.id
+        ))
+
+_register_tag_index(NPC, 'npc')
+_register_tag_index(Quest, 'quest')
+
+def find_tag(campaign_id, name):
+    """The campaign's tag with this name in any case, or None"""
+    return Tag.query.filter_by(campaign_id=campaign_id, key=tag_key(name)).first()
+
+def tagged_ids(tag_id, entity_type):
+    """Subquery of the ids of the NPCs or quests carrying a tag"""
+    return select(entity_tag.c.entity_id).where(
+        entity_tag.c.tag_id == tag_id,
+        entity_tag.c.entity_type == entity_type
+    )
+
+def tag_facets(campaign_id, entity_type):
+    """(name, count) of every tag used by the campaign's NPCs or quests, most used first"""
+    count = func.count(entity_tag.c.entity_id)
+    return db.session.query(Tag.name, count).join(entity_tag, entity_tag.c.tag_id == Tag.id).filter(
+        Tag.campaign_id == campaign_id,
+        entity_tag.c.entity_type == entity_type
+    ).group_by(Tag.id, Tag.name).order_by(count.desc(), Tag.name).all()
+
+def rename_tag(campaign_id, old_name, new_name):
+    """
+    Rename a tag on every NPC and quest of a campaign, merging it into an
+    existing tag of the new name
+
+    The index changes with one set-based statement per step; the ``tags``
+    strings of the affected rows are rewritten in one executemany, which also
+    bumps ``updated_at`` so page validators and fragment caches see the edit.
+    The caller commits.
+
+    Returns:
+        int: Number of NPCs and quests whose tags changed, or None if the
+        campaign has no tag ``old_name``
+    """
+    new_name = new_name.strip()[:TAG_MAX_LENGTH]
+    source = find_tag(campaign_id, old_name)
+    if source is None:
+        return None
+    target = find_tag(campaign_id, new_name) if tag_key(new_name) != source.key else None
+
+    links = db.session.execute(
+        select(entity_tag.c.entity_type, entity_tag.c.entity_id).where(entity_tag.c.tag_id == source.id)
+    ).all()
+
+    if target is None:
+        db.session.execute(update(Tag.__table__).where(Tag.__table__.c.id == source.id).values(
+            name=new_name, key=tag_key(new_name)
+        ))
+    else:
+        new_name = target.name
+        merged = entity_tag.alias('merged')
+        db.session.execute(insert(entity_tag).from_select(
+            ['tag_id', 'entity_type', 'entity_id'],
+            select(literal(target.id), entity_tag.c.entity_type, entity_tag.c.entity_id).where(
+                entity_tag.c.tag_id == source.id,
+                ~exists().where(
+                    merged.c.tag_id == target.id,
+                    merged.c.entity_type == entity_tag.c.entity_type,
+                    merged.c.entity_id == entity_tag.c.entity_id,
+                )
+            )
+        ))
+        db.session.execute(delete(entity_tag).where(entity_tag.c.tag_id == source.id))
+        db.session.execute(delete(Tag.__table__).where(Tag.__table__.c.id == source.id))
+
+    # Rewrite the denormalized strings without going through the ORM, whose
+    # update events would re-sync the index that was just changed
+    now = datetime.utcnow()
+    for model, entity_type in ((NPC, 'npc'), (Quest, 'quest')):
+        ids = [entity_id for kind, entity_id in links if kind == entity_type]
+        if not ids:
+            continue
+        table = model.__table__
+        rows = db.session.execute(select(table.c.id, table.c.tags).where(table.c.id.in_(ids))).all()
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id')).values(
+                tags=bindparam('new_tags'), updated_at=bindparam('now')
+            ),
+            [{
+                'row_id': row.id,
+                'new_tags': ', '.join(normalize_tags([
+                    new_name if tag_key(name) == source.key else name for name in normalize_tags(row.tags)
+                ])),
+                'now': now,
+            } for row in rows]
+        )
+    return len(links)
+
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
@@ -304,9 +663,13 @@ class Campaign(db.Model):
     players = db.relationship('User', secondary=player_campaign, 
                              backref=db.backref('player_campaigns', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_campaign_system_created', 'system', 'created_at'),
+    )
+    
     def has_access(self, user):
         """Check if user has access to this campaign"""
-        return user.id == self.dm_id or user in self.players
+        return user.id == self.dm_id or self.id in get_campaign_roles(user.id)
         
     def get_character_for_user(self, user_id):
         """Get the character for a user in this campaign, or None if not found"""
@@ -315,9 +678,117 @@ class Campaign(db.Model):
             campaign_id=self.id
         ).first()
 
+def my_campaigns_clause(user_id):
+    """SQL condition for every campaign the user runs or plays in"""
+    return or_(
+        Campaign.dm_id == user_id,
+        Campaign.id.in_(select(player_campaign.c.campaign_id).where(player_campaign.c.user_id == user_id))
+    )
+
+def _load_campaign_roles(user_id):
+    # One query for every campaign the user runs or plays in; plain columns, so
+    # nothing in the cached map is tied to a session
+    rows = db.session.query(Campaign.id, Campaign.dm_id).filter(my_campaigns_clause(user_id)).all()
+    for campaign_id, dm_id in rows:
+        campaign_dm_ids.set(campaign_id, dm_id)
+    return {campaign_id: 'dm' if dm_id == user_id else 'player' for campaign_id, dm_id in rows}
+
+def get_campaign_roles(user_id):
+    """Read-only map of campaign id -> 'dm' or 'player' for a user, without loading any relationship"""
+    return membership_index.roles(user_id, _load_campaign_roles)
+
+class MyCampaigns:
+    """The current user's campaigns (run or played) with their role in each"""
+    
+    def __init__(self, roles):
+        self.roles = roles
+        self.ids = frozenset(roles)
+        self._campaigns = None
+    
+    @property
+    def campaigns(self):
+        """Campaign objects, loaded at most once per request"""
+        if self._campaigns is None:
+            self._campaigns = Campaign.query.filter(Campaign.id.in_(self.ids)).all() if self.ids else []
+        return self._campaigns
+    
+    def is_dm(self, campaign_id):
+        return self.roles.get(campaign_id) == 'dm'
+
+def get_my_campaigns():
+    """
+    Resolve the current user's campaigns once per request
+    
+    Roles come from the membership index (short-TTL per-user cache); the
+    campaign rows themselves are only loaded if a caller asks for them.
+    """
+    my_campaigns = g.get('my_campaigns')
+    if my_campaigns is None:
+        my_campaigns = g.my_campaigns = MyCampaigns(get_campaign_roles(current_user.id))
+    return my_campaigns
+
+def is_campaign_player(campaign_id, user_id):
+    """Uncached EXISTS check, for writes that must not act on a stale membership"""
+    return db.session.query(
+        select(player_campaign).where(
+            player_campaign.c.campaign_id == campaign_id,
+            player_campaign.c.user_id == user_id
+        ).exists()
+    ).scalar()
+
+def _templates_version():
+    # Same in every worker of a deploy, changes whenever code or templates do
+    root = os.path.dirname(os.path.abspath(__file__))
+    templates = os.path.join(root, 'templates')
+    paths = [os.path.abspath(__file__)] + [os.path.join(templates, name) for name in os.listdir(templates)]
+    return max(os.path.getmtime(path) for path in paths)
+
+PAGE_VERSION = _templates_version()
+
+def page_etag(*parts):
+    """
+    Validator of a rendered page
+    
+    ``parts`` describe the data the page shows (e.g. ids, row counts, max
+    updated_at, viewer role). The viewer fields base.html renders (including
+    the pending-actions badge) and the deployed code version are always
+    included.
+    """
+    viewer = (current_user.id, current_user.username, current_user.full_name, current_user.profile_pic,
+              get_pending_actions_count(current_user.id))
+    return hashlib.sha1(repr((PAGE_VERSION, viewer, parts)).encode()).hexdigest()
+
+def not_modified(etag, last_modified=None):
+    """
+    A 304 response if the browser already has the page version ``etag``, else None
+    
+    Only the ETag decides: it also covers the viewer and deleted rows, which a
+    max(updated_at) date alone would miss. Last-Modified is sent along for
+    information.
+    """
+    if session.get('_flashes') or not request.if_none_match.contains_weak(etag):
+        # Pending flash messages have to be rendered
+        return None
+    response = Response(status=304)
+    _set_validators(response, etag, last_modified)
+    return response
+
+def render_conditional(etag, last_modified, template, **context):
+    """``render_template`` plus the validators ``not_modified`` checks on the next visit"""
+    response = make_response(render_template(template, **context))
+    _set_validators(response, etag, last_modified)
+    return response
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Per-user pages: browsers may keep them but must revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(user_id, lambda: User.query.get(int(user_id)))
 
 @app.route('/')
 @login_required
@@ -327,11 +798,7 @@ def home():
         return redirect(url_for('profile'))
     
     # Get campaigns where user is DM or player
-    dm_campaigns = Campaign.query.filter_by(dm_id=current_user.id).all()
-    player_campaigns = current_user.player_campaigns
-    
-    # Combine and deduplicate campaigns
-    all_campaigns = list({campaign.id: campaign for campaign in dm_campaigns + player_campaigns}.values())
+    all_campaigns = list(get_my_campaigns().campaigns)
     
     # Sort by creation date (newest first)
     all_campaigns.sort(key=lambda x: x.created_at, reverse=True)
@@ -378,7 +845,7 @@ def login():
         
         try:
             # Try to log in with Supabase
-            response = supabase.auth.sign_in_with_password({
+            response = get_supabase_auth().sign_in_with_password({
                 'email': email,
                 'password': password
             })
@@ -399,10 +866,13 @@ def login():
             
             # Log in the user
             login_user(user, remember=remember)
+            token_verifier.remember(response.session)
             
             # Update last login time
             user.last_login = datetime.utcnow()
             db.session.commit()
+            user_cache.invalidate(user.id)
+            invalidate_sender(user.id)
             
             flash('Erfolgreich angemeldet!', 'success')
             next_page = request.args.get('next')
@@ -451,7 +921,7 @@ def register():
                 return redirect(url_for('login'))
             
             # Create user in Supabase
-            response = supabase.auth.sign_up({
+            response = get_supabase_auth().sign_up({
                 'email': email,
                 'password': password,
                 'options': {
@@ -517,11 +987,14 @@ def register():
 def logout():
     try:
         # Sign out from Supabase
-        supabase.auth.sign_out()
+        get_supabase_auth().sign_out()
     except Exception as e:
         print(f"Error during logout: {str(e)}")
     
     # Logout from Flask-Login
+    user_cache.invalidate(current_user.id)
+    invalidate_sender(current_user.id)
+    token_verifier.forget()
     logout_user()
     
     # Clear Flask session
@@ -561,6 +1034,8 @@ def make_admin(username):
             user.is_admin = True
             user.is_approved = True
             db.session.commit()
+            user_cache.invalidate(user.id)
+            invalidate_sender(user.id)
             return f"User {username} is now an admin! <a href='/admin'>Go to Admin Panel</a>"
         return f"User {username} not found!"
     except Exception as e:
@@ -597,6 +1072,7 @@ def create_campaign():
         
         db.session.add(campaign)
         db.session.commit()
+        membership_index.invalidate(current_user.id)
         
         flash('Kampagne erfolgreich erstellt!', 'success')
         return redirect(url_for('home'))
@@ -621,49 +1097,73 @@ COMMON_SYSTEMS = [
 def inject_common_systems():
     return dict(common_systems=COMMON_SYSTEMS)
 
+CAMPAIGN_PAGE_SIZE = 24
+
 @app.route('/campaigns')
 @login_required
 def campaigns():
-    # Get all campaigns where user is DM or player
-    dm_campaigns = Campaign.query.filter_by(dm_id=current_user.id).all()
-    player_campaigns = current_user.player_campaigns
-    
-    # Combine and deduplicate campaigns
-    all_campaigns = list({campaign.id: campaign for campaign in dm_campaigns + player_campaigns}.values())
-    
-    # Get filter parameters
+    """
+    The user's campaigns, newest first, filtered and paginated in SQL
+    
+    Query parameters:
+        q: substring of name or description
+        system: only campaigns of this system
+        before_ts, before_id: created_at and id of the last campaign of the previous page
+    """
     system_filter = request.args.get('system')
     search_query = request.args.get('q', '').strip()
+    before_id = request.args.get('before_id', type=int)
+    before_ts = None
+    if request.args.get('before_ts'):
+        try:
+            before_ts = datetime.fromisoformat(request.args['before_ts'])
+        except ValueError:
+            before_id = None
     
-    # Apply filters
-    if system_filter:
-        all_campaigns = [c for c in all_campaigns if c.system == system_filter]
-    
+    conditions = [my_campaigns_clause(current_user.id)]
     if search_query:
-        search_lower = search_query.lower()
-        all_campaigns = [c for c in all_campaigns 
-                        if search_lower in c.name.lower() 
-                        or (c.description and search_lower in c.description.lower())]
+        like = f'%{search_query}%'
+        conditions.append(or_(Campaign.name.ilike(like), Campaign.description.ilike(like)))
+    
+    # Facets ignore the system filter so every bubble stays visible with its count
+    system_counts = dict(
+        db.session.query(Campaign.system, func.count(Campaign.id))
+        .filter(*conditions)
+        .group_by(Campaign.system)
+        .all()
+    )
+    all_systems = sorted(system_counts)
+    if system_filter:
+        conditions.append(Campaign.system == system_filter)
+        total = system_counts.get(system_filter, 0)
+    else:
+        total = sum(system_counts.values())
     
-    # Get unique systems for filter bubbles
-    all_systems = sorted(list({c.system for c in all_campaigns}))
+    query = Campaign.query.options(db.joinedload(Campaign.dm)).filter(*conditions)
+    if before_ts is not None and before_id is not None:
+        query = query.filter(tuple_(Campaign.created_at, Campaign.id) < tuple_(before_ts, before_id))
+    page = query.order_by(Campaign.created_at.desc(), Campaign.id.desc()).limit(CAMPAIGN_PAGE_SIZE + 1).all()
     
-    # Sort by next session date (for now, using creation date - we'll add session dates later)
-    all_campaigns.sort(key=lambda x: x.created_at, reverse=True)
+    next_cursor = None
+    if len(page) > CAMPAIGN_PAGE_SIZE:
+        page = page[:CAMPAIGN_PAGE_SIZE]
+        next_cursor = {'before_ts': page[-1].created_at.isoformat(), 'before_id': page[-1].id}
     
     return render_template('campaigns.html', 
-                         campaigns=all_campaigns,
+                         campaigns=page,
+                         total=total,
                          systems=all_systems,
+                         system_counts=system_counts,
                          current_system=system_filter,
-                         search_query=search_query)
+                         search_query=search_query,
+                         next_cursor=next_cursor,
+                         is_first_page=before_id is None)
 
 @app.route('/termine')
 @login_required
 def termine():
     # Collect all campaigns where user participates (DM or player)
-    dm_campaigns = Campaign.query.filter_by(dm_id=current_user.id).all()
-    player_campaigns = current_user.player_campaigns
-    campaigns = list({c.id: c for c in dm_campaigns + player_campaigns}.values())
+    campaigns = list(get_my_campaigns().campaigns)
 
     if not campaigns:
         return render_template('termine.html', campaigns=[], sessions=[], polls=[], campaign_names={}, campaign_images={})
@@ -716,51 +1216,180 @@ def termine():
     campaign_images = {c.id: c.image for c in campaigns}
     return render_template('termine.html', campaigns=campaigns, sessions=sessions, polls=polls, campaign_names=campaign_names, campaign_images=campaign_images, resp_map=resp_map)
 
+# Immutable view model of a campaign page, shared by all members of the campaign
+UserView = namedtuple('UserView', 'id username full_name profile_pic')
+CharacterView = namedtuple('CharacterView', 'id user_id character_name race level description image user')
+ResponseView = namedtuple('ResponseView', 'user_id response user')
+SessionView = namedtuple('SessionView', 'id title scheduled_at location notes responses')
+PollOptionView = namedtuple('PollOptionView', 'id scheduled_at location notes votes')
+PollView = namedtuple('PollView', 'id title notes created_at options')
+
+class CampaignView(namedtuple('CampaignView', 'id name description system image created_at dm_id dm players characters')):
+    __slots__ = ()
+    
+    def get_character_for_user(self, user_id):
+        """The user's character in this campaign, or None; no query needed"""
+        return next((c for c in self.characters if c.user_id == user_id), None)
+
+CampaignSnapshot = namedtuple('CampaignSnapshot', 'campaign sessions polls version')
+
+def _user_view(user):
+    return UserView(user.id, user.username, user.full_name, user.profile_pic)
+
+def load_campaign_snapshot(campaign_id):
+    """
+    Everything the campaign page shows, in a fixed number of batched queries
+    
+    Players, characters, upcoming sessions with their responses and open
+    polls with options and votes are loaded eagerly (together with the users
+    they name), then copied into plain tuples. The result holds no ORM state,
+    so it can be cached and shared between requests and threads.
+    
+    Every collection is put in id order, and ``version`` is a hash of the
+    contents. So every worker process derives the same version (and thus
+    the same ETag and fragment cache keys) from the same data.
+    
+    Returns:
+        CampaignSnapshot, or None if the campaign does not exist
+    """
+    campaign = Campaign.query.options(
+        db.joinedload(Campaign.dm),
+        db.selectinload(Campaign.players),
+        db.selectinload(Campaign.characters).joinedload(Character.user),
+    ).filter(Campaign.id == campaign_id).one_or_none()
+    if campaign is None:
+        return None
+    
+    now = datetime.utcnow()
+    sessions = Session.query.options(
+        db.selectinload(Session.responses).joinedload(SessionResponse.user)
+    ).filter(
+        Session.campaign_id == campaign_id,
+        Session.scheduled_at >= now
+    ).order_by(Session.scheduled_at.asc(), Session.id.asc()).all()
+    
+    polls = SessionPoll.query.options(
+        db.selectinload(SessionPoll.options)
+        .selectinload(SessionPollOption.votes)
+        .joinedload(SessionPollVote.user)
+    ).filter_by(campaign_id=campaign_id, is_closed=False).order_by(SessionPoll.id).all()
+    
+    by_id = lambda rows: sorted(rows, key=lambda row: row.id)
+    users = {}
+    def user_view(user):
+        if user.id not in users:
+            users[user.id] = _user_view(user)
+        return users[user.id]
+    
+    characters = tuple(
+        CharacterView(c.id, c.user_id, c.character_name, c.race, c.level, c.description, c.image, user_view(c.user))
+        for c in sorted(campaign.characters, key=lambda c: c.id)
+    )
+    campaign_view = CampaignView(
+        campaign.id, campaign.name, campaign.description, campaign.system, campaign.image,
+        campaign.created_at, campaign.dm_id, user_view(campaign.dm),
+        tuple(user_view(p) for p in by_id(campaign.players)), characters,
+    )
+    session_views = tuple(
+        SessionView(s.id, s.title, s.scheduled_at, s.location, s.notes, tuple(
+            ResponseView(r.user_id, r.response, user_view(r.user)) for r in by_id(s.responses)
+        ))
+        for s in sessions
+    )
+    poll_views = tuple(
+        PollView(p.id, p.title, p.notes, p.created_at, tuple(
+            PollOptionView(o.id, o.scheduled_at, o.location, o.notes, tuple(
+                ResponseView(v.user_id, v.response, user_view(v.user)) for v in by_id(o.votes)
+            ))
+            for o in by_id(p.options)
+        ))
+        for p in polls
+    )
+    version = hashlib.sha1(repr((campaign_view, session_views, poll_views)).encode()).hexdigest()
+    return CampaignSnapshot(campaign=campaign_view, sessions=session_views, polls=poll_views, version=version)
+
+def get_campaign_snapshot(campaign_id):
+    snapshot = campaign_snapshots.get(campaign_id)
+    if snapshot is None:
+        snapshot = load_campaign_snapshot(campaign_id)
+        if snapshot is not None:
+            campaign_snapshots.set(campaign_id, snapshot)
+    return snapshot
+
+def _snapshot_campaign_id(session, obj):
+    # Campaign a changed row shows up in, if it is part of the campaign page
+    if isinstance(obj, Campaign):
+        return obj.id
+    if isinstance(obj, (Character, Session, SessionPoll)):
+        return obj.campaign_id
+    if isinstance(obj, SessionResponse):
+        sess = obj.session or session.get(Session, obj.session_id)
+        return sess.campaign_id if sess else None
+    if isinstance(obj, SessionPollOption):
+        poll = obj.poll or session.get(SessionPoll, obj.poll_id)
+        return poll.campaign_id if poll else None
+    if isinstance(obj, SessionPollVote):
+        option = obj.option or session.get(SessionPollOption, obj.option_id)
+        return _snapshot_campaign_id(session, option) if option else None
+    return None
+
+_SNAPSHOT_USER_FIELDS = ('username', 'full_name', 'profile_pic')
+
+@event.listens_for(SQLASession, 'before_flush')
+def _collect_stale_snapshots(session, flush_context, instances):
+    stale = session.info.setdefault('stale_campaign_snapshots', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _SNAPSHOT_USER_FIELDS):
+                # Names and avatars appear on every page the user is part of
+                stale.add(None)
+            continue
+        campaign_id = _snapshot_campaign_id(session, obj)
+        if campaign_id is not None:
+            stale.add(campaign_id)
+
+@event.listens_for(SQLASession, 'after_commit')
+def _drop_stale_snapshots(session):
+    stale = session.info.pop('stale_campaign_snapshots', ())
+    if None in stale:
+        campaign_snapshots.clear()
+    elif stale:
+        campaign_snapshots.invalidate(*stale)
+
+@event.listens_for(SQLASession, 'after_rollback')
+def _discard_stale_snapshots(session):
+    session.info.pop('stale_campaign_snapshots', None)
+
 @app.route('/campaign/<int:campaign_id>')
 @login_required
 def view_campaign(campaign_id):
-    campaign = Campaign.query.get_or_404(campaign_id)
+    snapshot = get_campaign_snapshot(campaign_id)
+    if snapshot is None:
+        abort(404)
+    campaign = snapshot.campaign
     
     # Check if user has access to this campaign
-    if not campaign.has_access(current_user):
+    if current_user.id != campaign.dm_id and campaign_id not in get_campaign_roles(current_user.id):
         flash('Du hast keine Berechtigung, diese Kampagne anzusehen.', 'danger')
         return redirect(url_for('home'))
-        
-    # Get all characters for this campaign
-    characters = Character.query.filter_by(campaign_id=campaign_id).all()
-    
-    # Get all NPCs for this campaign
-    npcs = NPC.query.filter_by(campaign_id=campaign_id).order_by(NPC.name).all()
-    
-    # Get all quests for this campaign
-    quests = Quest.query.filter_by(campaign_id=campaign_id).order_by(Quest.status, Quest.priority).all()
     
-    # Get all sessions for this campaign (future and past)
+    # The snapshot may be a little older than this request
     now = datetime.utcnow()
-    upcoming_sessions = Session.query.filter(
-        Session.campaign_id == campaign_id,
-        Session.scheduled_at >= now
-    ).order_by(Session.scheduled_at.asc()).all()
+    upcoming_sessions = [s for s in snapshot.sessions if s.scheduled_at >= now]
+    is_dm = (current_user.id == campaign.dm_id)
     
-    past_sessions = Session.query.filter(
-        Session.campaign_id == campaign_id,
-        Session.scheduled_at < now
-    ).order_by(Session.scheduled_at.desc()).limit(5).all()
+    # Everything else on the page derives from the snapshot and the viewer
+    etag = page_etag('campaign', campaign_id, snapshot.version, len(upcoming_sessions), is_dm)
+    response = not_modified(etag)
+    if response is not None:
+        return response
     
-    # Get all polls for this campaign
-    polls = SessionPoll.query.filter_by(campaign_id=campaign_id, is_closed=False).all()
-    
-    # Create resp_map for RSVPs in this campaign
-    resp_map = {}
-    if upcoming_sessions:
-        session_ids = [s.id for s in upcoming_sessions]
-        user_responses = (
-            SessionResponse.query
-            .filter(SessionResponse.session_id.in_(session_ids), 
-                   SessionResponse.user_id == current_user.id)
-            .all()
-        )
-        resp_map = {r.session_id: r.response for r in user_responses}
+    # RSVPs and votes of this user, straight from the snapshot
+    resp_map = {
+        s.id: r.response
+        for s in upcoming_sessions for r in s.responses if r.user_id == current_user.id
+    }
     
     # Count pending actions for this campaign
     pending_actions = 0
@@ -770,29 +1399,22 @@ def view_campaign(campaign_id):
     pending_actions += open_rsvps
     
     # Count open polls for this campaign where user hasn't voted
-    open_polls = SessionPoll.query.filter(
-        SessionPoll.campaign_id == campaign_id,
-        SessionPoll.is_closed == False,
-        ~SessionPoll.options.any(
-            SessionPollOption.votes.any(user_id=current_user.id)
-        )
-    ).count()
+    open_polls = sum(
+        1 for p in snapshot.polls
+        if not any(v.user_id == current_user.id for o in p.options for v in o.votes)
+    )
     pending_actions += open_polls
     
-    is_dm = (current_user.id == campaign.dm_id)
-    
-    return render_template('view_campaign.html', 
+    return render_conditional(etag, None, 'view_campaign.html', 
                          campaign=campaign, 
-                         characters=characters,
-                         npcs=npcs,
-                         quests=quests,
+                         characters=campaign.characters,
                          sessions=upcoming_sessions,
-                         past_sessions=past_sessions,
-                         polls=polls,
+                         polls=snapshot.polls,
                          is_dm=is_dm,
                          now=now,
                          resp_map=resp_map,
-                         pending_actions_count=pending_actions)
+                         pending_actions_count=pending_actions,
+                         snapshot_version=snapshot.version)
 
 @app.route('/campaign/<int:campaign_id>/sessions/new', methods=['GET', 'POST'])
 @login_required
@@ -829,6 +1451,7 @@ def plan_session(campaign_id):
         )
         db.session.add(sess)
         db.session.commit()
+        invalidate_pending_actions(campaign)
         flash('Sitzung wurde geplant.', 'success')
         return redirect(url_for('view_campaign', campaign_id=campaign_id))
 
@@ -857,6 +1480,7 @@ def rsvp_session(campaign_id, session_id):
         resp = SessionResponse(session_id=sess.id, user_id=current_user.id, response=choice)
         db.session.add(resp)
     db.session.commit()
+    pending_actions_cache.invalidate(current_user.id)
     # AJAX support
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # Build updated summary
@@ -917,6 +1541,7 @@ def new_poll(campaign_id):
         for scheduled_at, location, opt_notes in options:
             db.session.add(SessionPollOption(poll_id=poll.id, scheduled_at=scheduled_at, location=location, notes=opt_notes))
         db.session.commit()
+        invalidate_pending_actions(campaign)
         flash('Termin-Umfrage erstellt.', 'success')
         return redirect(url_for('view_campaign', campaign_id=campaign_id))
 
@@ -950,6 +1575,7 @@ def vote_poll_option(campaign_id, poll_id):
         vote = SessionPollVote(option_id=option.id, user_id=current_user.id, response=response)
         db.session.add(vote)
     db.session.commit()
+    pending_actions_cache.invalidate(current_user.id)
     # AJAX support
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # Summarize current votes for this option
@@ -1003,6 +1629,7 @@ def finalize_poll(campaign_id, poll_id):
     # Close the poll
     poll.is_closed = True
     db.session.commit()
+    invalidate_pending_actions(campaign)
     flash('Umfrage abgeschlossen und Sitzung erstellt.', 'success')
     return redirect(url_for('view_campaign', campaign_id=campaign_id, focus=f"session-{sess.id}"))
 
@@ -1029,6 +1656,51 @@ with app.app_context():
         SessionPollVote.__table__.create(bind=db.engine, checkfirst=True)
     except Exception:
         pass
+    # Add the chat history, page validator, campaign list and user search indexes to existing tables
+    for index in (*Message.__table__.indexes, *NPC.__table__.indexes, *Quest.__table__.indexes,
+                  *Campaign.__table__.indexes, *User.__table__.indexes):
+        try:
+            index.create(bind=db.engine, checkfirst=True)
+        except Exception:
+            pass
+    try:
+        ChatSendKey.__table__.create(bind=db.engine, checkfirst=True)
+    except Exception:
+        pass
+    try:
+        MessageArchive.__table__.create(bind=db.engine, checkfirst=True)
+        search_is_new = not inspect(db.engine).has_table('archived_message_text')
+        ArchivedMessageText.__table__.create(bind=db.engine, checkfirst=True)
+        if search_is_new:
+            # Make blocks archived before the search table existed searchable again
+            for block in MessageArchive.query.all():
+                index_archived_messages(block, unpack_messages(block.codec, block.data))
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+    try:
+        ensure_chat_search_index(db.engine)
+    except Exception:
+        pass
+    try:
+        ensure_npc_search_index(db.engine)
+    except Exception:
+        pass
+    try:
+        DiceNotation.__table__.create(bind=db.engine, checkfirst=True)
+        DiceRoll.__table__.create(bind=db.engine, checkfirst=True)
+    except Exception:
+        pass
+    try:
+        Tag.__table__.create(bind=db.engine, checkfirst=True)
+        index_is_new = not inspect(db.engine).has_table('entity_tag')
+        entity_tag.create(bind=db.engine, checkfirst=True)
+        if index_is_new:
+            # Index the tags written before the index existed
+            with db.engine.begin() as conn:
+                rebuild_tag_index(conn)
+    except Exception:
+        pass
 
 @app.route('/campaign/<int:campaign_id>/sessions/<int:session_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1062,6 +1734,7 @@ def edit_session(campaign_id, session_id):
         sess.location = location
         sess.notes = notes
         db.session.commit()
+        invalidate_pending_actions(campaign)
         flash('Sitzung wurde aktualisiert.', 'success')
         return redirect(url_for('view_campaign', campaign_id=campaign_id))
 
@@ -1080,12 +1753,24 @@ def delete_session(campaign_id, session_id):
     sess = Session.query.filter_by(id=session_id, campaign_id=campaign.id).first_or_404()
     db.session.delete(sess)
     db.session.commit()
+    invalidate_pending_actions(campaign)
     flash('Sitzung wurde gelöscht.', 'success')
     return redirect(url_for('view_campaign', campaign_id=campaign_id))
 
 @app.route('/campaign/<int:campaign_id>/quests')
 @login_required
 def quests(campaign_id):
+    role = get_campaign_roles(current_user.id).get(campaign_id)
+    # Rows counted too, so deleting a quest changes the validator
+    count, last_modified = db.session.query(func.count(Quest.id), func.max(Quest.updated_at)).filter(
+        Quest.campaign_id == campaign_id
+    ).one()
+    etag = page_etag('quests', campaign_id, count, last_modified, role)
+    if role:
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+
     campaign = Campaign.query.get_or_404(campaign_id)
     if not campaign.has_access(current_user):
         flash('Du hast keine Berechtigung, diese Kampagne anzusehen.', 'danger')
@@ -1097,8 +1782,14 @@ def quests(campaign_id):
     if status not in ('open', 'done', ''):
         status = 'open'
     main_only = str(request.args.get('main', '')).lower() in ('1','true','on')
+    tag_filter = request.args.get('tag', '').strip()
+
+    # Exact tag filter through the tag index
+    tag = find_tag(campaign.id, tag_filter) if tag_filter else None
 
     query = Quest.query.filter_by(campaign_id=campaign.id)
+    if tag:
+        query = query.filter(Quest.id.in_(tagged_ids(tag.id, 'quest')))
     if q:
         like = f"%{q}%"
         query = query.filter(or_(Quest.title.ilike(like), Quest.description.ilike(like), Quest.tags.ilike(like)))
@@ -1108,9 +1799,13 @@ def quests(campaign_id):
     if main_only:
         query = query.filter_by(is_main=True)
 
-    quests = query.order_by(Quest.is_main.desc(), Quest.priority.desc(), Quest.created_at.desc()).all()
+    if tag_filter and tag is None:
+        quests = []
+    else:
+        quests = query.order_by(Quest.is_main.desc(), Quest.priority.desc(), Quest.created_at.desc()).all()
     is_dm = current_user.id == campaign.dm_id
-    return render_template('quests.html', campaign=campaign, quests=quests, q=q, status=status, main_only=main_only, is_dm=is_dm)
+    return render_conditional(etag, last_modified, 'quests.html', campaign=campaign, quests=quests, q=q, status=status, main_only=main_only, is_dm=is_dm,
+                              tag_filter=tag_filter, tag_facets=tag_facets(campaign.id, 'quest'))
 
 @app.route('/campaign/<int:campaign_id>/quests/new', methods=['GET', 'POST'])
 @login_required
@@ -1158,6 +1853,16 @@ def new_quest(campaign_id):
 @app.route('/campaign/<int:campaign_id>/quests/<int:quest_id>')
 @login_required
 def view_quest(campaign_id, quest_id):
+    role = get_campaign_roles(current_user.id).get(campaign_id)
+    row = db.session.query(Quest.updated_at, Quest.created_by).filter(
+        Quest.id == quest_id, Quest.campaign_id == campaign_id
+    ).first() if role else None
+    if row is not None:
+        viewer_role = role if role == 'dm' else ('owner' if current_user.id == row.created_by else 'player')
+        response = not_modified(page_etag('quest', quest_id, row.updated_at, viewer_role), row.updated_at)
+        if response is not None:
+            return response
+
     campaign = Campaign.query.get_or_404(campaign_id)
     if not campaign.has_access(current_user):
         flash('Du hast keine Berechtigung, diese Kampagne anzusehen.', 'danger')
@@ -1165,7 +1870,9 @@ def view_quest(campaign_id, quest_id):
 
     quest = Quest.query.filter_by(id=quest_id, campaign_id=campaign.id).first_or_404()
     is_dm = current_user.id == campaign.dm_id
-    return render_template('view_quest.html', campaign=campaign, quest=quest, is_dm=is_dm)
+    viewer_role = 'dm' if is_dm else ('owner' if current_user.id == quest.created_by else 'player')
+    etag = page_etag('quest', quest.id, quest.updated_at, viewer_role)
+    return render_conditional(etag, quest.updated_at, 'view_quest.html', campaign=campaign, quest=quest, is_dm=is_dm, viewer_role=viewer_role)
 
 @app.route('/campaign/<int:campaign_id>/quests/<int:quest_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1220,21 +1927,8 @@ def update_quest_tags(campaign_id, quest_id):
         return jsonify({'success': False, 'error': 'Keine Berechtigung'}), 403
 
     data = request.get_json(silent=True) or {}
-    tags = data.get('tags', [])
-    # Support string input too
-    if isinstance(tags, str):
-        parts = [p.strip() for p in tags.split(',') if p.strip()]
-    else:
-        parts = [str(p).strip() for p in (tags or []) if str(p).strip()]
-    # De-duplicate case-insensitively preserving order
-    seen = set()
-    normed = []
-    for p in parts:
-        key = p.lower()
-        if key not in seen:
-            seen.add(key)
-            normed.append(p)
-    quest.tags = ', '.join(normed)
+    # List or comma-separated string; the tag index follows on commit
+    quest.tags = ', '.join(normalize_tags(data.get('tags', [])))
     db.session.commit()
     return jsonify({'success': True, 'tags': quest.tags})
 
@@ -1273,28 +1967,77 @@ def manage_players(campaign_id):
         user_id = request.form.get('user_id')
         if user_id:
             user = User.query.get(user_id)
-            if user and user != current_user:
-                if user in campaign.players:
+            if user and user.id != current_user.id:
+                if is_campaign_player(campaign.id, user.id):
                     flash(f'{user.username} ist bereits ein Spieler in dieser Kampagne.', 'warning')
                 else:
-                    campaign.players.append(user)
+                    db.session.execute(insert(player_campaign).values(user_id=user.id, campaign_id=campaign.id))
                     db.session.commit()
+                    membership_index.invalidate(user.id)
+                    pending_actions_cache.invalidate(user.id)
+                    campaign_snapshots.invalidate(campaign.id)
                     flash(f'{user.username} wurde zur Kampagne hinzugefügt.', 'success')
             else:
                 flash('Benutzer nicht gefunden oder ungültig.', 'danger')
         return redirect(url_for('manage_players', campaign_id=campaign_id))
     
-    # Get all users except the DM
-    all_users = User.query.filter(User.id != campaign.dm_id).all()
-    
     is_dm = True  # by definition in this view
     return render_template(
         'manage_players.html',
         campaign=campaign,
-        all_users=all_users,
         is_dm=is_dm
     )
 
+USER_SEARCH_PAGE_SIZE = 10
+
+def search_invitable_users(campaign, prefix, limit, offset=0):
+    """
+    Users whose username, full name or email starts with ``prefix`` (any case),
+    excluding the campaign's DM and current players, ordered by username
+    """
+    escaped = prefix.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = escaped + '%'
+    return User.query.filter(
+        or_(
+            func.lower(User.username).like(pattern, escape='\\'),
+            func.lower(User.full_name).like(pattern, escape='\\'),
+            func.lower(User.email).like(pattern, escape='\\'),
+        ),
+        User.id != campaign.dm_id,
+        User.id.not_in(select(player_campaign.c.user_id).where(player_campaign.c.campaign_id == campaign.id))
+    ).order_by(func.lower(User.username), User.id).limit(limit).offset(offset).all()
+
+@app.route('/campaign/<int:campaign_id>/players/search')
+@login_required
+def search_players(campaign_id):
+    """
+    Typeahead for inviting players
+    
+    Query parameters:
+        q: prefix of username, full name or email
+        page: 1-based result page (USER_SEARCH_PAGE_SIZE users per page)
+    """
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if current_user.id != campaign.dm_id:
+        abort(403)
+    
+    query = (request.args.get('q') or '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    if not query:
+        return jsonify({'results': [], 'page': page, 'has_more': False})
+    
+    users = search_invitable_users(campaign, query,
+                                   limit=USER_SEARCH_PAGE_SIZE + 1,
+                                   offset=(page - 1) * USER_SEARCH_PAGE_SIZE)
+    has_more = len(users) > USER_SEARCH_PAGE_SIZE
+    results = [{
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.full_name,
+        'profile_pic': user.profile_pic,
+    } for user in users[:USER_SEARCH_PAGE_SIZE]]
+    return jsonify({'results': results, 'page': page, 'has_more': has_more})
+
 @app.route('/campaign/<int:campaign_id>/remove_player/<int:user_id>', methods=['POST'])
 @login_required
 def remove_player(campaign_id, user_id):
@@ -1306,9 +2049,15 @@ def remove_player(campaign_id, user_id):
         return redirect(url_for('home'))
     
     user = User.query.get_or_404(user_id)
-    if user in campaign.players:
-        campaign.players.remove(user)
+    if is_campaign_player(campaign.id, user.id):
+        db.session.execute(delete(player_campaign).where(
+            player_campaign.c.campaign_id == campaign.id,
+            player_campaign.c.user_id == user.id
+        ))
         db.session.commit()
+        membership_index.invalidate(user.id)
+        pending_actions_cache.invalidate(user.id)
+        campaign_snapshots.invalidate(campaign.id)
         flash(f'{user.username} wurde aus der Kampagne entfernt.', 'success')
     
     return redirect(url_for('manage_players', campaign_id=campaign_id))
@@ -1393,6 +2142,9 @@ def manage_character(campaign_id):
                 character.image = image_filename
         
         db.session.commit()
+        # Buffered chat messages carry the character's name and avatar
+        sender_profiles.invalidate(campaign.id)
+        chat_cache.invalidate(campaign.id)
         flash('Charakter erfolgreich gespeichert!', 'success')
         return redirect(url_for('view_campaign', campaign_id=campaign_id))
     
@@ -1405,50 +2157,406 @@ def character_image(filename):
     return send_from_directory(app.config['CHARACTER_IMAGES'], filename)
 
 # Chat routes
+CHAT_PAGE_SIZE = 50
+# Seconds between keep-alive frames on an idle stream; also how often a stream
+# re-checks the database for messages committed by other worker processes
+CHAT_STREAM_HEARTBEAT = 15
+# Streams are closed after this many seconds; EventSource reconnects on its own
+# and resumes from Last-Event-ID, which keeps worker threads from being pinned forever
+CHAT_STREAM_MAX_DURATION = 300
+CHAT_LONG_POLL_TIMEOUT = 25
+# Seconds a client told to back off (all stream and long-poll slots taken) waits before trying again
+CHAT_STREAM_RETRY_AFTER = 30
+CHAT_HISTORY_MAX_PAGE = 200
+CHAT_MESSAGE_MAX_LENGTH = 2000
+CHAT_SEARCH_PAGE_SIZE = 20
+CHAT_ARCHIVE_BLOCK_SIZE = 500
+# Seconds a send request waits for its batch to be committed
+CHAT_WRITE_TIMEOUT = 10
+CHAT_CLIENT_ID_MAX_LENGTH = 64
+# Idempotency keys only need to outlive the client's retries; `flask compact-chat` drops older ones
+CHAT_SEND_KEY_TTL = timedelta(days=1)
+
 @app.route('/campaign/<int:campaign_id>/chat/messages')
 @login_required
 def get_chat_messages(campaign_id):
+    """
+    Return chat messages for a campaign as JSON (oldest first)
+    
+    Query parameters:
+        since_id: only messages newer than this id (incremental refresh)
+        before_id: only messages older than this id (loading history)
+    
+    Without a cursor the latest CHAT_PAGE_SIZE messages are returned. The
+    response carries an ETag derived from the newest message id, and requests
+    whose If-None-Match still matches get an empty 304.
+    
+    Access, the DM id and the newest id all come from in-process caches, so
+    a request the ring buffer can answer runs no query at all.
+    """
+    dm_id = get_chat_dm_id(campaign_id)
+    
     try:
-        # Get the campaign and verify access
+        # The newest id drives the ETag and tells us whether the ring buffer is current
+        newest_id = get_newest_chat_id(campaign_id)
+        etag = f"chat-{campaign_id}-{newest_id}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            since_id = request.args.get('since_id', type=int)
+            before_id = request.args.get('before_id', type=int)
+            
+            sync_chat_cache(campaign_id, dm_id, newest_id)
+            if since_id is not None:
+                messages_data = get_chat_messages_after(campaign_id, dm_id, since_id)
+            else:
+                messages_data = get_chat_messages_before(campaign_id, dm_id, before_id)
+            response = jsonify(messages_data)
+        
+        response.set_etag(etag)
+        # Let the browser keep the copy but revalidate it on every poll
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        print(f"Error in get_chat_messages for campaign {campaign_id}:")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def get_sender_profiles(campaign_id, dm_id, messages):
+    """
+    Resolve sender name, DM flag and avatar for every sender in ``messages``
+    
+    Profiles are keyed by (user_id, character_id) and cached per campaign, so
+    a page of messages costs at most one users query and one characters query
+    instead of two lazy loads per message.
+    """
+    keys = {(msg.user_id, msg.character_id) for msg in messages}
+    profiles, missing = sender_profiles.lookup(campaign_id, keys)
+    if not missing:
+        return profiles
+    
+    user_ids = {user_id for user_id, _ in missing}
+    character_ids = {character_id for _, character_id in missing if character_id}
+    usernames = dict(
+        db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+    )
+    characters = {}
+    if character_ids:
+        characters = {
+            row.id: row for row in
+            db.session.query(Character.id, Character.character_name, Character.image)
+                      .filter(Character.id.in_(character_ids))
+                      .all()
+        }
+    
+    loaded = {}
+    for user_id, character_id in missing:
+        is_dm = user_id == dm_id
+        character = characters.get(character_id)
+        loaded[(user_id, character_id)] = {
+            'sender_name': "DM" if is_dm else (character.character_name if character else usernames.get(user_id)),
+            'is_dm': is_dm,
+            'character_image': get_character_image_url(character, is_dm)
+        }
+    sender_profiles.update(campaign_id, loaded)
+    profiles.update(loaded)
+    return profiles
+
+def serialize_chat_messages(campaign_id, dm_id, messages):
+    """Convert Messages into the JSON shape the chat client renders"""
+    profiles = get_sender_profiles(campaign_id, dm_id, messages)
+    messages_data = []
+    for msg in messages:
+        message_data = {
+            'id': msg.id,
+            'content': msg.content,
+            'timestamp': msg.timestamp.isoformat(),
+        }
+        message_data.update(profiles[(msg.user_id, msg.character_id)])
+        messages_data.append(message_data)
+    return messages_data
+
+def get_newest_message_id(campaign_id):
+    """Id of the campaign's newest message (0 if there is none)"""
+    return db.session.query(func.max(Message.id))\
+                     .filter(Message.campaign_id == campaign_id)\
+                     .scalar() or 0
+
+def get_newest_chat_id(campaign_id):
+    """
+    Newest message id for the read path
+    
+    Messages committed in this process are known to the broker right away;
+    the database is only asked (for other workers' messages) once per
+    CHAT_NEWEST_ID_CACHE_TTL seconds and campaign.
+    """
+    newest_id = chat_newest_ids.get(campaign_id)
+    if newest_id is None:
+        newest_id = get_newest_message_id(campaign_id)
+        chat_newest_ids.set(campaign_id, newest_id)
+    return max(newest_id, chat_broker.latest(campaign_id))
+
+def get_chat_dm_id(campaign_id):
+    """
+    DM id of a campaign whose chat the current user may read; 404/403 otherwise
+    
+    Members are answered from the membership index and the cached DM ids.
+    Anyone else (and a cold DM id cache) falls back to loading the campaign.
+    """
+    role = get_campaign_roles(current_user.id).get(campaign_id)
+    if role == 'dm':
+        return current_user.id
+    dm_id = campaign_dm_ids.get(campaign_id) if role else None
+    if dm_id is None:
         campaign = Campaign.query.get_or_404(campaign_id)
         if not campaign.has_access(current_user):
             print(f"Access denied: User {current_user.id} doesn't have access to campaign {campaign_id}")
             abort(403)
+        dm_id = campaign.dm_id
+        campaign_dm_ids.set(campaign_id, dm_id)
+    return dm_id
+
+def sync_chat_cache(campaign_id, dm_id, newest_id):
+    """Make sure the campaign's ring buffer is loaded and reaches ``newest_id``"""
+    last_id = chat_cache.last_id(campaign_id)
+    if last_id is None:
+        messages = Message.query.filter(Message.campaign_id == campaign_id)\
+                                .order_by(Message.id.desc())\
+                                .limit(chat_cache.per_campaign)\
+                                .all()
+        chat_cache.prime(campaign_id,
+                         serialize_chat_messages(campaign_id, dm_id, messages[::-1]),
+                         complete=len(messages) < chat_cache.per_campaign)
+    elif last_id < newest_id:
+        # Written by another worker process (or before this one started)
+        messages = Message.query.filter(Message.campaign_id == campaign_id, Message.id > last_id)\
+                                .order_by(Message.id.asc())\
+                                .all()
+        chat_cache.extend(campaign_id, serialize_chat_messages(campaign_id, dm_id, messages))
+
+def get_chat_messages_after(campaign_id, dm_id, after_id, limit=CHAT_PAGE_SIZE):
+    """Serialized messages newer than ``after_id``, oldest first"""
+    cached = chat_cache.get_after(campaign_id, after_id, limit)
+    if cached is not None:
+        return cached
+    messages = Message.query.filter(Message.campaign_id == campaign_id, Message.id > after_id)\
+                            .order_by(Message.id.asc())\
+                            .limit(limit)\
+                            .all()
+    return serialize_chat_messages(campaign_id, dm_id, messages)
+
+def get_chat_messages_before(campaign_id, dm_id, before_id=None, limit=CHAT_PAGE_SIZE):
+    """Serialized messages older than ``before_id`` (or the newest ones), oldest first"""
+    if before_id is None:
+        cached = chat_cache.get_latest(campaign_id, limit)
+    else:
+        cached = chat_cache.get_before(campaign_id, before_id, limit)
+    if cached is not None:
+        return cached
+    query = Message.query.filter(Message.campaign_id == campaign_id)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    messages = query.order_by(Message.id.desc()).limit(limit).all()
+    return serialize_chat_messages(campaign_id, dm_id, messages[::-1])
+
+def get_chat_history_page(campaign_id, dm_id, before_ts, before_id, limit=CHAT_PAGE_SIZE):
+    """
+    One page of chat history older than the (timestamp, id) cursor, oldest first
+    
+    Uses keyset pagination on (campaign_id, timestamp, id), so every page is a
+    short index range scan no matter how deep into the history it is.
+    
+    Returns:
+        tuple: (serialized messages, whether older messages exist)
+    """
+    query = Message.query.filter(Message.campaign_id == campaign_id)
+    if before_ts is not None and before_id is not None:
+        query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(before_ts, before_id))
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc())\
+                    .limit(limit + 1)\
+                    .all()
+    if len(messages) <= limit:
+        # Ran past the hot table; continue in the compressed archive
+        if messages:
+            before_ts, before_id = messages[-1].timestamp, messages[-1].id
+        messages += get_archived_chat_messages(campaign_id, before_ts, before_id, limit + 1 - len(messages))
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return serialize_chat_messages(campaign_id, dm_id, messages[::-1]), has_more
+
+def get_archived_chat_messages(campaign_id, before_ts, before_id, limit):
+    """
+    Archived messages older than the (timestamp, id) cursor, newest first
+    
+    Walks archive blocks backwards and only decompresses the blocks needed to
+    fill ``limit`` messages.
+    """
+    cursor = (before_ts, before_id) if before_ts is not None and before_id is not None else None
+    messages = []
+    while len(messages) < limit:
+        query = MessageArchive.query.filter(MessageArchive.campaign_id == campaign_id)
+        if cursor is not None:
+            query = query.filter(tuple_(MessageArchive.first_timestamp, MessageArchive.first_message_id) < tuple_(*cursor))
+        block = query.order_by(MessageArchive.last_timestamp.desc(), MessageArchive.last_message_id.desc()).first()
+        if block is None:
+            break
         
-        print(f"Fetching messages for campaign {campaign_id}")
-        
-        # Get last 50 messages for this campaign only
-        messages = Message.query.filter_by(campaign_id=campaign_id)\
-                              .order_by(Message.timestamp.desc())\
-                              .limit(50)\
-                              .all()
-        
-        print(f"Found {len(messages)} messages for campaign {campaign_id}")
-        
-        # Convert messages to dict for JSON response
-        messages_data = []
-        for msg in reversed(messages):  # Oldest first
-            is_dm = msg.user_id == campaign.dm_id
-            sender_name = "DM" if is_dm else (msg.character.character_name if msg.character and hasattr(msg.character, 'character_name') else msg.user.username)
+        rows = [
+            ArchivedMessage(
+                id=row['id'],
+                content=row['content'],
+                timestamp=datetime.fromisoformat(row['timestamp']),
+                user_id=row['user_id'],
+                character_id=row['character_id']
+            )
+            for row in unpack_messages(block.codec, block.data)
+        ]
+        if cursor is not None:
+            rows = [msg for msg in rows if (msg.timestamp, msg.id) < cursor]
+        messages.extend(reversed(rows))
+        cursor = (block.first_timestamp, block.first_message_id)
+    return messages[:limit]
+
+def index_archived_messages(block, rows):
+    """Keep the text of an archive block's messages in the chat search index"""
+    if block.id is None:
+        db.session.flush()
+    db.session.execute(insert(ArchivedMessageText), [{
+        'id': row['id'],
+        'campaign_id': block.campaign_id,
+        'archive_id': block.id,
+        'content': row['content'],
+    } for row in rows])
+
+def get_archived_messages_by_id(campaign_id, message_ids):
+    """Archived messages with the given ids, unpacking only the blocks that hold them"""
+    if not message_ids:
+        return {}
+    archive_ids = {
+        archive_id for (archive_id,) in
+        db.session.query(ArchivedMessageText.archive_id).filter(
+            ArchivedMessageText.campaign_id == campaign_id,
+            ArchivedMessageText.id.in_(message_ids)
+        ).distinct()
+    }
+    if not archive_ids:
+        return {}
+    wanted = set(message_ids)
+    messages = {}
+    for block in MessageArchive.query.filter(MessageArchive.id.in_(archive_ids)).all():
+        for row in unpack_messages(block.codec, block.data):
+            if row['id'] in wanted:
+                messages[row['id']] = ArchivedMessage(
+                    id=row['id'],
+                    content=row['content'],
+                    timestamp=datetime.fromisoformat(row['timestamp']),
+                    user_id=row['user_id'],
+                    character_id=row['character_id']
+                )
+    return messages
+
+def compact_chat_messages(older_than_days, block_size=CHAT_ARCHIVE_BLOCK_SIZE):
+    """
+    Move chat messages older than ``older_than_days`` into compressed archive blocks
+    
+    Messages are archived per campaign, oldest first, ``block_size`` at a time.
+    Each block is written and its messages deleted in the same transaction.
+    Expired send idempotency keys are dropped first.
+    
+    Returns:
+        int: Number of archived messages
+    """
+    ChatSendKey.query.filter(ChatSendKey.created_at < datetime.utcnow() - CHAT_SEND_KEY_TTL)\
+                     .delete(synchronize_session=False)
+    db.session.commit()
+    
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    campaign_ids = [
+        campaign_id for (campaign_id,) in
+        db.session.query(Message.campaign_id).filter(Message.timestamp < cutoff).distinct().all()
+    ]
+    
+    archived = 0
+    for campaign_id in campaign_ids:
+        while True:
+            messages = Message.query.filter(Message.campaign_id == campaign_id, Message.timestamp < cutoff)\
+                                    .order_by(Message.timestamp.asc(), Message.id.asc())\
+                                    .limit(block_size)\
+                                    .all()
+            if not messages:
+                break
             
-            message_data = {
+            rows = [{
                 'id': msg.id,
                 'content': msg.content,
                 'timestamp': msg.timestamp.isoformat(),
-                'sender_name': sender_name,
-                'is_dm': is_dm,
-                'character_image': get_character_image_url(msg.character, is_dm)
-            }
-            messages_data.append(message_data)
-        
-        print(f"Returning {len(messages_data)} messages for campaign {campaign_id}")
-        return jsonify(messages_data)
-        
-    except Exception as e:
-        print(f"Error in get_chat_messages for campaign {campaign_id}:")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e), 'success': False}), 500
+                'user_id': msg.user_id,
+                'character_id': msg.character_id,
+            } for msg in messages]
+            block = MessageArchive(
+                campaign_id=campaign_id,
+                first_timestamp=messages[0].timestamp,
+                first_message_id=messages[0].id,
+                last_timestamp=messages[-1].timestamp,
+                last_message_id=messages[-1].id,
+                message_count=len(messages),
+                codec=DEFAULT_CODEC,
+                data=pack_messages(rows)
+            )
+            db.session.add(block)
+            index_archived_messages(block, rows)
+            Message.query.filter(Message.id.in_([msg.id for msg in messages]))\
+                         .delete(synchronize_session=False)
+            db.session.commit()
+            archived += len(messages)
+    return archived
+
+@app.cli.command('compact-chat')
+@click.option('--days', type=int, default=None, help='Archive messages older than this many days')
+def compact_chat_command(days):
+    """Move old chat messages into compressed archive blocks"""
+    if days is None:
+        days = app.config.get('CHAT_ARCHIVE_AFTER_DAYS', 90)
+    archived = compact_chat_messages(days)
+    click.echo(f"Archived {archived} chat messages older than {days} days")
+
+def wait_for_chat_messages(campaign_id, dm_id, after_id, timeout):
+    """
+    Block until messages newer than ``after_id`` exist or ``timeout`` expires
+    
+    Returns the new messages (possibly none). The database is only consulted
+    when this process was told about a new message, or once per timeout to
+    catch messages committed by other worker processes.
+    """
+    newest_id = chat_broker.wait(campaign_id, after_id, timeout)
+    try:
+        if newest_id <= after_id:
+            newest_id = get_newest_chat_id(campaign_id)
+        if newest_id <= after_id:
+            return []
+        sync_chat_cache(campaign_id, dm_id, newest_id)
+        return get_chat_messages_after(campaign_id, dm_id, after_id)
+    finally:
+        # Don't hold a pooled connection while the caller goes back to sleep
+        db.session.remove()
+
+def chat_access_revoked(campaign_id, dm_id, user_id):
+    """Uncached re-check for open streams, so removed players stop receiving messages"""
+    if user_id == dm_id:
+        return False
+    try:
+        return not is_campaign_player(campaign_id, user_id)
+    finally:
+        db.session.remove()
+
+def chat_streams_busy(fallback=None):
+    """503 for a reader that got no slot; ``fallback`` names the endpoint to use instead"""
+    response = jsonify({'success': False, 'error': 'Zu viele offene Chat-Verbindungen', 'fallback': fallback})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(CHAT_STREAM_RETRY_AFTER)
+    return response
 
 def get_character_image_url(character, is_dm):
     """Helper function to get the appropriate image URL for a character"""
@@ -1470,60 +2578,317 @@ def log_error(message, error=None):
         import traceback
         traceback.print_exc()
 
+# Transaction-level advisory locks of the append-only logs (see lock_id_order)
+CHAT_WRITE_LOCK = 4470001
+DICE_LOG_WRITE_LOCK = 4470002
+
+def lock_id_order(lock_id):
+    """
+    Serialize a log's write transactions so its ids become visible in id order
+    
+    Readers resume from the last id they saw (since_id, the chat ring buffer,
+    dice statistics). With two workers inserting at once, a transaction holding
+    lower ids could commit after one holding higher ids, and its rows would be
+    skipped for good. Holding a Postgres advisory lock from before the insert
+    until the commit rules that out. SQLite already serializes writers.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(select(func.pg_advisory_xact_lock(lock_id)))
+
+def insert_chat_messages(rows):
+    """
+    Insert a batch of chat messages in a single transaction
+    
+    Called by the chat write batcher. Returns the new ids in the order of
+    ``rows`` and wakes up streaming readers once the batch is committed.
+    Batches of all workers commit in id order, so id cursors never skip rows.
+    
+    Rows may carry a ``client_id`` chosen by the browser. A row whose key was
+    already used by the same user in the campaign (a retried send, or a double
+    submit within the batch) is not inserted again; it gets the id of the
+    message stored the first time.
+    """
+    keys = [(row['campaign_id'], row['user_id'], row['client_id']) if row.get('client_id') else None
+            for row in rows]
+    try:
+        lock_id_order(CHAT_WRITE_LOCK)
+        known = {}
+        wanted = {key for key in keys if key is not None}
+        if wanted:
+            known = {
+                (key.campaign_id, key.user_id, key.client_id): key.message_id
+                for key in ChatSendKey.query.filter(
+                    tuple_(ChatSendKey.campaign_id, ChatSendKey.user_id, ChatSendKey.client_id).in_(wanted)
+                )
+            }
+        
+        # Positions of the rows to insert; keyed ones only the first time the key shows up
+        positions = []
+        first = {}
+        for position, key in enumerate(keys):
+            if key is None or (key not in known and key not in first):
+                if key is not None:
+                    first[key] = len(positions)
+                positions.append(position)
+        
+        values = [{column: value for column, value in rows[position].items() if column != 'client_id'}
+                  for position in positions]
+        new_ids = db.session.scalars(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            values
+        ).all() if values else []
+        if first:
+            now = datetime.utcnow()
+            db.session.execute(insert(ChatSendKey), [{
+                'campaign_id': campaign_id,
+                'user_id': user_id,
+                'client_id': client_id,
+                'message_id': new_ids[index],
+                'created_at': now,
+            } for (campaign_id, user_id, client_id), index in first.items()])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+    
+    inserted = dict(zip(positions, new_ids))
+    for position, message_id in inserted.items():
+        chat_broker.notify(rows[position]['campaign_id'], message_id)
+    ids = []
+    for position, key in enumerate(keys):
+        if position in inserted:
+            ids.append(inserted[position])
+        elif key in known:
+            ids.append(known[key])
+        else:
+            ids.append(new_ids[first[key]])
+    return ids
+
+def get_chat_message(campaign_id, dm_id, message_id):
+    """A single serialized message, from the ring buffer when possible"""
+    for message_data in chat_cache.get_after(campaign_id, message_id - 1, 1) or []:
+        if message_data['id'] == message_id:
+            return message_data
+    msg = Message.query.get(message_id)
+    return serialize_chat_messages(campaign_id, dm_id, [msg])[0]
+
 @app.route('/campaign/<int:campaign_id>/chat/send', methods=['POST'])
 @login_required
 def send_chat_message(campaign_id):
-    print("\n=== SEND MESSAGE REQUEST ===")
-    print(f"User: {current_user.id} ({current_user.username})")
-    print(f"Campaign ID: {campaign_id}")
-    print(f"Request form data: {request.form}")
+    """
+    Store a new chat message and return it serialized
+    
+    Form fields:
+        content: message text
+        client_id: optional idempotency key; resending with the same key
+            returns the message stored the first time instead of a duplicate
+    
+    Answers 202 if the write is still queued after CHAT_WRITE_TIMEOUT; the
+    message then shows up through the live feed once it is committed.
+    """
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if not campaign.has_access(current_user):
+        abort(403)
     
+    content = (request.form.get('content') or '').strip()
+    if not content:
+        return jsonify({'success': False, 'error': 'Die Nachricht darf nicht leer sein.'}), 400
+    if len(content) > CHAT_MESSAGE_MAX_LENGTH:
+        return jsonify({'success': False, 'error': f'Die Nachricht darf höchstens {CHAT_MESSAGE_MAX_LENGTH} Zeichen lang sein.'}), 400
+    client_id = request.form.get('client_id') or None
+    if client_id is not None and len(client_id) > CHAT_CLIENT_ID_MAX_LENGTH:
+        return jsonify({'success': False, 'error': 'Ungültige Nachrichten-ID'}), 400
+    
+    dm_id = campaign.dm_id
+    character = None if current_user.id == dm_id else campaign.get_character_for_user(current_user.id)
+    row = {
+        'content': content,
+        'timestamp': datetime.utcnow(),
+        'campaign_id': campaign.id,
+        'user_id': current_user.id,
+        'character_id': character.id if character else None,
+        'client_id': client_id,
+    }
+    # The insert happens on the writer thread; don't keep a connection checked out meanwhile
+    db.session.remove()
+    
+    future = chat_writer.submit(row)
     try:
-        
-        campaign = Campaign.query.get_or_404(campaign_id)
-        if not campaign.has_access(current_user):
-            print("Access denied: User doesn't have access to this campaign")
-            abort(403)
-        
-        print(f"Fetching messages for campaign {campaign_id}")
-        
-        # Get last 50 messages for this campaign only
-        messages = Message.query.filter_by(campaign_id=campaign_id)\
-                              .order_by(Message.timestamp.desc())\
-                              .limit(50)\
-                              .all()
-        
-        print(f"Found {len(messages)} messages for campaign {campaign_id}")
-        
-        # Convert messages to dict for JSON response
-        messages_data = []
-        for msg in reversed(messages):  # Oldest first
-            is_dm = msg.user_id == campaign.dm_id
-            sender_name = "DM" if is_dm else (msg.character.character_name if msg.character and hasattr(msg.character, 'character_name') else msg.user.username)
-            
-            message_data = {
-                'id': msg.id,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat(),
-                'sender_name': sender_name,
-                'is_dm': is_dm,
-                'character_image': get_character_image_url(msg.character, is_dm)
-            }
-            messages_data.append(message_data)
-        
-        print(f"Returning {len(messages_data)} messages for campaign {campaign_id}")
-        return jsonify(messages_data)
-        
+        message_id = future.result(timeout=CHAT_WRITE_TIMEOUT)
+    except TimeoutError:
+        # Still queued or committing; it may well be stored, so don't report a failure
+        return jsonify({'success': True, 'pending': True, 'client_id': client_id}), 202
     except Exception as e:
-        print(f"Error in send_chat_message for campaign {campaign_id}:")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e), 'success': False}), 500
+        log_error(f"Could not send message to campaign {campaign_id}", e)
+        return jsonify({'success': False, 'error': 'Die Nachricht konnte nicht gesendet werden.'}), 500
+    
+    try:
+        sync_chat_cache(campaign_id, dm_id, message_id)
+        message_data = get_chat_message(campaign_id, dm_id, message_id)
+    except Exception as e:
+        # The message is committed; the live feed will deliver it
+        log_error(f"Could not load sent message {message_id} of campaign {campaign_id}", e)
+        return jsonify({'success': True, 'pending': True, 'client_id': client_id}), 202
+    
+    return jsonify({'success': True, 'message': message_data}), 201
+
+def _parse_message_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+@app.route('/campaign/<int:campaign_id>/chat/stream')
+@login_required
+def chat_stream(campaign_id):
+    """Server-Sent Events stream that pushes new chat messages as they are committed"""
+    dm_id = get_chat_dm_id(campaign_id)
+    user_id = current_user.id
+    last_id = _parse_message_id(request.headers.get('Last-Event-ID') or request.args.get('since_id'))
+    # Release the connection before we start sleeping on the broker
+    db.session.remove()
+    if not chat_broker.acquire_reader():
+        return chat_streams_busy(fallback='poll')
+    
+    def generate():
+        nonlocal last_id
+        # Tell the browser how long to wait before reconnecting after we close
+        yield 'retry: 3000\n\n'
+        started = checked = time.monotonic()
+        while time.monotonic() - started < CHAT_STREAM_MAX_DURATION:
+            messages = wait_for_chat_messages(campaign_id, dm_id, last_id, CHAT_STREAM_HEARTBEAT)
+            # Re-check the membership once per heartbeat, not on every message
+            if time.monotonic() - checked >= CHAT_STREAM_HEARTBEAT:
+                checked = time.monotonic()
+                if chat_access_revoked(campaign_id, dm_id, user_id):
+                    yield format_sse('', event='revoked')
+                    return
+            if not messages:
+                yield ': keep-alive\n\n'
+                continue
+            for message_data in messages:
+                last_id = message_data['id']
+                yield format_sse(json.dumps(message_data), event_id=last_id)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # Runs when the server is done with the response, even if the generator never started
+    response.call_on_close(chat_broker.release_reader)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/campaign/<int:campaign_id>/chat/history')
+@login_required
+def chat_history(campaign_id):
+    """
+    Older chat messages for infinite scroll
+    
+    Query parameters:
+        before_ts: ISO timestamp of the oldest message the client has
+        before_id: id of that message (both or neither must be given)
+        limit: page size (capped at CHAT_HISTORY_MAX_PAGE)
+    """
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if not campaign.has_access(current_user):
+        abort(403)
+    
+    before_id = request.args.get('before_id', type=int)
+    if request.args.get('before_id') and before_id is None:
+        return jsonify({'success': False, 'error': 'Ungültige Nachrichten-ID'}), 400
+    before_ts = None
+    if request.args.get('before_ts'):
+        try:
+            before_ts = datetime.fromisoformat(request.args['before_ts'])
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Ungültiger Zeitstempel'}), 400
+    # The cursor is the (timestamp, id) pair; half of it would silently restart at the newest page
+    if (before_ts is None) != (before_id is None):
+        return jsonify({'success': False, 'error': 'before_ts und before_id müssen zusammen angegeben werden'}), 400
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), CHAT_HISTORY_MAX_PAGE)
+    
+    messages_data, has_more = get_chat_history_page(campaign_id, campaign.dm_id, before_ts, before_id, limit)
+    return jsonify({'messages': messages_data, 'has_more': has_more})
+
+@app.route('/campaign/<int:campaign_id>/chat/search')
+@login_required
+def chat_search(campaign_id):
+    """
+    Full-text search over a campaign's chat history
+    
+    Query parameters:
+        q: search text
+        page: 1-based result page (CHAT_SEARCH_PAGE_SIZE hits per page)
+    """
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if not campaign.has_access(current_user):
+        abort(403)
+    
+    query = (request.args.get('q') or '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    if not query:
+        return jsonify({'results': [], 'page': page, 'has_more': False})
+    
+    hits = search_chat_messages(db.session, campaign_id, query,
+                                limit=CHAT_SEARCH_PAGE_SIZE + 1,
+                                offset=(page - 1) * CHAT_SEARCH_PAGE_SIZE)
+    has_more = len(hits) > CHAT_SEARCH_PAGE_SIZE
+    hits = hits[:CHAT_SEARCH_PAGE_SIZE]
+    
+    hit_ids = [hit[0] for hit in hits]
+    messages = {msg.id: msg for msg in Message.query.filter(Message.id.in_(hit_ids)).all()}
+    # Hits from the search-only text of archived messages
+    messages.update(get_archived_messages_by_id(
+        campaign_id, [message_id for message_id in hit_ids if message_id not in messages]))
+    ordered = [messages[message_id] for message_id, _, _ in hits if message_id in messages]
+    messages_data = {m['id']: m for m in serialize_chat_messages(campaign_id, campaign.dm_id, ordered)}
+    
+    results = []
+    for message_id, rank, highlight in hits:
+        if message_id in messages_data:
+            result = dict(messages_data[message_id], rank=rank, highlight=highlight)
+            results.append(result)
+    return jsonify({'results': results, 'page': page, 'has_more': has_more})
+
+@app.route('/campaign/<int:campaign_id>/chat/poll')
+@login_required
+def chat_long_poll(campaign_id):
+    """Long-polling fallback for clients without EventSource support or a free stream slot"""
+    dm_id = get_chat_dm_id(campaign_id)
+    user_id = current_user.id
+    since_id = _parse_message_id(request.args.get('since_id'))
+    db.session.remove()
+    if not chat_broker.acquire_reader(long_poll=True):
+        return chat_streams_busy()
+    
+    try:
+        messages = wait_for_chat_messages(campaign_id, dm_id, since_id, CHAT_LONG_POLL_TIMEOUT)
+    finally:
+        chat_broker.release_reader(long_poll=True)
+    # The membership may have changed while we were waiting
+    if chat_access_revoked(campaign_id, dm_id, user_id):
+        abort(403)
+    return jsonify(messages)
 
 # NPC Management Routes
+NPC_PAGE_SIZE = 48
+
 @app.route('/campaign/<int:campaign_id>/npcs')
 @login_required
 def npcs(campaign_id):
+    role = get_campaign_roles(current_user.id).get(campaign_id)
+    # Rows counted too, so deleting an NPC changes the validator
+    count, last_modified = db.session.query(func.count(NPC.id), func.max(NPC.updated_at)).filter(
+        NPC.campaign_id == campaign_id
+    ).one()
+    etag = page_etag('npcs', campaign_id, count, last_modified, role)
+    if role:
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+    
     campaign = Campaign.query.get_or_404(campaign_id)
     
     # Check if user has access to this campaign (DM or player)
@@ -1532,50 +2897,65 @@ def npcs(campaign_id):
         return redirect(url_for('campaigns'))
     
     # Get search query
-    search_query = request.args.get('search', '')
+    search_query = request.args.get('search', '').strip()
     # Important toggle
     important_param = request.args.get('important')
     important_only = str(important_param).lower() in ('1', 'true', 'on')
+    page = max(request.args.get('page', 1, type=int), 1)
+    offset = (page - 1) * NPC_PAGE_SIZE
+    # Exact tag filter through the tag index
+    tag_filter = request.args.get('tag', '').strip()
+    tag = find_tag(campaign_id, tag_filter) if tag_filter else None
+    
+    if tag_filter and tag is None:
+        npcs = []
+    elif search_query:
+        # Ranked hits from the search index, best match first
+        hits = search_npcs(db.session, campaign_id, search_query,
+                           limit=NPC_PAGE_SIZE + 1, offset=offset,
+                           important_only=important_only,
+                           tag_id=tag.id if tag else None)
+        by_id = {npc.id: npc for npc in NPC.query.filter(NPC.id.in_([npc_id for npc_id, _ in hits])).all()}
+        npcs = [by_id[npc_id] for npc_id, _ in hits if npc_id in by_id]
+    else:
+        npcs_query = NPC.query.filter_by(campaign_id=campaign_id)
+        if important_only:
+            npcs_query = npcs_query.filter(NPC.is_important.is_(True))
+        if tag:
+            npcs_query = npcs_query.filter(NPC.id.in_(tagged_ids(tag.id, 'npc')))
+        npcs = npcs_query.order_by(NPC.name, NPC.id).limit(NPC_PAGE_SIZE + 1).offset(offset).all()
     
-    # Get NPCs for this campaign
-    npcs_query = NPC.query.filter_by(campaign_id=campaign_id)
-    
-    # Apply search filter if provided
-    if search_query:
-        search = f"%{search_query}%"
-        filters = [
-            NPC.name.ilike(search),
-            NPC.race.ilike(search),
-            NPC.notes.ilike(search),
-            NPC.gender.ilike(search),
-            NPC.tags.ilike(search)
-        ]
-        # If numeric search, also match age exactly
-        if search_query.isdigit():
-            try:
-                filters.append(NPC.age == int(search_query))
-            except ValueError:
-                pass
-        npcs_query = npcs_query.filter(or_(*filters))
-    
-    # Apply important-only filter if toggle is active
-    if important_only:
-        npcs_query = npcs_query.filter(NPC.is_important.is_(True))
-    
-    npcs = npcs_query.order_by(NPC.name).all()
+    has_more = len(npcs) > NPC_PAGE_SIZE
+    npcs = npcs[:NPC_PAGE_SIZE]
     
     is_dm = current_user.id == campaign.dm_id
-    return render_template('npcs.html', 
+    return render_conditional(etag, last_modified, 'npcs.html', 
                          campaign=campaign, 
                          npcs=npcs, 
                          search_query=search_query,
                          important_only=important_only,
+                         page=page,
+                         has_more=has_more,
+                         tag_filter=tag_filter,
+                         tag_facets=tag_facets(campaign_id, 'npc'),
                          title='NPCs',
                          is_dm=is_dm)
 
 @app.route('/campaign/<int:campaign_id>/npc/<int:npc_id>')
 @login_required
 def view_npc(campaign_id, npc_id):
+    # Cheap validator first: one primary key lookup, roles come from the membership cache
+    role = get_campaign_roles(current_user.id).get(campaign_id)
+    row = db.session.query(NPC.updated_at, NPC.created_by).filter(
+        NPC.id == npc_id, NPC.campaign_id == campaign_id
+    ).first() if role else None
+    if row is not None:
+        viewer_role = role if role == 'dm' else ('owner' if current_user.id == row.created_by else 'player')
+        etag = page_etag('npc', npc_id, row.updated_at, viewer_role)
+        response = not_modified(etag, row.updated_at)
+        if response is not None:
+            return response
+    
     npc = NPC.query.get_or_404(npc_id)
     campaign = Campaign.query.get_or_404(campaign_id)
     
@@ -1585,11 +2965,15 @@ def view_npc(campaign_id, npc_id):
         return redirect(url_for('campaigns'))
     
     is_dm = current_user.id == campaign.dm_id
-    return render_template('view_npc.html', 
+    # Everything the cached NPC fragment varies by, besides the NPC itself
+    viewer_role = 'dm' if is_dm else ('owner' if current_user.id == npc.created_by else 'player')
+    return render_conditional(page_etag('npc', npc.id, npc.updated_at, viewer_role), npc.updated_at,
+                         'view_npc.html', 
                          campaign=campaign, 
                          npc=npc,
                          title=npc.name,
-                         is_dm=is_dm)
+                         is_dm=is_dm,
+                         viewer_role=viewer_role)
 
 @app.route('/campaign/<int:campaign_id>/npc/new', methods=['GET', 'POST'])
 @login_required
@@ -1800,29 +3184,10 @@ def update_npc_tags(campaign_id, npc_id):
         return jsonify({'success': False, 'error': 'Keine Berechtigung'}), 403
 
     try:
-        # Expect a list of tags or a comma-separated string
+        # Expect a list of tags or a comma-separated string; the tag index follows on commit
         data = request.get_json(silent=True) or {}
-        tags = data.get('tags', '')
-        if isinstance(tags, list):
-            # Normalize: trim, remove empties, deduplicate preserving order
-            seen = set()
-            normalized = []
-            for t in tags:
-                s = (t or '').strip()
-                if s and s.lower() not in seen:
-                    seen.add(s.lower())
-                    normalized.append(s)
-            npc.tags = ', '.join(normalized) if normalized else None
-        else:
-            # string path
-            parts = [p.strip() for p in str(tags).split(',')]
-            normalized = []
-            seen = set()
-            for p in parts:
-                if p and p.lower() not in seen:
-                    seen.add(p.lower())
-                    normalized.append(p)
-            npc.tags = ', '.join(normalized) if normalized else None
+        normalized = normalize_tags(data.get('tags', ''))
+        npc.tags = ', '.join(normalized) if normalized else None
 
         db.session.commit()
         return jsonify({'success': True, 'tags': npc.tags or ''})
@@ -1831,6 +3196,36 @@ def update_npc_tags(campaign_id, npc_id):
         app.logger.error(f'Error updating NPC tags: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/campaign/<int:campaign_id>/tags/rename', methods=['POST'])
+@login_required
+def rename_campaign_tag(campaign_id):
+    """
+    Rename a tag on all NPCs and quests of a campaign (DM only)
+
+    JSON body: ``{"from": "Händler", "to": "Kaufmann"}``. If the campaign
+    already has a tag named ``to``, the two are merged.
+    """
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if current_user.id != campaign.dm_id:
+        return jsonify({'success': False, 'error': 'Keine Berechtigung'}), 403
+
+    data = request.get_json(silent=True) or {}
+    old_name = str(data.get('from') or '').strip()
+    new_name = str(data.get('to') or '').strip()
+    if not old_name or not new_name or ',' in new_name:
+        return jsonify({'success': False, 'error': 'Ungültiger Tag'}), 400
+
+    try:
+        updated = rename_tag(campaign.id, old_name, new_name)
+        if updated is None:
+            return jsonify({'success': False, 'error': 'Tag nicht gefunden'}), 404
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Error renaming tag: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'updated': updated})
+
 @app.route('/campaign/<int:campaign_id>/npc/<int:npc_id>/delete', methods=['POST'])
 @login_required
 def delete_npc(campaign_id, npc_id):
@@ -1868,40 +3263,317 @@ def npc_image(filename):
 @app.route('/dice')
 @login_required
 def dice():
-    return render_template('dice.html', title='Würfeln')
+    # Rolls made with a campaign selected are logged for its statistics
+    campaigns = sorted(get_my_campaigns().campaigns, key=lambda c: c.name)
+    selected_id = request.args.get('campaign_id', type=int)
+    if selected_id not in {c.id for c in campaigns}:
+        selected_id = None
+    return render_template('dice.html', title='Würfeln', campaigns=campaigns, selected_campaign_id=selected_id)
 
-@app.context_processor
-def inject_pending_actions():
-    if not current_user.is_authenticated:
-        return {}
-        
-    # Get campaigns where user is DM or player
-    dm_campaigns = Campaign.query.filter_by(dm_id=current_user.id).all()
-    player_campaigns = current_user.player_campaigns
-    campaigns = list({c.id: c for c in dm_campaigns + player_campaigns}.values())
+# Bulk rolls only return summary statistics beyond this many rolls
+DICE_MAX_LISTED_TOTALS = 1000
+
+@app.route('/dice/roll', methods=['POST'])
+@login_required
+def roll_dice():
+    """
+    Roll a dice expression on the server
+    
+    Expects JSON with ``expression`` (e.g. "4d6kh3+2") and optionally
+    ``count`` for bulk rolls. A single roll returns its individual dice;
+    bulk rolls return the totals (up to DICE_MAX_LISTED_TOTALS) and statistics.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        count = int(data.get('count', 1))
+        campaign_id = int(data['campaign_id']) if data.get('campaign_id') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Ungültige Anzahl an Würfen.'}), 400
     
-    if not campaigns:
-        return {'pending_actions_count': 0}
-        
-    campaign_ids = [c.id for c in campaigns]
+    if campaign_id is not None:
+        campaign = Campaign.query.get_or_404(campaign_id)
+        if not campaign.has_access(current_user):
+            abort(403)
+    
+    try:
+        expression = parse_dice(data.get('expression', ''))
+        result = expression.roll(count)
+    except DiceError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # Only single rolls made at the table are logged, bulk rolls are what-ifs
+    if campaign_id is not None and count == 1:
+        log_dice_roll(campaign_id, expression, result)
+    
+    response = {
+        'success': True,
+        'expression': expression.notation,
+        'count': count,
+        'total': int(result.totals[0]),
+        'dice': result.details(0),
+        'modifier': expression.constant,
+    }
+    if count > 1:
+        response['stats'] = result.summary()
+        if count <= DICE_MAX_LISTED_TOTALS:
+            response['totals'] = result.totals.tolist()
+    return jsonify(response)
+
+# A roll belongs to a session scheduled at most this long before (or shortly after) it
+DICE_SESSION_WINDOW = timedelta(hours=12)
+DICE_SESSION_EARLY = timedelta(hours=2)
+# Rolls loaded per query when catching the statistics up with the log
+DICE_STATS_CHUNK = 5000
+
+# Process-local notation -> id map; notations are never renamed or deleted
+_dice_notation_ids = {}
+
+def get_current_session(campaign_id, now=None):
+    """The campaign session taking place around ``now``, if any"""
+    now = now or datetime.utcnow()
+    return Session.query.filter(
+        Session.campaign_id == campaign_id,
+        Session.scheduled_at <= now + DICE_SESSION_EARLY,
+        Session.scheduled_at >= now - DICE_SESSION_WINDOW
+    ).order_by(Session.scheduled_at.desc()).first()
+
+def log_dice_roll(campaign_id, expression, result):
+    """Queue a single roll for the campaign's roll log without waiting for the write"""
+    current_session = get_current_session(campaign_id)
+    future = dice_log_writer.submit({
+        'campaign_id': campaign_id,
+        'user_id': current_user.id,
+        'session_id': current_session.id if current_session else None,
+        'notation': expression.notation,
+        'total': int(result.totals[0]),
+        'faces': pack_faces(result),
+        'created_at': datetime.utcnow(),
+    })
+    
+    def report_failure(f):
+        if f.exception() is not None:
+            log_error(f"Could not log dice roll in campaign {campaign_id}", f.exception())
+    future.add_done_callback(report_failure)
+
+def _resolve_dice_notations(notations):
+    """Notation ids for a batch, inserting unknown notations (not committed here)"""
+    ids = {n: _dice_notation_ids[n] for n in notations if n in _dice_notation_ids}
+    missing = [n for n in notations if n not in ids]
+    if missing:
+        ids.update(db.session.execute(
+            select(DiceNotation.notation, DiceNotation.id).where(DiceNotation.notation.in_(missing))
+        ).all())
+        missing = [n for n in missing if n not in ids]
+    if missing:
+        ids.update(db.session.execute(
+            insert(DiceNotation).returning(DiceNotation.notation, DiceNotation.id),
+            [{'notation': n} for n in missing]
+        ).all())
+    return ids
+
+def insert_dice_rolls(rows):
+    """
+    Insert a batch of logged rolls in a single transaction
+    
+    Called by the dice log batcher. New notations are added to the notation
+    table in the same transaction; if another worker added one concurrently
+    the batch is retried once with the now existing ids. Batches commit in id
+    order, which the incremental dice statistics rely on.
+    """
+    for attempt in range(2):
+        try:
+            # Taken first, so two batches never wait on each other's new notations
+            lock_id_order(DICE_LOG_WRITE_LOCK)
+            notation_ids = _resolve_dice_notations({row['notation'] for row in rows})
+            values = []
+            for row in rows:
+                value = dict(row, notation_id=notation_ids[row['notation']])
+                del value['notation']
+                values.append(value)
+            ids = db.session.scalars(
+                insert(DiceRoll).returning(DiceRoll.id, sort_by_parameter_order=True),
+                values
+            ).all()
+            db.session.commit()
+            # Only remember ids once they are committed
+            _dice_notation_ids.update(notation_ids)
+            return ids
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+def get_dice_stats(campaign_id):
+    """
+    Per-player and per-session dice statistics of a campaign
+    
+    Only rolls logged since the last call in this process are loaded (by
+    primary key range on the campaign index) and folded into the aggregates.
+    """
+    while True:
+        rows = db.session.execute(
+            select(DiceRoll.id, DiceRoll.user_id, DiceRoll.session_id, DiceNotation.notation, DiceRoll.faces)
+            .join(DiceNotation, DiceNotation.id == DiceRoll.notation_id)
+            .where(DiceRoll.campaign_id == campaign_id, DiceRoll.id > dice_stats.last_id(campaign_id))
+            .order_by(DiceRoll.id)
+            .limit(DICE_STATS_CHUNK)
+        ).all()
+        rolls = []
+        for row in rows:
+            expression = parse_dice(row.notation)
+            dice_count = sum(group.count for group in expression.groups)
+            rolls.append((row.id, row.user_id, row.session_id, expression, unpack_faces(row.faces, dice_count)))
+        dice_stats.add(campaign_id, rolls)
+        if len(rows) < DICE_STATS_CHUNK:
+            return dice_stats.summary(campaign_id)
+
+@app.route('/campaign/<int:campaign_id>/dice/stats')
+@login_required
+def campaign_dice_stats(campaign_id):
+    """Dice statistics per player and per session for the dice view"""
+    campaign = Campaign.query.get_or_404(campaign_id)
+    if not campaign.has_access(current_user):
+        abort(403)
+    
+    stats = get_dice_stats(campaign_id)
+    users = {u.id: u for u in User.query.filter(User.id.in_(stats['players'].keys())).all()} if stats['players'] else {}
+    sessions = {s.id: s for s in Session.query.filter(Session.id.in_(stats['sessions'].keys())).all()} if stats['sessions'] else {}
+    
+    players = [
+        dict(entry, user_id=user_id, name=users[user_id].username if user_id in users else 'Unbekannt')
+        for user_id, entry in stats['players'].items()
+    ]
+    session_stats = [
+        dict(
+            entry,
+            session_id=session_id,
+            title=sessions[session_id].title if session_id in sessions else None,
+            scheduled_at=sessions[session_id].scheduled_at.isoformat() if session_id in sessions else None,
+        )
+        for session_id, entry in stats['sessions'].items()
+    ]
+    players.sort(key=lambda p: p['name'].lower())
+    session_stats.sort(key=lambda s: s['scheduled_at'] or '', reverse=True)
+    return jsonify({'success': True, 'players': players, 'sessions': session_stats})
+
+ENCOUNTER_DEFAULT_SIMULATIONS = 10000
+
+@app.route('/encounter/simulate', methods=['POST'])
+@login_required
+def simulate_encounter_view():
+    """
+    Simulate a fight many times to estimate its outcome
+    
+    Expects JSON with ``party`` and ``monsters`` lists of stat blocks
+    (``name``, ``hp``, ``ac``, ``attack_bonus``, ``damage`` as dice expression,
+    optionally ``attacks``, ``initiative`` and for monsters ``count``) and
+    optionally the number of ``simulations``.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        simulations = int(data.get('simulations', ENCOUNTER_DEFAULT_SIMULATIONS))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Ungültige Anzahl an Simulationen.'}), 400
+    
+    try:
+        combatants = parse_encounter(data.get('party'), data.get('monsters'))
+        result = simulate_encounter(combatants, simulations, processes=app.config.get('ENCOUNTER_PROCESSES', 0))
+    except EncounterError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    result['success'] = True
+    return jsonify(result)
+
+DICE_DEFAULT_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+@app.route('/dice/distribution')
+@login_required
+def dice_distribution_view():
+    """
+    Exact probability distribution of a dice expression
+    
+    Query parameters: ``expression`` and optionally ``percentiles`` as a
+    comma-separated list (e.g. "10,50,90"). Results are memoized per
+    normalized expression, so repeated lookups do no computation.
+    """
+    try:
+        percentiles = tuple(
+            float(q) for q in request.args.get('percentiles', '').split(',') if q.strip()
+        ) or DICE_DEFAULT_PERCENTILES
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Ungültige Perzentile.'}), 400
+    if not all(0 <= q <= 100 for q in percentiles):
+        return jsonify({'success': False, 'error': 'Perzentile müssen zwischen 0 und 100 liegen.'}), 400
     
+    try:
+        expression = parse_dice(request.args.get('expression', ''))
+        distribution = dice_distribution(expression.notation)
+    except DiceError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    response = {'success': True, 'expression': expression.notation}
+    response.update(distribution.to_dict(percentiles))
+    return jsonify(response)
+
+def count_pending_actions(user_id):
+    """
+    Open RSVPs and unanswered polls of a user
+    
+    Returns:
+        tuple: (count, seconds until the earliest counted session starts and
+               drops out of the count, or None)
+    """
+    campaign_ids = list(get_campaign_roles(user_id))
+    if not campaign_ids:
+        return 0, None
+    
+    now = datetime.now()
     # Count open RSVPs (sessions without user response)
-    open_rsvps = db.session.query(Session).filter(
+    open_rsvps, next_session_at = db.session.query(
+        func.count(Session.id), func.min(Session.scheduled_at)
+    ).filter(
         Session.campaign_id.in_(campaign_ids),
-        Session.scheduled_at >= datetime.now(),
-        ~Session.responses.any(user_id=current_user.id)
-    ).count()
+        Session.scheduled_at >= now,
+        ~Session.responses.any(user_id=user_id)
+    ).one()
     
     # Count open polls where user hasn't voted
     open_polls = db.session.query(SessionPoll).filter(
         SessionPoll.campaign_id.in_(campaign_ids),
         SessionPoll.is_closed == False,
         ~SessionPoll.options.any(
-            SessionPollOption.votes.any(user_id=current_user.id)
+            SessionPollOption.votes.any(user_id=user_id)
         )
     ).count()
     
-    return {'pending_actions_count': open_rsvps + open_polls}
+    valid_for = (next_session_at - now).total_seconds() if next_session_at else None
+    return open_rsvps + open_polls, valid_for
+
+def invalidate_pending_actions(campaign):
+    """Drop the cached counts of a campaign's DM and players after its sessions or polls changed"""
+    player_ids = db.session.scalars(
+        select(player_campaign.c.user_id).where(player_campaign.c.campaign_id == campaign.id)
+    ).all()
+    pending_actions_cache.invalidate(campaign.dm_id, *player_ids)
+
+def get_pending_actions_count(user_id):
+    """The nav badge count, from the cache when possible"""
+    count = pending_actions_cache.get(user_id)
+    if count is None:
+        count, valid_for = count_pending_actions(user_id)
+        pending_actions_cache.set(user_id, count, ttl=valid_for)
+    return count
+
+@app.context_processor
+def inject_pending_actions():
+    if not current_user.is_authenticated:
+        return {}
+    return {'pending_actions_count': get_pending_actions_count(current_user.id)}
 
 if __name__ == '__main__':
     app = create_app()
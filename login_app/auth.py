@@ -1,9 +1,12 @@
 from functools import wraps
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from .models import User, db
-from .extensions import get_supabase
+from .extensions import get_supabase_auth, supabase_pool
+from .supabase_jwt import token_verifier
+from .chat_cache import invalidate_sender
+from .user_cache import user_cache
 from datetime import datetime
 import os
 
@@ -45,8 +48,8 @@ def login():
             return redirect(url_for('auth.login'))
         
         try:
-            supabase = get_supabase()
-            response = supabase.auth.sign_in_with_password({
+            supabase_auth = get_supabase_auth()
+            response = supabase_auth.sign_in_with_password({
                 'email': email,
                 'password': password
             })
@@ -64,10 +67,13 @@ def login():
             
             # Log the user in
             login_user(user, remember=remember)
+            token_verifier.remember(response.session)
             
             # Update last login
             user.last_login = datetime.utcnow()
             db.session.commit()
+            user_cache.invalidate(user.id)
+            invalidate_sender(user.id)
             
             flash('Successfully logged in!', 'success')
             next_page = request.args.get('next')
@@ -110,7 +116,7 @@ def signup():
             return redirect(url_for('auth.signup'))
         
         try:
-            supabase = get_supabase()
+            supabase_auth = get_supabase_auth()
             
             # Check if email already exists in our database
             if User.query.filter_by(email=email).first():
@@ -118,7 +124,7 @@ def signup():
                 return redirect(url_for('auth.login'))
             
             # Create user in Supabase Auth
-            response = supabase.auth.sign_up({
+            response = supabase_auth.sign_up({
                 'email': email,
                 'password': password,
                 'options': {
@@ -155,11 +161,14 @@ def signup():
 @login_required
 def logout():
     try:
-        supabase = get_supabase()
-        supabase.auth.sign_out()
+        supabase_auth = get_supabase_auth()
+        supabase_auth.sign_out()
     except Exception as e:
         current_app.logger.error(f'Logout error: {str(e)}')
     
+    user_cache.invalidate(current_user.id)
+    invalidate_sender(current_user.id)
+    token_verifier.forget()
     logout_user()
     flash('You have been logged out.', 'success')
     return redirect(url_for('auth.login'))
@@ -177,8 +186,8 @@ def forgot_password():
             return redirect(url_for('auth.forgot_password'))
         
         try:
-            supabase = get_supabase()
-            supabase.auth.reset_password_email(
+            supabase_auth = get_supabase_auth()
+            supabase_auth.reset_password_email(
                 email,
                 {
                     'redirect_to': url_for('auth.reset_password', _external=True)
@@ -222,8 +231,8 @@ def reset_password():
             return redirect(url_for('auth.reset_password', token=token))
         
         try:
-            supabase = get_supabase()
-            response = supabase.auth.update_user({
+            supabase_auth = get_supabase_auth()
+            response = supabase_auth.update_user({
                 'password': password
             })
             
@@ -239,3 +248,9 @@ def reset_password():
             return redirect(url_for('auth.forgot_password'))
     
     return render_template('reset_password.html', token=token)
+
+@auth.route('/admin/supabase-pool')
+@admin_required
+def supabase_pool_stats():
+    """Connection pool metrics of the Supabase client in this worker process"""
+    return jsonify(supabase_pool.stats())
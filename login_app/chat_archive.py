@@ -0,0 +1,43 @@
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+# Codec used for new archive blocks; every block records its own codec so
+# blocks written with zstd stay readable after switching back and vice versa
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'gzip'
+
+
+def pack_messages(messages, codec=DEFAULT_CODEC):
+    """
+    Compress a list of message dicts into an archive block payload
+
+    Args:
+        messages: JSON-serializable dicts, oldest first
+        codec: 'zstd' or 'gzip'
+
+    Returns:
+        bytes: Compressed JSON array
+    """
+    raw = json.dumps(messages, separators=(',', ':')).encode('utf-8')
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    if codec == 'gzip':
+        return gzip.compress(raw, compresslevel=9)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def unpack_messages(codec, data):
+    """Decompress an archive block payload back into a list of message dicts"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this chat archive block")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'gzip':
+        raw = gzip.decompress(data)
+    else:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    return json.loads(raw.decode('utf-8'))
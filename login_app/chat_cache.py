@@ -0,0 +1,254 @@
+import bisect
+import json
+import threading
+from collections import OrderedDict, deque
+
+
+class _CampaignBuffer:
+    """
+    Newest serialized messages of one campaign, oldest first.
+
+    ``floor_id`` records how far back the buffer is complete: every message of
+    the campaign with an id greater than ``floor_id`` is in the buffer. A floor
+    of 0 means the buffer holds the campaign's entire history.
+    """
+
+    __slots__ = ('entries', 'floor_id', 'size')
+
+    def __init__(self, capacity, floor_id):
+        self.entries = deque(maxlen=capacity)
+        self.floor_id = floor_id
+        self.size = 0
+
+    @property
+    def last_id(self):
+        return self.entries[-1][0] if self.entries else self.floor_id
+
+
+class ChatCache:
+    """
+    Bounded per-campaign ring buffers of already-serialized chat messages.
+
+    Each campaign keeps at most ``CHAT_CACHE_PER_CAMPAIGN`` messages. Campaigns
+    are kept in LRU order and the coldest ones are dropped once the estimated
+    size of all buffered messages exceeds ``CHAT_CACHE_MAX_BYTES``.
+
+    Read methods return ``None`` when the buffer cannot answer the request on
+    its own; callers then go to the database and ``prime`` or ``extend`` the
+    buffer with what they loaded.
+    """
+
+    def __init__(self, per_campaign=200, max_bytes=8 * 1024 * 1024):
+        self.per_campaign = per_campaign
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()
+        self._size = 0
+
+    def init_app(self, app):
+        self.per_campaign = app.config.setdefault('CHAT_CACHE_PER_CAMPAIGN', self.per_campaign)
+        self.max_bytes = app.config.setdefault('CHAT_CACHE_MAX_BYTES', self.max_bytes)
+        self.clear()
+
+    def _touch(self, campaign_id):
+        buf = self._buffers.get(campaign_id)
+        if buf is not None:
+            self._buffers.move_to_end(campaign_id)
+        return buf
+
+    def _push(self, buf, message_data):
+        message_id = message_data['id']
+        # A message older than the head only belongs in the buffer if it's missing from it
+        # (ids are allocated before commit, so one may show up after a newer one)
+        position = len(buf.entries)
+        if buf.entries and message_id <= buf.entries[-1][0]:
+            if message_id <= buf.floor_id:
+                return
+            ids = [entry_id for entry_id, _, _ in buf.entries]
+            position = bisect.bisect_left(ids, message_id)
+            if position < len(ids) and ids[position] == message_id:
+                return
+        if len(buf.entries) == buf.entries.maxlen:
+            if position == 0:
+                # Older than everything we would keep
+                buf.floor_id = max(buf.floor_id, message_id)
+                return
+            evicted_id, _, evicted_size = buf.entries.popleft()
+            buf.floor_id = evicted_id
+            buf.size -= evicted_size
+            self._size -= evicted_size
+            position -= 1
+        size = len(json.dumps(message_data))
+        buf.entries.insert(position, (message_id, message_data, size))
+        buf.size += size
+        self._size += size
+
+    def _enforce_limit(self, keep):
+        while self._size > self.max_bytes and len(self._buffers) > 1:
+            campaign_id, buf = self._buffers.popitem(last=False)
+            if campaign_id == keep:
+                # Never evict the buffer we are writing to; put it back as hottest
+                self._buffers[campaign_id] = buf
+                continue
+            self._size -= buf.size
+
+    def last_id(self, campaign_id):
+        """Newest buffered message id, or ``None`` if the campaign is not cached"""
+        with self._lock:
+            buf = self._touch(campaign_id)
+            return buf.last_id if buf is not None else None
+
+    def get_latest(self, campaign_id, limit):
+        with self._lock:
+            buf = self._touch(campaign_id)
+            if buf is None or (len(buf.entries) < limit and buf.floor_id):
+                return None
+            return [data for _, data, _ in list(buf.entries)[-limit:]]
+
+    def get_after(self, campaign_id, after_id, limit):
+        with self._lock:
+            buf = self._touch(campaign_id)
+            if buf is None or after_id < buf.floor_id:
+                return None
+            result = []
+            for message_id, data, _ in buf.entries:
+                if message_id > after_id:
+                    result.append(data)
+                    if len(result) == limit:
+                        break
+            return result
+
+    def get_before(self, campaign_id, before_id, limit):
+        with self._lock:
+            buf = self._touch(campaign_id)
+            if buf is None:
+                return None
+            older = [data for message_id, data, _ in buf.entries if message_id < before_id]
+            if len(older) < limit and buf.floor_id:
+                return None
+            return older[-limit:]
+
+    def prime(self, campaign_id, messages_data, complete):
+        """
+        Replace a campaign's buffer with the newest messages loaded from the database
+
+        Args:
+            campaign_id: Campaign the messages belong to
+            messages_data: Serialized messages, oldest first
+            complete: True if ``messages_data`` is the campaign's whole history
+        """
+        with self._lock:
+            old = self._buffers.pop(campaign_id, None)
+            if old is not None:
+                self._size -= old.size
+            kept = messages_data[-self.per_campaign:]
+            if not kept or (complete and len(kept) == len(messages_data)):
+                floor_id = 0
+            else:
+                floor_id = kept[0]['id'] - 1
+            buf = _CampaignBuffer(self.per_campaign, floor_id)
+            self._buffers[campaign_id] = buf
+            for message_data in kept:
+                self._push(buf, message_data)
+            self._enforce_limit(campaign_id)
+
+    def extend(self, campaign_id, messages_data):
+        """Add messages the buffer is missing, in id order; ignored if the campaign is not cached"""
+        with self._lock:
+            buf = self._touch(campaign_id)
+            if buf is None:
+                return
+            for message_data in messages_data:
+                self._push(buf, message_data)
+            self._enforce_limit(campaign_id)
+
+    def invalidate(self, campaign_id):
+        with self._lock:
+            buf = self._buffers.pop(campaign_id, None)
+            if buf is not None:
+                self._size -= buf.size
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'campaigns': len(self._buffers),
+                'messages': sum(len(buf.entries) for buf in self._buffers.values()),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class SenderProfileCache:
+    """
+    Per-campaign cache of resolved chat senders.
+
+    Maps ``(user_id, character_id)`` to the sender fields of a serialized
+    message (name, DM flag, avatar). Only the ``max_campaigns`` most recently
+    used campaigns are kept.
+    """
+
+    def __init__(self, max_campaigns=256):
+        self.max_campaigns = max_campaigns
+        self._lock = threading.Lock()
+        self._campaigns = OrderedDict()
+
+    def lookup(self, campaign_id, keys):
+        """
+        Returns:
+            tuple: (dict of cached profiles, set of keys that still need loading)
+        """
+        with self._lock:
+            cached = self._campaigns.get(campaign_id)
+            if cached is None:
+                return {}, set(keys)
+            self._campaigns.move_to_end(campaign_id)
+            found = {key: cached[key] for key in keys if key in cached}
+            return found, set(keys) - found.keys()
+
+    def update(self, campaign_id, profiles):
+        with self._lock:
+            cached = self._campaigns.setdefault(campaign_id, {})
+            cached.update(profiles)
+            self._campaigns.move_to_end(campaign_id)
+            while len(self._campaigns) > self.max_campaigns:
+                self._campaigns.popitem(last=False)
+
+    def invalidate(self, campaign_id):
+        with self._lock:
+            self._campaigns.pop(campaign_id, None)
+
+    def invalidate_user(self, user_id):
+        """
+        Drop every cached profile of a user
+
+        Returns:
+            list: Campaigns that had one, i.e. whose buffered messages may show the old profile
+        """
+        with self._lock:
+            campaign_ids = []
+            for campaign_id, cached in self._campaigns.items():
+                stale = [key for key in cached if key[0] == user_id]
+                for key in stale:
+                    del cached[key]
+                if stale:
+                    campaign_ids.append(campaign_id)
+            return campaign_ids
+
+    def clear(self):
+        with self._lock:
+            self._campaigns.clear()
+
+
+chat_cache = ChatCache()
+sender_profiles = SenderProfileCache()
+
+
+def invalidate_sender(user_id):
+    """Forget a user's chat sender profile and the buffered messages rendered with it"""
+    for campaign_id in sender_profiles.invalidate_user(user_id):
+        chat_cache.invalidate(campaign_id)
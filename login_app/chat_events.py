@@ -0,0 +1,107 @@
+import threading
+import time
+
+
+class ChatBroker:
+    """
+    In-process notification hub for campaign chat.
+
+    Writers call ``notify(campaign_id, message_id)`` after a message has been
+    committed. Streaming and long-polling readers block in ``wait`` until the
+    newest known message id for their campaign moves past the id they have
+    already seen, so idle chat tabs sleep instead of hitting the database.
+
+    The broker only carries "something changed" signals (the newest message id
+    per campaign), never message payloads; readers fetch the delta themselves.
+
+    Every blocked reader pins a worker thread, so the number open per process
+    is capped to fit the gunicorn thread budget: ``max_streams`` event
+    streams (``CHAT_MAX_OPEN_STREAMS``) plus ``max_long_polls`` long-polls
+    (``CHAT_MAX_LONG_POLLS``) for clients that didn't get a stream. Both wait
+    on the same condition; only when both pools are full is a client told to
+    back off.
+    """
+
+    def __init__(self, max_streams=20, max_long_polls=8):
+        self._cond = threading.Condition()
+        self._latest = {}
+        self.max_streams = max_streams
+        self.max_long_polls = max_long_polls
+        self._readers = {'stream': 0, 'long_poll': 0}
+
+    def init_app(self, app):
+        self.max_streams = app.config.setdefault('CHAT_MAX_OPEN_STREAMS', self.max_streams)
+        self.max_long_polls = app.config.setdefault('CHAT_MAX_LONG_POLLS', self.max_long_polls)
+
+    def acquire_reader(self, long_poll=False):
+        """Claim a stream (or long-poll) slot; returns False if all of them are taken"""
+        kind, limit = ('long_poll', self.max_long_polls) if long_poll else ('stream', self.max_streams)
+        with self._cond:
+            if self._readers[kind] >= limit:
+                return False
+            self._readers[kind] += 1
+            return True
+
+    def release_reader(self, long_poll=False):
+        """Give back a slot claimed with ``acquire_reader``"""
+        kind = 'long_poll' if long_poll else 'stream'
+        with self._cond:
+            self._readers[kind] = max(self._readers[kind] - 1, 0)
+
+    def notify(self, campaign_id, message_id):
+        """Record a newly committed message and wake up waiting readers"""
+        with self._cond:
+            if message_id > self._latest.get(campaign_id, 0):
+                self._latest[campaign_id] = message_id
+            self._cond.notify_all()
+
+    def latest(self, campaign_id):
+        """Newest message id this process has seen for a campaign (0 if none)"""
+        with self._cond:
+            return self._latest.get(campaign_id, 0)
+
+    def wait(self, campaign_id, after_id, timeout):
+        """
+        Block until a message newer than ``after_id`` is announced
+
+        Args:
+            campaign_id: Campaign to watch
+            after_id: Newest message id the reader already has
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            int: Newest known message id, or ``after_id`` if the wait timed out
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._latest.get(campaign_id, 0) <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return after_id
+                self._cond.wait(remaining)
+            return self._latest[campaign_id]
+
+
+chat_broker = ChatBroker()
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    Format a single Server-Sent Events frame
+
+    Args:
+        data: Already serialized payload (str)
+        event: Optional event name
+        event_id: Optional id, echoed back by the browser as Last-Event-ID
+
+    Returns:
+        str: Frame ready to be written to a text/event-stream response
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in str(data).splitlines() or ['']:
+        lines.append(f"data: {line}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,180 @@
+import re
+from markupsafe import escape
+from sqlalchemy import text
+
+# Text search configuration used for the Postgres expression index. The
+# index is only used if queries spell the expression exactly the same way.
+SEARCH_CONFIG = 'german'
+
+# Highlight markers returned by the database; replaced after HTML escaping
+# so that message content can never inject markup into the results
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_POSTGRES_INDEXES = [
+    f"""
+    CREATE INDEX IF NOT EXISTS ix_message_content_fts
+    ON message USING gin (to_tsvector('{SEARCH_CONFIG}', content))
+    """,
+    # Text of messages moved into archive blocks (see compact_chat_messages)
+    f"""
+    CREATE INDEX IF NOT EXISTS ix_archived_message_text_fts
+    ON archived_message_text USING gin (to_tsvector('{SEARCH_CONFIG}', content))
+    """,
+]
+
+# External-content FTS5 table kept in sync with the message table by triggers
+_SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+    USING fts5(content, content='message', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS archived_message_fts
+    USING fts5(content, content='archived_message_text', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS archived_message_fts_insert AFTER INSERT ON archived_message_text BEGIN
+        INSERT INTO archived_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS archived_message_fts_delete AFTER DELETE ON archived_message_text BEGIN
+        INSERT INTO archived_message_fts(archived_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+]
+
+# Live messages and the search-only text of archived ones; their ids never overlap
+_POSTGRES_SEARCH = text(f"""
+SELECT hits.id, hits.rank,
+       ts_headline('{SEARCH_CONFIG}', hits.content, hits.query,
+                   'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=2, MaxWords=20, MinWords=5') AS snippet
+FROM (
+    SELECT message.id, message.content, ts_rank(to_tsvector('{SEARCH_CONFIG}', message.content), query) AS rank, query
+    FROM message, websearch_to_tsquery('{SEARCH_CONFIG}', :query) AS query
+    WHERE message.campaign_id = :campaign_id
+      AND to_tsvector('{SEARCH_CONFIG}', message.content) @@ query
+    UNION ALL
+    SELECT archived.id, archived.content, ts_rank(to_tsvector('{SEARCH_CONFIG}', archived.content), query) AS rank, query
+    FROM archived_message_text AS archived, websearch_to_tsquery('{SEARCH_CONFIG}', :query) AS query
+    WHERE archived.campaign_id = :campaign_id
+      AND to_tsvector('{SEARCH_CONFIG}', archived.content) @@ query
+    ORDER BY rank DESC, id DESC
+    LIMIT :limit OFFSET :offset
+) AS hits
+ORDER BY hits.rank DESC, hits.id DESC
+""")
+
+_SQLITE_SEARCH = text("""
+SELECT id, rank, snippet
+FROM (
+    SELECT message.id, -bm25(message_fts) AS rank,
+           snippet(message_fts, 0, char(2), char(3), '…', 16) AS snippet
+    FROM message_fts
+    JOIN message ON message.id = message_fts.rowid
+    WHERE message_fts MATCH :query AND message.campaign_id = :campaign_id
+    UNION ALL
+    SELECT archived.id, -bm25(archived_message_fts) AS rank,
+           snippet(archived_message_fts, 0, char(2), char(3), '…', 16) AS snippet
+    FROM archived_message_fts
+    JOIN archived_message_text AS archived ON archived.id = archived_message_fts.rowid
+    WHERE archived_message_fts MATCH :query AND archived.campaign_id = :campaign_id
+)
+ORDER BY rank DESC, id DESC
+LIMIT :limit OFFSET :offset
+""")
+
+
+def ensure_chat_search_index(engine):
+    """
+    Create the full-text index for chat messages if it is missing
+
+    Covers both the message table and ``archived_message_text``, which keeps
+    the text of archived messages searchable. Postgres gets GIN indexes over
+    ``to_tsvector(content)``; SQLite gets FTS5 tables plus triggers, filled
+    from existing rows on first creation. Other databases are left alone and
+    searches against them return nothing.
+    """
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == 'postgresql':
+            for statement in _POSTGRES_INDEXES:
+                conn.execute(text(statement))
+        elif dialect == 'sqlite':
+            # Without its triggers a table may have missed writes; refill it then
+            triggers = {
+                name for (name,) in
+                conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+            }
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(text(statement))
+            for table in ('message_fts', 'archived_message_fts'):
+                if f'{table}_insert' not in triggers:
+                    conn.execute(text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+
+
+def fts5_query(query):
+    """Turn free text into an FTS5 query that matches all words (last one as prefix)"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight_snippet(snippet):
+    """HTML-escape a database snippet and turn its markers into <mark> tags"""
+    escaped = str(escape(snippet or ''))
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_chat_messages(session, campaign_id, query, limit, offset=0):
+    """
+    Ranked full-text search over one campaign's chat messages, archived ones included
+
+    Args:
+        session: SQLAlchemy session
+        campaign_id: Campaign to search in
+        query: Free text as typed by the user
+        limit: Maximum number of hits to return
+        offset: Number of hits to skip (for pagination)
+
+    Returns:
+        list: (message_id, rank, highlighted_html) tuples, best match first
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statement = _POSTGRES_SEARCH
+    elif dialect == 'sqlite':
+        statement = _SQLITE_SEARCH
+        query = fts5_query(query)
+        if query is None:
+            return []
+    else:
+        return []
+
+    rows = session.execute(statement, {
+        'query': query,
+        'campaign_id': campaign_id,
+        'limit': limit,
+        'offset': offset,
+    }).all()
+    return [(row.id, row.rank, highlight_snippet(row.snippet)) for row in rows]
@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ChatWriteBatcher:
+    """
+    Coalesces chat message inserts into short multi-row transactions.
+
+    Request threads ``submit`` a row and wait on the returned future for the
+    new message id. A single background thread takes whatever has queued up
+    while the previous batch was being written (plus an optional short linger
+    window) and hands it to ``flush_fn`` in one transaction. A lone message is
+    written immediately; a burst of messages shares one commit round-trip.
+
+    ``flush_fn(rows)`` runs inside an application context, must insert and
+    commit all rows and return their ids in submission order. If a batch of
+    several rows fails, each row is retried in a batch of its own, so one bad
+    row only fails its own future.
+
+    Other append-only logs reuse the batcher with their own ``config_prefix``
+    (for the ``<prefix>_MAX_BATCH`` / ``<prefix>_LINGER`` settings) and thread name.
+    """
+
+    def __init__(self, flush_fn=None, max_batch=100, linger=0.005,
+                 config_prefix='CHAT_WRITE', name='chat-writer'):
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.linger = linger
+        self.config_prefix = config_prefix
+        self.name = name
+        self.app = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, flush_fn=None):
+        self.app = app
+        if flush_fn is not None:
+            self.flush_fn = flush_fn
+        self.max_batch = app.config.setdefault(f'{self.config_prefix}_MAX_BATCH', self.max_batch)
+        self.linger = app.config.setdefault(f'{self.config_prefix}_LINGER', self.linger)
+
+    def _ensure_worker(self):
+        # Started lazily so every gunicorn worker gets its own thread after forking
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue a message row for insertion
+
+        Args:
+            row: Column values for the new message
+
+        Returns:
+            Future: Resolves to the new message id, or raises the insert error
+        """
+        future = Future()
+        self._queue.put((row, future))
+        self._ensure_worker()
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        try:
+            with self.app.app_context():
+                ids = self.flush_fn([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # The whole transaction was rolled back; find the culprit row by row
+            for item in batch:
+                self._flush([item])
+            return
+        for (_, future), message_id in zip(batch, ids):
+            future.set_result(message_id)
+
+    def _run(self):
+        while True:
+            self._flush(self._next_batch())
+
+
+chat_writer = ChatWriteBatcher()
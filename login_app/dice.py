@@ -0,0 +1,427 @@
+"""
+Server-side dice engine.
+
+Expressions are sums of dice groups and constants, e.g. ``4d6kh3+2``,
+``2d20kl1``, ``3d6!`` or ``1d8+1d6-1``. German ``W`` works in place of ``d``.
+
+Dice group modifiers:
+    kh<n> / k<n>  keep the highest n dice
+    kl<n>         keep the lowest n dice
+    dh<n>         drop the highest n dice
+    dl<n> / d<n>  drop the lowest n dice
+    !             exploding dice: a die showing its maximum is rolled again
+                  and added to the same die (compounding)
+
+Expressions are compiled once into a small AST (cached per normalized
+expression) and rolled in bulk with NumPy, so thousands of rolls cost a few
+array operations instead of a Python loop per die. Exact distributions are
+built by convolving per-die probabilities and are memoized the same way.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+MAX_DICE_PER_GROUP = 1000
+MAX_SIDES = 1000
+MAX_TERMS = 20
+MAX_CONSTANT = 100000
+# Also bounds the digits any number in an expression can have
+MAX_EXPRESSION_LENGTH = 200
+MAX_ROLLS = 100000
+# Upper bound for rolls * dice per request, keeps a single request's arrays small
+MAX_DICE_CELLS = 5000000
+# Re-rolls per exploding die; the chance of hitting this on a d2 is 2**-100
+MAX_EXPLOSIONS = 100
+# Exact distributions: largest number of distinct totals we are willing to compute
+MAX_EXACT_SUPPORT = 200000
+# Exact keep/drop distributions cost about faces * dice**2 / 2 vector operations
+# over rows of keep * faces sums; this bounds that product for a whole
+# expression (all of its groups together), i.e. roughly a second of CPU
+MAX_EXACT_KEEP_WORK = 100000000
+# Exploding dice have unbounded totals; the tail beyond this probability is cut off
+EXPLODE_TAIL_PROBABILITY = 1e-12
+
+_TERM_RE = re.compile(r'([+-])(?:(\d*)d(\d+|%)((?:[kd][hl]?\d+|!)*)|(\d+))')
+_MODIFIER_RE = re.compile(r'([kd][hl]?)(\d+)|(!)')
+
+
+class DiceError(ValueError):
+    """Raised for malformed or oversized dice expressions"""
+
+
+class DiceGroup:
+    """``count`` dice with ``sides`` sides, of which ``keep`` are summed"""
+
+    def __init__(self, count, sides, keep=None, keep_highest=True, explode=False, sign=1):
+        self.count = count
+        self.sides = sides
+        self.keep = count if keep is None else keep
+        self.keep_highest = keep_highest
+        self.explode = explode
+        self.sign = sign
+
+    @property
+    def notation(self):
+        text = f"{self.count}d{self.sides}"
+        if self.explode:
+            text += '!'
+        if self.keep != self.count:
+            text += f"k{'h' if self.keep_highest else 'l'}{self.keep}"
+        return text
+
+    def roll_faces(self, rng, n):
+        """Face values of every die, shape (n, count); exploded dice are compounded"""
+        faces = rng.integers(1, self.sides + 1, size=(n, self.count))
+        if self.explode and self.sides > 1:
+            last = faces
+            for _ in range(MAX_EXPLOSIONS):
+                mask = last == self.sides
+                if not mask.any():
+                    break
+                last = np.zeros_like(faces)
+                last[mask] = rng.integers(1, self.sides + 1, size=int(mask.sum()))
+                faces = faces + last
+        return faces
+
+    def kept(self, faces):
+        """The kept dice of each roll, shape (n, keep)"""
+        if self.keep == self.count:
+            return faces
+        ordered = np.sort(faces, axis=1)
+        return ordered[:, self.count - self.keep:] if self.keep_highest else ordered[:, :self.keep]
+
+    def totals(self, faces):
+        return self.sign * self.kept(faces).sum(axis=1)
+
+    def die_distribution(self):
+        """Exact value distribution of a single die: (lowest value, probabilities)"""
+        if not self.explode or self.sides == 1:
+            return 1, np.full(self.sides, 1.0 / self.sides)
+        # Compounding: after j explosions the die shows j*sides + r with r < sides
+        depth = int(np.ceil(-np.log(EXPLODE_TAIL_PROBABILITY) / np.log(self.sides)))
+        pmf = np.zeros(depth * self.sides)
+        for j in range(depth):
+            pmf[j * self.sides:(j + 1) * self.sides - 1] = self.sides ** -(j + 1.0)
+        return 1, pmf / pmf.sum()
+
+    def exact_work(self):
+        """Estimated element operations of ``distribution()``; only keep/drop groups are costly"""
+        if self.keep == self.count:
+            return 0
+        return _keep_work(len(self.die_distribution()[1]), self.count, self.keep)
+
+    def distribution(self):
+        """Exact distribution of this group's (signed) total: (lowest value, probabilities)"""
+        low, die = self.die_distribution()
+        if self.keep == self.count:
+            offset, pmf = self.count * low, _power(die, self.count)
+        else:
+            offset, pmf = _keep_distribution(low, die, self.count, self.keep, self.keep_highest)
+        if self.sign < 0:
+            return -(offset + len(pmf) - 1), pmf[::-1]
+        return offset, pmf
+
+
+class Constant:
+    def __init__(self, value, sign=1):
+        self.value = value
+        self.sign = sign
+
+    @property
+    def notation(self):
+        return str(self.value)
+
+
+class RollResult:
+    """Outcome of rolling an expression ``n`` times"""
+
+    def __init__(self, expression, totals, faces):
+        self.expression = expression
+        self.totals = totals
+        # One (n, count) array per DiceGroup in expression.groups
+        self.faces = faces
+
+    def __len__(self):
+        return len(self.totals)
+
+    def details(self, index=0):
+        """
+        Individual dice of one roll
+
+        Returns:
+            list: one dict per die with its sides, value and whether it counted
+        """
+        dice = []
+        for group, faces in zip(self.expression.groups, self.faces):
+            row = faces[index]
+            kept = np.zeros(group.count, dtype=bool)
+            order = np.argsort(row, kind='stable')
+            kept[order[group.count - group.keep:] if group.keep_highest else order[:group.keep]] = True
+            for value, is_kept in zip(row.tolist(), kept.tolist()):
+                dice.append({
+                    'sides': group.sides,
+                    'value': value,
+                    'kept': is_kept,
+                    'sign': group.sign,
+                })
+        return dice
+
+    def summary(self):
+        totals = self.totals
+        values, counts = np.unique(totals, return_counts=True)
+        return {
+            'min': int(totals.min()),
+            'max': int(totals.max()),
+            'mean': float(totals.mean()),
+            'std': float(totals.std()),
+            'histogram': {int(v): int(c) for v, c in zip(values, counts)},
+        }
+
+
+class DiceExpression:
+    """Compiled dice expression: a signed sum of dice groups and constants"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.groups = [term for term in terms if isinstance(term, DiceGroup)]
+        self.constant = sum(term.sign * term.value for term in terms if isinstance(term, Constant))
+
+    @property
+    def notation(self):
+        text = ''
+        for term in self.terms:
+            sign = '-' if term.sign < 0 else '+'
+            text += (sign if text or sign == '-' else '') + term.notation
+        return text
+
+    def roll(self, n=1, rng=None):
+        """
+        Roll the expression ``n`` times at once
+
+        Args:
+            n: Number of independent rolls
+            rng: Optional numpy Generator (a fresh OS-seeded one by default)
+
+        Returns:
+            RollResult
+        """
+        if not 1 <= n <= MAX_ROLLS:
+            raise DiceError(f"Es können zwischen 1 und {MAX_ROLLS} Würfe auf einmal gemacht werden.")
+        if n * sum(group.count for group in self.groups) > MAX_DICE_CELLS:
+            raise DiceError("Zu viele Würfel für eine Anfrage.")
+        rng = rng or np.random.default_rng()
+        totals = np.full(n, self.constant, dtype=np.int64)
+        faces = []
+        for group in self.groups:
+            group_faces = group.roll_faces(rng, n)
+            totals += group.totals(group_faces)
+            faces.append(group_faces)
+        return RollResult(self, totals, faces)
+
+
+def _convolve(a, b):
+    """Linear convolution of two probability vectors, via FFT when they are large"""
+    if len(a) * len(b) <= 250000:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    result = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)
+    return np.clip(result, 0, None)
+
+
+def _power(pmf, n):
+    """Distribution of the sum of ``n`` independent draws from ``pmf``"""
+    size = n * (len(pmf) - 1) + 1
+    if size > MAX_EXACT_SUPPORT:
+        raise DiceError("Ausdruck ist zu groß für eine exakte Verteilung.")
+    if n == 1:
+        return pmf.copy()
+    # One FFT raised to the n-th power is a single n-fold convolution
+    result = np.clip(np.fft.irfft(np.fft.rfft(pmf, size) ** n, size), 0, None)
+    return result / result.sum()
+
+
+def _keep_work(faces, count, keep):
+    # faces * (count + 1) * (count + 2) / 2 row updates, each keep * faces wide
+    return faces * (count + 1) * (count + 2) // 2 * (keep * (faces - 1) + 1)
+
+
+def _keep_distribution(low, die, count, keep, keep_highest):
+    """
+    Exact distribution of the sum of the ``keep`` highest (or lowest) of ``count`` dice
+
+    Walks the die faces from best to worst, deciding how many of the dice show
+    each face. ``dp[n, s]`` is the probability that ``n`` dice have been given
+    a face so far and the kept ones among them sum to ``s``.
+    """
+    faces = len(die)
+    if _keep_work(faces, count, keep) > MAX_EXACT_KEEP_WORK or keep * faces > MAX_EXACT_SUPPORT:
+        raise DiceError("Ausdruck ist zu groß für eine exakte Verteilung.")
+
+    binom = np.zeros((count + 1, count + 1))
+    for n in range(count + 1):
+        binom[n, 0] = 1
+        for c in range(1, n + 1):
+            binom[n, c] = binom[n - 1, c - 1] + binom[n - 1, c]
+
+    max_sum = keep * (faces - 1)  # sums are relative to keep * low
+    dp = np.zeros((count + 1, max_sum + 1))
+    dp[0, 0] = 1.0
+    order = range(faces - 1, -1, -1) if keep_highest else range(faces)
+    for face in order:
+        p = die[face]
+        if p == 0:
+            continue
+        new = np.zeros_like(dp)
+        for n in range(count + 1):
+            row = dp[n]
+            if not row.any():
+                continue
+            for c in range(count - n + 1):
+                weight = binom[count - n, c] * p ** c
+                kept = min(c, max(keep - n, 0))
+                shift = kept * face
+                if shift:
+                    new[n + c, shift:] += weight * row[:-shift]
+                else:
+                    new[n + c] += weight * row
+        dp = new
+    pmf = dp[count]
+    return keep * low, pmf / pmf.sum()
+
+
+class Distribution:
+    """Exact probability distribution of a dice expression's total"""
+
+    def __init__(self, offset, pmf):
+        self.offset = offset
+        self.pmf = pmf
+        self.pmf.setflags(write=False)
+        self.values = np.arange(offset, offset + len(pmf))
+        self.values.setflags(write=False)
+        self.cdf = np.cumsum(pmf)
+        self.cdf.setflags(write=False)
+        self.mean = float(np.dot(self.values, pmf))
+        self.variance = float(np.dot((self.values - self.mean) ** 2, pmf))
+
+    def percentile(self, q):
+        """Smallest total whose cumulative probability reaches ``q`` percent"""
+        index = int(np.searchsorted(self.cdf, q / 100.0 - 1e-12))
+        return int(self.values[min(index, len(self.values) - 1)])
+
+    def to_dict(self, percentiles=(5, 25, 50, 75, 95), min_probability=1e-9):
+        visible = self.pmf >= min_probability
+        return {
+            'min': int(self.values[visible][0]),
+            'max': int(self.values[visible][-1]),
+            'mean': self.mean,
+            'variance': self.variance,
+            'std': self.variance ** 0.5,
+            'percentiles': {f'{q:g}': self.percentile(q) for q in percentiles},
+            'values': self.values[visible].tolist(),
+            'probabilities': self.pmf[visible].tolist(),
+        }
+
+
+def normalize_expression(expression):
+    """Canonical spelling used as cache key: lowercase, no spaces, ``d`` for ``W``"""
+    text = re.sub(r'\s+', '', str(expression or '')).lower().replace('w', 'd')
+    if text and text[0] not in '+-':
+        text = '+' + text
+    return text
+
+
+def _parse_group(count, sides, modifiers, sign):
+    count = int(count) if count else 1
+    sides = 100 if sides == '%' else int(sides)
+    if not 1 <= count <= MAX_DICE_PER_GROUP:
+        raise DiceError(f"Anzahl der Würfel muss zwischen 1 und {MAX_DICE_PER_GROUP} liegen.")
+    if not 1 <= sides <= MAX_SIDES:
+        raise DiceError(f"Würfel müssen zwischen 1 und {MAX_SIDES} Seiten haben.")
+
+    keep, keep_highest, explode = None, True, False
+    for match in _MODIFIER_RE.finditer(modifiers):
+        op, amount, bang = match.groups()
+        if bang:
+            explode = True
+            continue
+        if keep is not None:
+            raise DiceError("Pro Würfelgruppe ist nur ein Behalten/Streichen erlaubt.")
+        amount = int(amount)
+        if amount > count:
+            raise DiceError(f"Es können nicht {amount} von {count} Würfeln behalten oder gestrichen werden.")
+        if op in ('k', 'kh'):
+            keep, keep_highest = amount, True
+        elif op == 'kl':
+            keep, keep_highest = amount, False
+        elif op == 'dh':
+            keep, keep_highest = count - amount, False
+        else:  # 'd' / 'dl'
+            keep, keep_highest = count - amount, True
+    if keep == 0:
+        raise DiceError("Mindestens ein Würfel muss behalten werden.")
+    return DiceGroup(count, sides, keep, keep_highest, explode, sign)
+
+
+@lru_cache(maxsize=1024)
+def _compile(normalized):
+    if len(normalized) > MAX_EXPRESSION_LENGTH:
+        raise DiceError(f"Würfelausdrücke dürfen höchstens {MAX_EXPRESSION_LENGTH} Zeichen lang sein.")
+    terms = []
+    pos = 0
+    while pos < len(normalized):
+        match = _TERM_RE.match(normalized, pos)
+        if not match:
+            raise DiceError(f"Ungültiger Würfelausdruck bei '{normalized[pos:]}'.")
+        sign = -1 if match.group(1) == '-' else 1
+        if match.group(5) is not None:
+            value = int(match.group(5))
+            if value > MAX_CONSTANT:
+                raise DiceError(f"Zahlen dürfen höchstens {MAX_CONSTANT} sein.")
+            terms.append(Constant(value, sign))
+        else:
+            terms.append(_parse_group(match.group(2), match.group(3), match.group(4), sign))
+        pos = match.end()
+
+    if not terms:
+        raise DiceError("Leerer Würfelausdruck.")
+    if len(terms) > MAX_TERMS:
+        raise DiceError(f"Höchstens {MAX_TERMS} Bestandteile pro Ausdruck.")
+    return DiceExpression(terms)
+
+
+@lru_cache(maxsize=256)
+def _distribution(normalized):
+    expression = _compile(normalized)
+    # Checked up front, so an expression of many groups that are each just
+    # below the limit is refused before any of them is computed
+    if sum(group.exact_work() for group in expression.groups) > MAX_EXACT_KEEP_WORK:
+        raise DiceError("Ausdruck ist zu groß für eine exakte Verteilung.")
+    offset, pmf = expression.constant, np.ones(1)
+    for group in expression.groups:
+        group_offset, group_pmf = group.distribution()
+        offset += group_offset
+        pmf = _convolve(pmf, group_pmf)
+        if len(pmf) > MAX_EXACT_SUPPORT:
+            raise DiceError("Ausdruck ist zu groß für eine exakte Verteilung.")
+    return Distribution(offset, pmf / pmf.sum())
+
+
+def dice_distribution(expression):
+    """
+    Exact distribution of a dice expression, memoized per normalized expression
+
+    Raises:
+        DiceError: if the expression is malformed or too large to compute exactly
+    """
+    return _distribution(normalize_expression(expression))
+
+
+def parse_dice(expression):
+    """
+    Compile a dice expression, reusing the cached AST for equivalent spellings
+
+    Raises:
+        DiceError: if the expression is malformed or too large
+    """
+    return _compile(normalize_expression(expression))
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .chat_writer import ChatWriteBatcher
+
+
+def pack_faces(result, index=0):
+    """
+    Pack the dice of one roll into bytes, groups in expression order
+
+    Faces are stored as little-endian uint16, or uint32 if an exploding die
+    went past 65535. The width is recovered from the payload length and the
+    expression's dice count, so it does not need its own column.
+    """
+    faces = np.concatenate([group_faces[index] for group_faces in result.faces])
+    dtype = '<u2' if faces.max(initial=0) <= 0xFFFF else '<u4'
+    return faces.astype(dtype).tobytes()
+
+
+def unpack_faces(data, dice_count):
+    """Inverse of ``pack_faces``: a flat array of ``dice_count`` face values"""
+    if not dice_count:
+        return np.zeros(0, dtype=np.int64)
+    dtype = '<u2' if len(data) == 2 * dice_count else '<u4'
+    return np.frombuffer(data, dtype=dtype).astype(np.int64)
+
+
+class _Histograms:
+    """Face counts per (key, sides): one counts array of length sides + 1 per entry"""
+
+    __slots__ = ('counts', 'rolls')
+
+    def __init__(self):
+        self.counts = {}
+        self.rolls = {}
+
+    def add(self, keys, sides, faces):
+        for s in np.unique(sides).tolist():
+            mask = sides == s
+            uniq, inverse = np.unique(keys[mask], return_inverse=True)
+            counts = np.bincount(
+                inverse * (s + 1) + faces[mask], minlength=len(uniq) * (s + 1)
+            ).reshape(len(uniq), s + 1)
+            for key, row in zip(uniq.tolist(), counts):
+                per_key = self.counts.setdefault(key, {})
+                if s in per_key:
+                    per_key[s] += row
+                else:
+                    per_key[s] = row.copy()
+
+    def add_rolls(self, keys):
+        uniq, counts = np.unique(keys, return_counts=True)
+        for key, count in zip(uniq.tolist(), counts.tolist()):
+            self.rolls[key] = self.rolls.get(key, 0) + count
+
+
+def describe_faces(sides, counts):
+    """
+    Summary of one die size's observed faces against a fair die
+
+    Returns:
+        dict: number of dice, mean vs. expected mean, rate of natural maximums
+              (crits) and ones, the per-face counts and a chi-square statistic
+    """
+    observed = counts[1:]
+    n = int(observed.sum())
+    expected = n / sides
+    faces = np.arange(1, sides + 1)
+    return {
+        'sides': sides,
+        'count': n,
+        'mean': float(np.dot(faces, observed) / n) if n else None,
+        'expected_mean': (sides + 1) / 2,
+        'crit_rate': float(observed[-1] / n) if n else None,
+        'fumble_rate': float(observed[0] / n) if n else None,
+        'expected_rate': 1 / sides,
+        'histogram': observed.tolist(),
+        'chi_square': float(((observed - expected) ** 2 / expected).sum()) if n else None,
+        'degrees_of_freedom': sides - 1,
+    }
+
+
+class _CampaignStats:
+    __slots__ = ('last_id', 'users', 'sessions')
+
+    def __init__(self):
+        self.last_id = 0
+        self.users = _Histograms()
+        self.sessions = _Histograms()
+
+
+class DiceStatsCache:
+    """
+    Per-campaign dice statistics aggregated incrementally from the roll log.
+
+    Each campaign remembers the id of the last roll it has seen, so a refresh
+    only has to load newer rolls (an index range scan) and fold them in with
+    a few vectorized bincounts. That requires rolls to be committed in id
+    order, which ``insert_dice_rolls`` guarantees. Only the ``max_campaigns`` most recently used
+    campaigns are kept.
+
+    Only natural faces are counted: groups of exploding dice are skipped since
+    their compounded values say nothing about the die itself.
+    """
+
+    def __init__(self, max_campaigns=128):
+        self.max_campaigns = max_campaigns
+        self._lock = threading.Lock()
+        self._campaigns = OrderedDict()
+
+    def last_id(self, campaign_id):
+        with self._lock:
+            stats = self._campaigns.get(campaign_id)
+            return stats.last_id if stats is not None else 0
+
+    def add(self, campaign_id, rolls):
+        """
+        Fold newly loaded rolls into a campaign's statistics
+
+        Args:
+            campaign_id: Campaign the rolls belong to
+            rolls: (roll_id, user_id, session_id, expression, faces) tuples in
+                   id order; ``expression`` is a compiled DiceExpression and
+                   ``faces`` the unpacked face values
+        """
+        with self._lock:
+            stats = self._campaigns.get(campaign_id)
+            if stats is None:
+                stats = self._campaigns[campaign_id] = _CampaignStats()
+            self._campaigns.move_to_end(campaign_id)
+            while len(self._campaigns) > self.max_campaigns:
+                self._campaigns.popitem(last=False)
+
+            rolls = [roll for roll in rolls if roll[0] > stats.last_id]
+            if not rolls:
+                return
+
+            users, sessions, sides, faces = [], [], [], []
+            for _, user_id, session_id, expression, roll_faces in rolls:
+                offset = 0
+                for group in expression.groups:
+                    if not group.explode:
+                        group_faces = roll_faces[offset:offset + group.count]
+                        faces.append(group_faces)
+                        sides.append(np.full(group.count, group.sides))
+                        users.append(np.full(group.count, user_id))
+                        sessions.append(np.full(group.count, -1 if session_id is None else session_id))
+                    offset += group.count
+
+            roll_users = np.array([roll[1] for roll in rolls])
+            roll_sessions = np.array([roll[2] for roll in rolls if roll[2] is not None], dtype=np.int64)
+            stats.users.add_rolls(roll_users)
+            stats.sessions.add_rolls(roll_sessions)
+            if faces:
+                users, sessions = np.concatenate(users), np.concatenate(sessions)
+                sides, faces = np.concatenate(sides), np.concatenate(faces)
+                stats.users.add(users, sides, faces)
+                in_session = sessions >= 0
+                stats.sessions.add(sessions[in_session], sides[in_session], faces[in_session])
+            stats.last_id = rolls[-1][0]
+
+    def summary(self, campaign_id):
+        """
+        Returns:
+            dict: 'players' and 'sessions', each mapping an id to its roll count
+                  and a ``describe_faces`` entry per die size
+        """
+        with self._lock:
+            stats = self._campaigns.get(campaign_id)
+            if stats is None:
+                return {'players': {}, 'sessions': {}}
+            result = {}
+            for name, histograms in (('players', stats.users), ('sessions', stats.sessions)):
+                result[name] = {
+                    key: {
+                        'rolls': histograms.rolls.get(key, 0),
+                        'dice': [describe_faces(s, counts) for s, counts in sorted(per_key.items())],
+                    }
+                    for key, per_key in histograms.counts.items()
+                }
+            return result
+
+    def invalidate(self, campaign_id):
+        with self._lock:
+            self._campaigns.pop(campaign_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._campaigns.clear()
+
+
+dice_stats = DiceStatsCache()
+# Rolls are logged fire-and-forget, so a longer linger costs no request latency
+dice_log_writer = ChatWriteBatcher(max_batch=500, linger=0.05, config_prefix='DICE_LOG', name='dice-log-writer')
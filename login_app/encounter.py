@@ -0,0 +1,305 @@
+"""
+Monte Carlo encounter simulator.
+
+Runs many independent combats between a party and a group of monsters at
+once. Every combat is one row of the state arrays (hit points, initiative
+order), and each initiative slot of a round is resolved for all combats with
+a handful of NumPy operations, so tens of thousands of fights take about as
+many Python steps as a single one.
+
+Rules are deliberately simple: everyone rolls initiative once, then on their
+turn attacks a random conscious enemy ``attacks`` times. An attack hits if
+d20 + attack bonus reaches the target's AC; a natural 20 always hits and rolls
+the damage dice twice, a natural 1 always misses. A combatant at 0 HP is out.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .dice import DiceError, parse_dice
+
+MAX_COMBATANTS = 30
+MAX_ATTACKS = 10
+MAX_SIMULATIONS = 200000
+MAX_ROUNDS = 100
+MAX_HP = 100000
+# Bound for AC, attack bonus and initiative bonus (either sign)
+MAX_STAT = 1000
+# Dice rolled by one damage expression; crits roll them twice
+MAX_DAMAGE_DICE = 100
+# Runs larger than this are split across the process pool, if one is configured
+POOL_THRESHOLD = 20000
+# Upper bound for combats * attacks * (combatants + damage dice) per batch,
+# keeps per-round arrays (including the damage dice faces) small
+MAX_BATCH_CELLS = 2000000
+
+_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class EncounterError(ValueError):
+    """Raised for malformed or oversized encounter descriptions"""
+
+
+class Combatant:
+    """Stat block of one party member or monster"""
+
+    def __init__(self, name, side, hp, ac, attack_bonus, damage, attacks=1, initiative=0):
+        self.name = name
+        self.side = side
+        self.hp = hp
+        self.ac = ac
+        self.attack_bonus = attack_bonus
+        self.damage = damage
+        self.attacks = attacks
+        self.initiative = initiative
+
+    @classmethod
+    def from_dict(cls, data, side):
+        try:
+            combatant = cls(
+                name=str(data.get('name') or ('Held' if side == 0 else 'Monster'))[:100],
+                side=side,
+                hp=int(data['hp']),
+                ac=int(data['ac']),
+                attack_bonus=int(data.get('attack_bonus', 0)),
+                damage=parse_dice(str(data['damage'])),
+                attacks=int(data.get('attacks', 1)),
+                initiative=int(data.get('initiative', 0)),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            if isinstance(e, DiceError):
+                raise EncounterError(f"Ungültiger Schaden für {data.get('name', 'Kämpfer')}: {e}")
+            raise EncounterError("Jeder Kämpfer braucht hp, ac und damage als Zahlen bzw. Würfelausdruck.")
+        stats = (combatant.ac, combatant.attack_bonus, combatant.initiative)
+        if (not 1 <= combatant.hp <= MAX_HP or not 1 <= combatant.attacks <= MAX_ATTACKS
+                or any(abs(stat) > MAX_STAT for stat in stats)):
+            raise EncounterError(f"Ungültige Werte für {combatant.name}.")
+        if combatant.dice_count > MAX_DAMAGE_DICE:
+            raise EncounterError(f"Schaden von {combatant.name} darf höchstens {MAX_DAMAGE_DICE} Würfel haben.")
+        return combatant
+
+    @property
+    def dice_count(self):
+        return sum(group.count for group in self.damage.groups)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'hp': self.hp,
+            'ac': self.ac,
+            'attack_bonus': self.attack_bonus,
+            'damage': self.damage.notation,
+            'attacks': self.attacks,
+            'initiative': self.initiative,
+        }
+
+
+def parse_encounter(party, monsters):
+    """
+    Build the combatant list from JSON stat blocks
+
+    Monsters may carry a ``count`` to add several identical copies, which are
+    numbered ("Goblin 1", "Goblin 2", ...).
+
+    Raises:
+        EncounterError: if a stat block is malformed or the fight is too large
+    """
+    if not party or not monsters:
+        raise EncounterError("Gruppe und Monster dürfen nicht leer sein.")
+    combatants = []
+    for side, blocks in ((0, party), (1, monsters)):
+        for block in blocks:
+            if not isinstance(block, dict):
+                raise EncounterError("Ungültiger Werteblock.")
+            try:
+                count = int(block.get('count', 1))
+            except (TypeError, ValueError):
+                raise EncounterError("Ungültige Anzahl.")
+            if not 1 <= count <= MAX_COMBATANTS:
+                raise EncounterError("Ungültige Anzahl.")
+            combatant = Combatant.from_dict(block, side)
+            for i in range(count):
+                copy = Combatant(**{**vars(combatant), 'name': f"{combatant.name} {i + 1}" if count > 1 else combatant.name})
+                combatants.append(copy)
+            if len(combatants) > MAX_COMBATANTS:
+                raise EncounterError(f"Höchstens {MAX_COMBATANTS} Kämpfer pro Begegnung.")
+    return combatants
+
+
+def _roll_totals(expression, rng, n, dice_only=False):
+    """Roll an expression ``n`` times; ``dice_only`` leaves out the constant (crit dice)"""
+    totals = np.zeros(n, dtype=np.int64) if dice_only else np.full(n, expression.constant, dtype=np.int64)
+    for group in expression.groups:
+        totals += group.totals(group.roll_faces(rng, n))
+    return totals
+
+
+def _simulate(combatants, n, rng):
+    """
+    Run ``n`` combats, in batches small enough to bound memory use
+
+    Returns:
+        tuple: (winner, rounds, hp) arrays; winner is 0 (party), 1 (monsters)
+               or -1 (round limit reached), hp has shape (n, combatants)
+    """
+    # Per combat and round: a d20 and a target per attack slot, plus the damage
+    # dice of every slot rolled twice (normal and critical)
+    max_attacks = max(c.attacks for c in combatants)
+    cells = max_attacks * (len(combatants) + 2 * sum(c.dice_count for c in combatants))
+    batch = max(1, MAX_BATCH_CELLS // cells)
+    parts = [_simulate_batch(combatants, min(batch, n - start), rng) for start in range(0, n, batch)]
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def _simulate_batch(combatants, n, rng):
+    count = len(combatants)
+    side = np.array([c.side for c in combatants])
+    ac = np.array([c.ac for c in combatants])
+    bonus = np.array([c.attack_bonus for c in combatants])
+    attacks = np.array([c.attacks for c in combatants])
+    max_attacks = int(attacks.max())
+    is_enemy = side[:, None] != side[None, :]
+
+    hp = np.tile(np.array([c.hp for c in combatants], dtype=np.int32), (n, 1))
+    initiative = rng.integers(1, 21, size=(n, count)) + np.array([c.initiative for c in combatants])
+    # Ties go to the higher bonus, then randomly
+    tiebreak = rng.random((n, count)) + np.array([c.initiative for c in combatants])
+    order = np.lexsort((-tiebreak, -initiative), axis=1)
+    rounds = np.zeros(n, dtype=np.int64)
+    # Indices of combats still running; finished ones drop out of all further work
+    live = np.arange(n)
+
+    for _ in range(MAX_ROUNDS):
+        live_hp = hp[live]
+        alive = live_hp > 0
+        running = (alive & (side == 0)).any(axis=1) & (alive & (side == 1)).any(axis=1)
+        live, live_hp = live[running], live_hp[running]
+        m = len(live)
+        if not m:
+            break
+        rounds[live] += 1
+        live_order = order[live]
+        rows = np.arange(m)
+
+        # Everything random about this round, drawn up front for all combats
+        d20 = rng.integers(1, 21, size=(m, count, max_attacks), dtype=np.int8)
+        # Damage of a critical hit adds the dice once more, without the constant
+        damage = np.stack([
+            _roll_totals(c.damage, rng, m * max_attacks).reshape(m, -1) for c in combatants
+        ], axis=1).astype(np.int32)
+        crit_damage = damage + np.stack([
+            _roll_totals(c.damage, rng, m * max_attacks, dice_only=True).reshape(m, -1) for c in combatants
+        ], axis=1).astype(np.int32)
+
+        for slot in range(count):
+            attacker = live_order[:, slot]
+            enemy = is_enemy[attacker]
+            # Random target among conscious enemies: highest priority that is still a valid target
+            priority = rng.random((m, count), dtype=np.float32)
+            can_attack = live_hp[rows, attacker] > 0
+            for a in range(max_attacks):
+                targets = enemy & (live_hp > 0)
+                target = np.argmax(np.where(targets, priority, -1), axis=1)
+                can_act = can_attack & (attacks[attacker] > a) & targets[rows, target]
+                if not can_act.any():
+                    break
+                roll = d20[rows, attacker, a]
+                crit = roll == 20
+                hit = can_act & (roll != 1) & (crit | (roll + bonus[attacker] >= ac[target]))
+                dealt = np.where(crit, crit_damage[rows, attacker, a], damage[rows, attacker, a])
+                live_hp[rows, target] -= np.where(hit, np.maximum(dealt, 0), 0)
+        hp[live] = live_hp
+
+    alive = hp > 0
+    party_up = (alive & (side == 0)).any(axis=1)
+    monsters_up = (alive & (side == 1)).any(axis=1)
+    winner = np.where(party_up & ~monsters_up, 0, np.where(monsters_up & ~party_up, 1, -1))
+    return winner, rounds, np.maximum(hp, 0)
+
+
+def _simulate_chunk(blocks, n, seed):
+    # Runs in a pool worker; combatants travel as plain dicts
+    combatants = [Combatant(**dict(block, damage=parse_dice(block['damage']))) for block in blocks]
+    return _simulate(combatants, n, np.random.default_rng(seed))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(processes):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=processes)
+        return _pool
+
+
+def _distribution(values):
+    values = np.asarray(values)
+    if not len(values):
+        return None
+    return {
+        'mean': float(values.mean()),
+        'percentiles': {str(q): float(v) for q, v in zip(_PERCENTILES, np.percentile(values, _PERCENTILES))},
+    }
+
+
+def simulate_encounter(combatants, n=10000, processes=0, seed=None):
+    """
+    Simulate ``n`` independent fights and summarize the outcome
+
+    Args:
+        combatants: List of Combatant (see ``parse_encounter``)
+        n: Number of simulated fights
+        processes: Size of the process pool used for runs above POOL_THRESHOLD;
+                   0 runs everything in the calling thread
+        seed: Optional seed for reproducible results
+
+    Returns:
+        dict: win/loss/draw rates, round count and hit point distributions
+    """
+    if not 1 <= n <= MAX_SIMULATIONS:
+        raise EncounterError(f"Es können zwischen 1 und {MAX_SIMULATIONS} Kämpfe simuliert werden.")
+
+    if processes > 1 and n > POOL_THRESHOLD:
+        chunks = np.array_split(np.arange(n), processes)
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        blocks = [dict(vars(c), damage=c.damage.notation) for c in combatants]
+        futures = [
+            _get_pool(processes).submit(_simulate_chunk, blocks, len(chunk), s)
+            for chunk, s in zip(chunks, seeds)
+        ]
+        parts = [future.result() for future in futures]
+        winner, rounds, hp = (np.concatenate(arrays) for arrays in zip(*parts))
+    else:
+        winner, rounds, hp = _simulate(combatants, n, np.random.default_rng(seed))
+
+    side = np.array([c.side for c in combatants])
+    finished = winner >= 0
+    party_hp = hp[:, side == 0].sum(axis=1)
+    monster_hp = hp[:, side == 1].sum(axis=1)
+
+    def describe(index, c):
+        return dict(
+            c.to_dict(),
+            survival_rate=float((hp[:, index] > 0).mean()),
+            hp_remaining=_distribution(hp[:, index]),
+        )
+
+    return {
+        'simulations': n,
+        'party_win_rate': float((winner == 0).mean()),
+        'monster_win_rate': float((winner == 1).mean()),
+        'draw_rate': float((winner == -1).mean()),
+        'rounds': dict(
+            _distribution(rounds[finished]) or {'mean': None, 'percentiles': {}},
+            histogram={int(r): int(c) for r, c in zip(*np.unique(rounds[finished], return_counts=True))},
+        ),
+        'party_hp_remaining': _distribution(party_hp),
+        'party_hp_remaining_on_win': _distribution(party_hp[winner == 0]),
+        'monster_hp_remaining': _distribution(monster_hp),
+        'party': [describe(i, c) for i, c in enumerate(combatants) if c.side == 0],
+        'monsters': [describe(i, c) for i, c in enumerate(combatants) if c.side == 1],
+    }
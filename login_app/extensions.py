@@ -2,9 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_cors import CORS
-from supabase import create_client
-import os
 from dotenv import load_dotenv
+# Supabase clients are pooled per worker process
+from .supabase_client import get_supabase, get_supabase_auth, supabase_pool
 
 # Load environment variables
 load_dotenv()
@@ -15,12 +15,3 @@ login_manager = LoginManager()
 migrate = Migrate(db=db)
 cors = CORS()
 
-# Initialize Supabase client
-def get_supabase():
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_KEY')
-    
-    if not supabase_url or not supabase_key:
-        raise ValueError("Supabase URL and Key must be set in environment variables")
-    
-    return create_client(supabase_url, supabase_key)
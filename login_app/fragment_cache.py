@@ -0,0 +1,113 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    """
+    Rendered template fragments in a thread-safe LRU bounded by memory.
+
+    Entries are evicted least recently used first once their total size
+    passes ``max_bytes`` or their number passes ``max_entries``. Keys carry
+    the entity's ``updated_at`` (the campaign page: its snapshot's content
+    hash), so an edit simply makes new keys and the old fragments age out;
+    nothing has to be invalidated explicitly.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_entries=4096):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.setdefault('FRAGMENT_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_entries = app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, html):
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (html, size)
+            self._size += size
+            while self._size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fragments': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """
+    ``{% cache 'npc', npc.id, npc.updated_at, viewer_role %}...{% endcache %}``
+
+    Renders the body once per distinct key and serves it from the
+    application's FragmentCache afterwards. The key must cover everything
+    the body depends on: entity id, its ``updated_at`` and whatever about the
+    viewer changes the output (e.g. DM vs. player). Versions must come from
+    the data, never from when a process loaded it, so equal data maps to
+    equal keys in every worker. The template name is
+    added automatically. Without a configured cache the body is rendered as
+    usual.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', [nodes.Tuple(args, 'load')]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        cache = getattr(self.environment, 'fragment_cache', None)
+        if cache is None:
+            return caller()
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return html
+
+
+fragment_cache = FragmentCache()
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from .models import User, Campaign, Character, db
 from .extensions import get_supabase
+from .chat_cache import invalidate_sender
+from .user_cache import user_cache
 from datetime import datetime
 import os
 
@@ -68,6 +70,9 @@ def update_profile():
                     current_user.profile_pic = filename
         
         db.session.commit()
+        # Drop snapshots other threads may have cached while the commit was pending
+        user_cache.invalidate(current_user.id)
+        invalidate_sender(current_user.id)
         flash('Profile updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,54 @@
+from types import MappingProxyType
+
+from flask import g, has_app_context
+
+from .ttl_cache import TTLCache
+
+
+class MembershipIndex:
+    """
+    Campaign roles of each user, for O(1) access checks.
+
+    Maps every campaign a user runs or plays in to ``'dm'`` or ``'player'``.
+    Lookups are memoized on ``flask.g`` for the rest of the request and kept
+    in a small process-wide LRU for ``MEMBERSHIP_CACHE_TTL`` seconds, so most
+    requests need no query at all. Routes that change memberships call
+    ``invalidate``; other workers pick the change up once the TTL expires.
+    """
+
+    def __init__(self, ttl=10, max_users=4096):
+        self._cache = TTLCache(ttl, max_users, config_prefix='MEMBERSHIP_CACHE')
+
+    def init_app(self, app):
+        self._cache.init_app(app)
+
+    def roles(self, user_id, load):
+        """
+        Read-only mapping of campaign id to the user's role in it
+
+        Args:
+            user_id: User to look up
+            load: Callable returning ``{campaign_id: role}`` from the database
+        """
+        request_cache = g.setdefault('campaign_roles', {}) if has_app_context() else {}
+        if user_id in request_cache:
+            return request_cache[user_id]
+
+        roles = self._cache.get(user_id)
+        if roles is None:
+            roles = MappingProxyType(dict(load(user_id)))
+            self._cache.set(user_id, roles)
+
+        request_cache[user_id] = roles
+        return roles
+
+    def invalidate(self, user_id):
+        self._cache.invalidate(user_id)
+        if has_app_context():
+            g.get('campaign_roles', {}).pop(user_id, None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+membership_index = MembershipIndex()
@@ -2,6 +2,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
+from .membership import membership_index
 from .supabase_client import get_supabase
 
 class User(UserMixin, db.Model):
@@ -69,7 +70,7 @@ class Campaign(db.Model):
     
     def has_access(self, user):
         """Check if user has access to this campaign"""
-        return self.dm_id == user.id or user in self.players
+        return self.dm_id == user.id or self.id in membership_index.roles(user.id, _load_campaign_roles)
     
     def get_character_for_user(self, user_id):
         """Get the character for a user in this campaign"""
@@ -84,6 +85,15 @@ player_campaign = db.Table('player_campaign',
     db.Column('campaign_id', db.String(255), db.ForeignKey('campaigns.id'), primary_key=True)
 )
 
+def _load_campaign_roles(user_id):
+    rows = db.session.execute(
+        db.select(Campaign.id, Campaign.dm_id).where(db.or_(
+            Campaign.dm_id == user_id,
+            Campaign.id.in_(db.select(player_campaign.c.campaign_id).where(player_campaign.c.user_id == user_id))
+        ))
+    ).all()
+    return {campaign_id: 'dm' if dm_id == user_id else 'player' for campaign_id, dm_id in rows}
+
 class Character(db.Model):
     __tablename__ = 'characters'
     
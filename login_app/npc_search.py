@@ -0,0 +1,184 @@
+import re
+from sqlalchemy import text
+
+from .chat_search import SEARCH_CONFIG, fts5_query
+
+# Weighted search document: name (A) > tags, race, gender (B) > notes (C) >
+# appearance, personality, background (D). ts_rank's default weights rank
+# them in that order. The index is only used if queries spell the
+# expression exactly the same way.
+_POSTGRES_DOCUMENT = f"""(
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(tags, '') || ' ' || coalesce(race, '') || ' ' || coalesce(gender, '')), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(notes, '')), 'C') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(appearance, '') || ' ' || coalesce(personality, '') || ' ' || coalesce(background, '')), 'D')
+)"""
+
+_POSTGRES_INDEX = f"""
+CREATE INDEX IF NOT EXISTS ix_npc_search_fts
+ON npc USING gin ({_POSTGRES_DOCUMENT})
+"""
+
+# Substring matches on names (typos, partial words) via pg_trgm. Optional:
+# without the extension the same LIKE still works, just unindexed.
+_POSTGRES_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_npc_name_trgm ON npc USING gin (lower(name) gin_trgm_ops)",
+]
+
+_SQLITE_COLUMNS = ('name', 'tags', 'race', 'gender', 'notes', 'appearance', 'personality', 'background')
+
+# bm25 weights in the order of _SQLITE_COLUMNS
+_SQLITE_WEIGHTS = '10.0, 5.0, 5.0, 5.0, 2.0, 1.0, 1.0, 1.0'
+
+_columns = ', '.join(_SQLITE_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in _SQLITE_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in _SQLITE_COLUMNS)
+
+# External-content FTS5 table kept in sync with the npc table by triggers
+_SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS npc_fts
+    USING fts5({_columns}, content='npc', content_rowid='id')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS npc_fts_insert AFTER INSERT ON npc BEGIN
+        INSERT INTO npc_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS npc_fts_delete AFTER DELETE ON npc BEGIN
+        INSERT INTO npc_fts(npc_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS npc_fts_update AFTER UPDATE OF {_columns} ON npc BEGIN
+        INSERT INTO npc_fts(npc_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO npc_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+]
+
+_POSTGRES_SEARCH = text(f"""
+SELECT npc.id,
+       ts_rank({_POSTGRES_DOCUMENT}, query)
+       + CASE WHEN lower(name) LIKE :like THEN 1.0 ELSE 0.0 END AS rank
+FROM npc, to_tsquery('{SEARCH_CONFIG}', :query) AS query
+WHERE npc.campaign_id = :campaign_id
+  AND ({_POSTGRES_DOCUMENT} @@ query OR lower(name) LIKE :like OR npc.age = :age)
+  AND (NOT :important_only OR npc.is_important)
+  AND (:tag_id IS NULL OR npc.id IN (
+      SELECT entity_id FROM entity_tag WHERE tag_id = :tag_id AND entity_type = 'npc'))
+ORDER BY rank DESC, npc.name, npc.id
+LIMIT :limit OFFSET :offset
+""")
+
+_SQLITE_SEARCH = text(f"""
+SELECT npc.id, max(hits.rank) AS rank
+FROM (
+    SELECT npc_fts.rowid AS id, -bm25(npc_fts, {_SQLITE_WEIGHTS}) AS rank
+    FROM npc_fts
+    WHERE npc_fts MATCH :query
+    UNION ALL
+    SELECT npc.id, 0.0 FROM npc WHERE npc.campaign_id = :campaign_id AND npc.age = :age
+) AS hits
+JOIN npc ON npc.id = hits.id
+WHERE npc.campaign_id = :campaign_id
+  AND (NOT :important_only OR npc.is_important)
+  AND (:tag_id IS NULL OR npc.id IN (
+      SELECT entity_id FROM entity_tag WHERE tag_id = :tag_id AND entity_type = 'npc'))
+GROUP BY npc.id
+ORDER BY rank DESC, npc.name, npc.id
+LIMIT :limit OFFSET :offset
+""")
+
+
+def ensure_npc_search_index(engine):
+    """
+    Create the NPC search index if it is missing
+
+    Postgres gets a GIN index over the weighted ``tsvector`` and, where the
+    ``pg_trgm`` extension can be installed, a trigram index on names. SQLite
+    gets an FTS5 table plus triggers, filled from existing NPCs on first
+    creation. Other databases are left alone and searches return nothing.
+    """
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text(_POSTGRES_INDEX))
+        try:
+            with engine.begin() as conn:
+                for statement in _POSTGRES_TRIGRAM:
+                    conn.execute(text(statement))
+        except Exception as e:
+            print(f"pg_trgm not available, NPC name substring search stays unindexed: {str(e)}")
+    elif dialect == 'sqlite':
+        with engine.begin() as conn:
+            # Without its triggers the table may have missed writes; refill it then
+            in_sync = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'npc_fts_update'")
+            ).first()
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(text(statement))
+            if not in_sync:
+                conn.execute(text("INSERT INTO npc_fts(npc_fts) VALUES ('rebuild')"))
+
+
+def _tsquery(query):
+    """Turn free text into a tsquery that matches all words (last one as prefix)"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    words[-1] += ':*'
+    return ' & '.join(words)
+
+
+def _like_pattern(query):
+    escaped = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_npcs(session, campaign_id, query, limit, offset=0, important_only=False, tag_id=None):
+    """
+    Ranked search over one campaign's NPCs
+
+    Matches name, tags, race, gender, notes, appearance, personality and
+    background; a purely numeric query also matches the age exactly.
+
+    Args:
+        session: SQLAlchemy session
+        campaign_id: Campaign to search in
+        query: Free text as typed by the user
+        limit: Maximum number of hits to return
+        offset: Number of hits to skip (for pagination)
+        important_only: Only return NPCs marked as important
+        tag_id: Only return NPCs carrying this tag (see the entity_tag index)
+
+    Returns:
+        list: (npc_id, rank) tuples, best match first
+    """
+    dialect = session.get_bind().dialect.name
+    # Digits beyond an integer column's range can't be an age anyway
+    age = int(query) if query.isdecimal() and len(query) < 10 else None
+    params = {
+        'campaign_id': campaign_id,
+        'age': age,
+        'important_only': bool(important_only),
+        'tag_id': tag_id,
+        'limit': limit,
+        'offset': offset,
+    }
+    if dialect == 'postgresql':
+        statement = _POSTGRES_SEARCH
+        params['query'] = _tsquery(query)
+        params['like'] = _like_pattern(query)
+    elif dialect == 'sqlite':
+        statement = _SQLITE_SEARCH
+        params['query'] = fts5_query(query)
+    else:
+        return []
+    if params['query'] is None:
+        return []
+
+    rows = session.execute(statement, params).all()
+    return [(row.id, row.rank) for row in rows]
@@ -1,16 +1,207 @@
 import os
+import threading
+
+import httpx
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from gotrue import SyncMemoryStorage
+from gotrue.http_clients import SyncClient as AuthHttpClient
+from storage3.utils import SyncClient as StorageHttpClient
+from supabase import Client, SupabaseAuthClient, SupabaseStorageClient
+from supabase.lib.client_options import DEFAULT_HEADERS, ClientOptions
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the Supabase client
+
+class _PooledTransport(httpx.HTTPTransport):
+    """Keep-alive connection pool shared by all Supabase HTTP clients, counting requests"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    def handle_request(self, request):
+        with self._lock:
+            self.requests += 1
+        try:
+            return super().handle_request(request)
+        except httpx.TransportError:
+            with self._lock:
+                self.failures += 1
+            raise
+
+    def connection_counts(self):
+        # httpx keeps its httpcore pool private; report nothing rather than fail
+        connections = list(getattr(getattr(self, '_pool', None), 'connections', None) or [])
+        return len(connections), sum(1 for c in connections if c.is_idle())
+
+
+class _PooledStorageClient(SupabaseStorageClient):
+    def __init__(self, url, headers, timeout, transport):
+        self._transport = transport
+        super().__init__(url, headers, timeout)
+
+    def _create_session(self, base_url, headers, timeout, *args):
+        # Newer storage3 versions also pass ``verify``; TLS settings live on the transport
+        return StorageHttpClient(base_url=base_url, headers=headers, timeout=timeout, transport=self._transport)
+
+
+class _PooledClient(Client):
+    """Supabase client whose auth and storage requests go through the shared pool"""
+
+    def __init__(self, supabase_url, supabase_key, options, pool):
+        # Set before Client.__init__, which already builds the auth client
+        self._pool = pool
+        super().__init__(supabase_url, supabase_key, options)
+
+    def _init_supabase_auth_client(self, auth_url, client_options):
+        return self._pool._new_auth_client(auth_url, client_options.headers)
+
+    def _init_storage_client(self, storage_url, headers, storage_client_timeout):
+        return _PooledStorageClient(storage_url, headers, storage_client_timeout, self._pool._transport)
+
+
+class SupabasePool:
+    """
+    One Supabase client per worker process, on a keep-alive connection pool.
+
+    ``client()`` lazily builds a single shared client (storage, database) the
+    first time it is needed and hands the same instance to every caller, so
+    requests reuse open TLS connections instead of paying a handshake each.
+    The client never signs anybody in, so its requests always carry the
+    project key.
+
+    Sign-in, sign-up, sign-out and password changes keep the user's session
+    on the auth client itself. Those flows use ``auth_session()``, which
+    returns a fresh, cheap auth client per call that still sends its requests
+    through the shared pool, so no session ever leaks between users.
+
+    A worker forked after the pool was created (e.g. ``gunicorn --preload``)
+    builds its own pool instead of sharing the parent's sockets.
+    """
+
+    def __init__(self, max_connections=20, max_keepalive=10, keepalive_expiry=30.0, timeout=10.0):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._transport = None
+        self._auth_http = None
+        self._client = None
+        self._counts = {'clients_created': 0, 'client_calls': 0, 'auth_sessions': 0}
+
+    def init_app(self, app):
+        self.max_connections = app.config.setdefault('SUPABASE_POOL_MAX_CONNECTIONS', self.max_connections)
+        self.max_keepalive = app.config.setdefault('SUPABASE_POOL_MAX_KEEPALIVE', self.max_keepalive)
+        self.keepalive_expiry = app.config.setdefault('SUPABASE_POOL_KEEPALIVE_EXPIRY', self.keepalive_expiry)
+        self.timeout = app.config.setdefault('SUPABASE_TIMEOUT', self.timeout)
+        self.close()
+
+    @staticmethod
+    def _credentials():
+        supabase_url = os.getenv('SUPABASE_URL')
+        supabase_key = os.getenv('SUPABASE_KEY')
+
+        if not supabase_url or not supabase_key:
+            raise ValueError("Supabase URL and Key must be set in environment variables")
+
+        return supabase_url, supabase_key
+
+    def _ensure_pool(self):
+        # Caller holds self._lock
+        if self._pid == os.getpid() and self._transport is not None:
+            return
+        self._transport = _PooledTransport(limits=httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        ))
+        self._auth_http = AuthHttpClient(transport=self._transport, timeout=self.timeout)
+        self._client = None
+        self._pid = os.getpid()
+
+    def _new_auth_client(self, auth_url, headers):
+        # No refresh timer and no shared storage: the session lives only as
+        # long as this auth client, i.e. one request
+        return SupabaseAuthClient(
+            url=auth_url,
+            headers=dict(headers),
+            auto_refresh_token=False,
+            persist_session=False,
+            storage=SyncMemoryStorage(),
+            http_client=self._auth_http,
+        )
+
+    def client(self):
+        """The shared Supabase client of this worker, created on first use"""
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            with self._lock:
+                self._counts['client_calls'] += 1
+            return client
+
+        supabase_url, supabase_key = self._credentials()
+        with self._lock:
+            self._ensure_pool()
+            if self._client is None:
+                options = ClientOptions(
+                    auto_refresh_token=False,
+                    persist_session=False,
+                    postgrest_client_timeout=self.timeout,
+                    storage_client_timeout=self.timeout,
+                )
+                self._client = _PooledClient(supabase_url, supabase_key, options, self)
+                self._counts['clients_created'] += 1
+            self._counts['client_calls'] += 1
+            return self._client
+
+    def auth_session(self):
+        """A new auth client with its own session state, on the shared pool"""
+        supabase_url, supabase_key = self._credentials()
+        with self._lock:
+            self._ensure_pool()
+            self._counts['auth_sessions'] += 1
+        headers = dict(DEFAULT_HEADERS, apiKey=supabase_key, Authorization=f'Bearer {supabase_key}')
+        return self._new_auth_client(f'{supabase_url}/auth/v1', headers)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(
+                self._counts,
+                max_connections=self.max_connections,
+                max_keepalive=self.max_keepalive,
+                requests=0,
+                failures=0,
+                connections=0,
+                idle_connections=0,
+            )
+            transport = self._transport if self._pid == os.getpid() else None
+        if transport is not None:
+            stats['requests'] = transport.requests
+            stats['failures'] = transport.failures
+            stats['connections'], stats['idle_connections'] = transport.connection_counts()
+        return stats
+
+    def close(self):
+        """Drop the client and close the pooled connections"""
+        with self._lock:
+            transport, owned = self._transport, self._pid == os.getpid()
+            self._transport = self._auth_http = self._client = None
+            self._pid = None
+        if transport is not None and owned:
+            transport.close()
+
+
+supabase_pool = SupabasePool()
+
+
 def get_supabase():
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_KEY')
-    
-    if not supabase_url or not supabase_key:
-        raise ValueError("Supabase URL and Key must be set in environment variables")
-    
-    return create_client(supabase_url, supabase_key)
+    return supabase_pool.client()
+
+
+def get_supabase_auth():
+    return supabase_pool.auth_session()
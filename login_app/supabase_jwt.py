@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import jwt
+from flask import current_app, request, session
+from flask_login import current_user, logout_user
+
+from .supabase_client import get_supabase_auth
+
+SESSION_ACCESS_TOKEN = 'supabase_access_token'
+SESSION_REFRESH_TOKEN = 'supabase_refresh_token'
+
+
+class TokenError(ValueError):
+    """Raised when an access token is malformed, forged or signed with an unknown key"""
+
+
+class TokenExpired(TokenError):
+    """Raised when an otherwise valid access token has expired"""
+
+
+class SupabaseTokenVerifier:
+    """
+    Local verification of Supabase access tokens.
+
+    When ``SUPABASE_JWT_VERIFY`` is on, login stores the user's access and
+    refresh token in the Flask session. Every request then checks the access
+    token's signature, expiry, audience and subject against the logged-in
+    user before the view runs. A user whose token is missing or invalid is
+    logged out. That includes a session restored only from a remember-me
+    cookie.
+
+    Signatures are checked against ``SUPABASE_JWT_SECRET`` (HS256 projects),
+    or against the project's JWKS (asymmetric keys). The JWKS is fetched and
+    refreshed by a background thread, every ``SUPABASE_JWKS_REFRESH`` seconds
+    and early when a token names an unknown key id. Validation itself never
+    touches the network, and neither does renewal: once an access token has
+    less than ``SUPABASE_REFRESH_BEFORE`` seconds left, the refresh call runs
+    on a background thread while the request goes on with the current token.
+    The next request of that user stores the new tokens in its session cookie
+    (only a response can rewrite it). An already expired token (an idle tab)
+    is accepted only while its renewal is still running; once that renewal
+    has failed, the user is logged out. Requests of this process that present
+    the same refresh token share one call and its result (for
+    ``SUPABASE_REFRESH_REUSE`` seconds), so no tab replays a rotated token.
+
+    For tests or air-gapped setups, ``SUPABASE_JWKS`` may hold the key set
+    itself (dict or JSON string). No thread is started then, and tokens
+    signed locally with the matching private key verify offline.
+    """
+
+    def __init__(self, audience='authenticated', leeway=30, jwks_refresh=3600, min_refresh_interval=60,
+                 refresh_before=300, refresh_reuse=3600):
+        self.audience = audience
+        self.leeway = leeway
+        self.jwks_refresh = jwks_refresh
+        self.min_refresh_interval = min_refresh_interval
+        self.refresh_before = refresh_before
+        self.refresh_reuse = refresh_reuse
+        # refresh token -> (Future of the renewed auth session, monotonic start time)
+        self._refreshes = {}
+        self._executor = None
+        self.enabled = False
+        self.secret = None
+        self.jwks_url = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._thread = None
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('SUPABASE_JWT_VERIFY', False)
+        self.secret = app.config.setdefault('SUPABASE_JWT_SECRET', None)
+        self.audience = app.config.setdefault('SUPABASE_JWT_AUDIENCE', self.audience)
+        self.leeway = app.config.setdefault('SUPABASE_JWT_LEEWAY', self.leeway)
+        self.jwks_refresh = app.config.setdefault('SUPABASE_JWKS_REFRESH', self.jwks_refresh)
+        self.refresh_before = app.config.setdefault('SUPABASE_REFRESH_BEFORE', self.refresh_before)
+        self.refresh_reuse = app.config.setdefault('SUPABASE_REFRESH_REUSE', self.refresh_reuse)
+        jwks = app.config.setdefault('SUPABASE_JWKS', None)
+        supabase_url = os.getenv('SUPABASE_URL')
+        default_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json" if supabase_url else None
+        self.jwks_url = app.config.setdefault('SUPABASE_JWKS_URL', default_url)
+
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = 0.0
+        if jwks:
+            self.set_keys(json.loads(jwks) if isinstance(jwks, str) else jwks)
+            self.jwks_url = None
+        if self.enabled:
+            app.before_request(self._check_request)
+
+    def set_keys(self, jwks):
+        """Replace the cached verification keys with a JWKS document"""
+        keys = {}
+        for data in jwks.get('keys', []):
+            try:
+                key = jwt.PyJWK(data)
+            except jwt.PyJWTError:
+                continue
+            keys[data.get('kid')] = (key.key, data.get('alg'))
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def _ensure_refresher(self):
+        # Started lazily so every gunicorn worker gets its own thread after forking
+        if not self.jwks_url:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                response = httpx.get(
+                    self.jwks_url,
+                    headers={'apikey': os.getenv('SUPABASE_KEY', '')},
+                    timeout=10,
+                )
+                response.raise_for_status()
+                self.set_keys(response.json())
+                delay = self.jwks_refresh
+            except Exception as e:
+                print(f"Error refreshing Supabase JWKS: {str(e)}")
+                delay = self.min_refresh_interval
+            self._wake.wait(delay)
+            self._wake.clear()
+            # Early wake-ups (unknown key id) are rate limited
+            with self._lock:
+                wait = self._fetched_at + self.min_refresh_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def _key_for(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e))
+        algorithm = header.get('alg')
+        if algorithm in ('HS256', 'HS384', 'HS512'):
+            if not self.secret:
+                raise TokenError("No JWT secret configured")
+            return self.secret, algorithm
+
+        self._ensure_refresher()
+        with self._lock:
+            key, key_algorithm = self._keys.get(header.get('kid'), (None, None))
+        if key is None:
+            self._wake.set()
+            raise TokenError("Unknown signing key")
+        if key_algorithm and key_algorithm != algorithm:
+            raise TokenError("Signing algorithm does not match the key")
+        return key, algorithm
+
+    def verify(self, token, verify_exp=True):
+        """
+        Check an access token's signature and claims without any network access
+
+        Args:
+            token: Encoded access token
+            verify_exp: Pass False to accept an expired but otherwise valid token
+
+        Returns:
+            dict: The token's claims
+
+        Raises:
+            TokenExpired: if the token has expired
+            TokenError: for any other invalid token
+        """
+        key, algorithm = self._key_for(token)
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                leeway=self.leeway,
+                options={'require': ['exp', 'sub'], 'verify_exp': verify_exp},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenExpired(str(e))
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e))
+
+    def remember(self, auth_session):
+        """Store the tokens of a fresh Supabase session in the Flask session"""
+        if not self.enabled or auth_session is None:
+            return
+        session[SESSION_ACCESS_TOKEN] = auth_session.access_token
+        session[SESSION_REFRESH_TOKEN] = auth_session.refresh_token
+
+    def forget(self):
+        session.pop(SESSION_ACCESS_TOKEN, None)
+        session.pop(SESSION_REFRESH_TOKEN, None)
+
+    def _renewal(self, refresh_token, start=False):
+        """
+        The background renewal of ``refresh_token`` (running or finished), a
+        newly started one if ``start`` is set, or None
+        """
+        now = time.monotonic()
+        with self._lock:
+            for token, (future, started) in list(self._refreshes.items()):
+                # Failed renewals may be retried sooner than results expire
+                failed = future.done() and future.exception() is not None
+                if now - started > (self.min_refresh_interval if failed else self.refresh_reuse):
+                    del self._refreshes[token]
+            entry = self._refreshes.get(refresh_token)
+            if entry is not None or not start:
+                return entry and entry[0]
+            # Created lazily so every gunicorn worker gets its own threads after forking
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='supabase-refresh')
+            future = self._executor.submit(self._call_refresh, refresh_token)
+            self._refreshes[refresh_token] = (future, now)
+            return future
+
+    @staticmethod
+    def _call_refresh(refresh_token):
+        return get_supabase_auth().refresh_session(refresh_token).session
+
+    def _session_claims(self):
+        refresh_token = session.get(SESSION_REFRESH_TOKEN)
+        renewal = self._renewal(refresh_token) if refresh_token else None
+        failed = False
+        if renewal is not None and renewal.done():
+            # Finished since this user's last request: install the new tokens
+            auth_session = None if renewal.exception() else renewal.result()
+            if auth_session is None:
+                current_app.logger.info(f'Supabase token refresh failed: {renewal.exception()}')
+                failed = True
+            else:
+                self.remember(auth_session)
+                refresh_token = auth_session.refresh_token
+
+        token = session.get(SESSION_ACCESS_TOKEN)
+        if not token:
+            return None
+        try:
+            claims = self.verify(token)
+        except TokenExpired:
+            if failed or not refresh_token:
+                return None
+            claims = self.verify(token, verify_exp=False)
+            self._renewal(refresh_token, start=True)
+            return claims
+        if refresh_token and not failed and claims['exp'] - time.time() < self.refresh_before:
+            self._renewal(refresh_token, start=True)
+        return claims
+
+    def _check_request(self):
+        if request.endpoint == 'static' or not current_user.is_authenticated:
+            return
+        claims = None
+        try:
+            claims = self._session_claims()
+        except TokenError as e:
+            current_app.logger.info(f'Rejected Supabase token: {str(e)}')
+
+        subject = str(getattr(current_user, 'supabase_uid', None) or current_user.get_id())
+        if claims is None or claims.get('sub') != subject:
+            self.forget()
+            logout_user()
+
+
+token_verifier = SupabaseTokenVerifier()
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU whose entries expire after ``ttl`` seconds.
+
+    Used for per-user values that are cheap to keep but cost queries on every
+    request. The cache is per process: routes that change the underlying data
+    ``invalidate`` the affected keys, and other workers catch up once the
+    entries expire. ``config_prefix`` names the ``<prefix>_TTL`` and
+    ``<prefix>_MAX_ENTRIES`` settings read by ``init_app``.
+    """
+
+    def __init__(self, ttl=60, max_entries=4096, config_prefix=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.config_prefix = config_prefix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        if self.config_prefix:
+            self.ttl = app.config.setdefault(f'{self.config_prefix}_TTL', self.ttl)
+            self.max_entries = app.config.setdefault(f'{self.config_prefix}_MAX_ENTRIES', self.max_entries)
+        self.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store ``value``; ``ttl`` may shorten (never extend) the default lifetime"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,115 @@
+from flask_login import UserMixin
+from sqlalchemy import inspect
+
+from .ttl_cache import TTLCache
+
+# Columns never copied into the shared cache; reading them loads the real row
+_PRIVATE_COLUMNS = frozenset({'password', 'password_hash'})
+
+
+class UserSnapshot(UserMixin):
+    """
+    Detached copy of a user's columns, used as ``current_user``.
+
+    Column values are served from the snapshot without touching the
+    database. Anything else (relationships, methods, private columns) is
+    read from the real row, which is loaded on first use. Assigning an
+    attribute writes it to the real row, so the usual
+    ``current_user.x = ...; db.session.commit()`` keeps working, and drops
+    the cached snapshot.
+    """
+
+    def __init__(self, values, fetch, on_change, model=None):
+        object.__setattr__(self, '_values', dict(values))
+        object.__setattr__(self, '_fetch', fetch)
+        object.__setattr__(self, '_on_change', on_change)
+        object.__setattr__(self, '_model', model)
+
+    def _get_model(self):
+        if self._model is None:
+            object.__setattr__(self, '_model', self._fetch())
+        return self._model
+
+    def __getattr__(self, name):
+        values = object.__getattribute__(self, '_values')
+        if name in values:
+            return values[name]
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._get_model(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_model(), name, value)
+        if name in self._values:
+            self._values[name] = value
+        self._on_change(self._values['id'])
+
+    def __eq__(self, other):
+        # Equal to the user's row and to other snapshots of the same user, so
+        # checks like ``current_user in campaign.players`` keep working
+        if isinstance(other, UserMixin):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    def __hash__(self):
+        return hash(self.get_id())
+
+    def __repr__(self):
+        return f"<UserSnapshot {self._values.get('id')}>"
+
+
+class UserCache:
+    """
+    Short-TTL cache of user snapshots for the Flask-Login ``user_loader``.
+
+    A cached user costs no query per request, which matters for polling
+    endpoints. Routes that change a user (profile, approval, admin flag,
+    login/logout) call ``invalidate``; other workers catch up after
+    ``USER_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, ttl=30, max_users=4096):
+        self._cache = TTLCache(ttl, max_users, config_prefix='USER_CACHE')
+
+    def init_app(self, app):
+        self._cache.init_app(app)
+
+    def load(self, user_id, fetch):
+        """
+        Args:
+            user_id: Id from the session cookie
+            fetch: Callable returning the ORM user (or None) for that id
+
+        Returns:
+            UserSnapshot or None
+        """
+        key = str(user_id)
+        values = self._cache.get(key)
+        if values is not None:
+            return UserSnapshot(values, fetch, self.invalidate)
+
+        user = fetch()
+        if user is None:
+            return None
+        values = {
+            attr.key: getattr(user, attr.key)
+            for attr in inspect(type(user)).column_attrs
+            if attr.key not in _PRIVATE_COLUMNS
+        }
+        self._cache.set(key, values)
+        return UserSnapshot(values, fetch, self.invalidate, model=user)
+
+    def invalidate(self, user_id):
+        self._cache.invalidate(str(user_id))
+
+    def clear(self):
+        self._cache.clear()
+
+
+user_cache = UserCache()
@@ -0,0 +1,8 @@
+-- Keyset pagination of chat history walks message(campaign_id, timestamp, id) backwards.
+-- Same index as Message.__table_args__; the message table itself is created by the app
+do $$
+begin
+  if to_regclass('public.message') is not null then
+    create index if not exists ix_message_campaign_timestamp_id on message(campaign_id, "timestamp", id);
+  end if;
+end $$;
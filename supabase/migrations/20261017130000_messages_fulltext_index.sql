@@ -0,0 +1,8 @@
+-- Full-text search over chat history; must match the expression in chat_search.py
+-- (also created there at startup, hence the same name). The message table is created by the app
+do $$
+begin
+  if to_regclass('public.message') is not null then
+    create index if not exists ix_message_content_fts on message using gin (to_tsvector('german', content));
+  end if;
+end $$;
@@ -0,0 +1,122 @@
+import json
+
+from login_app.chat_cache import ChatCache, SenderProfileCache
+
+
+def message(message_id, content='hallo'):
+    return {'id': message_id, 'content': content}
+
+
+def ids(messages):
+    return [m['id'] for m in messages]
+
+
+def test_prime_complete_history_answers_everything():
+    cache = ChatCache(per_campaign=10)
+    cache.prime(1, [message(i) for i in (3, 5, 8)], complete=True)
+
+    assert cache.last_id(1) == 8
+    assert ids(cache.get_latest(1, 50)) == [3, 5, 8]
+    assert ids(cache.get_after(1, 0, 50)) == [3, 5, 8]
+    assert ids(cache.get_before(1, 8, 50)) == [3, 5]
+
+
+def test_partial_buffer_defers_to_the_database():
+    cache = ChatCache(per_campaign=3)
+    cache.prime(1, [message(i) for i in range(1, 6)], complete=False)
+
+    # Only the newest three are kept; anything reaching further back is a miss
+    assert ids(cache.get_latest(1, 3)) == [3, 4, 5]
+    assert cache.get_latest(1, 4) is None
+    assert cache.get_after(1, 1, 10) is None
+    assert ids(cache.get_after(1, 2, 10)) == [3, 4, 5]
+    assert cache.get_before(1, 4, 5) is None
+
+
+def test_unknown_campaign_is_a_miss():
+    cache = ChatCache()
+    assert cache.last_id(7) is None
+    assert cache.get_latest(7, 10) is None
+    assert cache.get_after(7, 0, 10) is None
+    cache.extend(7, [message(1)])
+    assert cache.last_id(7) is None
+
+
+def test_extend_appends_and_evicts_the_oldest():
+    cache = ChatCache(per_campaign=3)
+    cache.prime(1, [message(1), message(2)], complete=True)
+    cache.extend(1, [message(3), message(4)])
+
+    assert ids(cache.get_latest(1, 3)) == [2, 3, 4]
+    # Message 1 fell out, so the buffer no longer claims the whole history
+    assert cache.get_after(1, 0, 10) is None
+    assert ids(cache.get_after(1, 1, 10)) == [2, 3, 4]
+
+
+def test_extend_merges_late_messages_in_id_order():
+    cache = ChatCache(per_campaign=4)
+    cache.prime(1, [message(2), message(5), message(7)], complete=True)
+    cache.extend(1, [message(9), message(6), message(6)])
+
+    assert ids(cache.get_latest(1, 4)) == [5, 6, 7, 9]
+    assert ids(cache.get_after(1, 5, 10)) == [6, 7, 9]
+
+
+def test_late_message_older_than_a_full_buffer_raises_the_floor():
+    cache = ChatCache(per_campaign=3)
+    cache.prime(1, [message(i) for i in (4, 5, 6)], complete=False)
+    cache.extend(1, [message(3)])
+
+    assert ids(cache.get_latest(1, 3)) == [4, 5, 6]
+    assert cache.get_after(1, 2, 10) is None
+    assert ids(cache.get_after(1, 3, 10)) == [4, 5, 6]
+
+
+def test_memory_limit_evicts_the_coldest_campaign():
+    one = len(json.dumps(message(1, 'x' * 100)))
+    cache = ChatCache(per_campaign=10, max_bytes=one * 3)
+    cache.prime(1, [message(1, 'x' * 100), message(2, 'x' * 100)], complete=True)
+    cache.prime(2, [message(3, 'x' * 100)], complete=True)
+    cache.get_latest(1, 1)  # campaign 1 is now the most recently used
+    cache.prime(3, [message(4, 'x' * 100)], complete=True)
+
+    assert cache.last_id(2) is None
+    assert cache.last_id(1) == 2
+    assert cache.last_id(3) == 4
+    assert cache.stats()['bytes'] <= one * 3
+
+
+def test_invalidate_and_stats():
+    cache = ChatCache()
+    cache.prime(1, [message(1)], complete=True)
+    cache.prime(2, [message(2), message(3)], complete=True)
+    cache.invalidate(1)
+
+    stats = cache.stats()
+    assert stats['campaigns'] == 1
+    assert stats['messages'] == 2
+    assert stats['bytes'] == sum(len(json.dumps(message(i))) for i in (2, 3))
+
+
+def test_sender_profiles_lookup_and_lru():
+    profiles = SenderProfileCache(max_campaigns=2)
+    profiles.update(1, {(10, None): {'sender_name': 'anna'}})
+
+    found, missing = profiles.lookup(1, {(10, None), (11, 4)})
+    assert found == {(10, None): {'sender_name': 'anna'}}
+    assert missing == {(11, 4)}
+
+    profiles.update(2, {(12, None): {}})
+    profiles.update(3, {(13, None): {}})
+    assert profiles.lookup(1, {(10, None)}) == ({}, {(10, None)})
+
+
+def test_sender_profiles_invalidate_user():
+    profiles = SenderProfileCache()
+    profiles.update(1, {(10, None): {}, (11, None): {}})
+    profiles.update(2, {(10, 3): {}})
+    profiles.update(3, {(11, 5): {}})
+
+    assert sorted(profiles.invalidate_user(10)) == [1, 2]
+    assert profiles.lookup(1, {(10, None), (11, None)})[1] == {(10, None)}
+    assert profiles.lookup(3, {(11, 5)})[1] == set()
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from login_app.dice import (
+    MAX_CONSTANT, MAX_DICE_CELLS, MAX_EXPRESSION_LENGTH, MAX_ROLLS, DiceError, normalize_expression, parse_dice,
+)
+
+
+def rng():
+    return np.random.default_rng(1234)
+
+
+@pytest.mark.parametrize('expression, notation', [
+    ('4d6kh3+2', '4d6kh3+2'),
+    ('4W6 k3 + 2', '4d6kh3+2'),
+    ('d20', '1d20'),
+    ('2d20kl1', '2d20kl1'),
+    ('4d6d1', '4d6kh3'),
+    ('4d6dh1', '4d6kl3'),
+    ('3d6!', '3d6!'),
+    ('d%', '1d100'),
+    ('-1d4+1d8-1', '-1d4+1d8-1'),
+])
+def test_parse_and_notation(expression, notation):
+    assert parse_dice(expression).notation == notation
+
+
+def test_equivalent_spellings_share_the_compiled_expression():
+    assert normalize_expression(' 1W20 + 5 ') == '+1d20+5'
+    assert parse_dice('1W20 + 5') is parse_dice('1d20+5')
+
+
+@pytest.mark.parametrize('expression', [
+    '', 'abc', '1d', '2d6+', '1d0', '0d6', '1001d6', '1d1001', '3d6kh4', '3d6d3', '3d6kh1kl1',
+    '+'.join(['1'] * 21),
+    str(MAX_CONSTANT + 1),
+    '1d6+' + '9' * 5000,
+    '1' * (MAX_EXPRESSION_LENGTH + 1),
+])
+def test_invalid_expressions_raise_dice_error(expression):
+    with pytest.raises(DiceError):
+        parse_dice(expression)
+
+
+def test_largest_constant_is_accepted():
+    assert parse_dice(f'1d6+{MAX_CONSTANT}').constant == MAX_CONSTANT
+
+
+def test_roll_totals_stay_in_range():
+    result = parse_dice('3d6+2').roll(5000, rng())
+    assert len(result) == 5000
+    assert result.totals.min() >= 5 and result.totals.max() <= 20
+    assert abs(result.totals.mean() - 12.5) < 0.2
+
+
+def test_keep_highest_sums_the_highest_dice():
+    expression = parse_dice('4d6kh3')
+    result = expression.roll(1000, rng())
+    faces = result.faces[0]
+    expected = faces.sum(axis=1) - faces.min(axis=1)
+    assert np.array_equal(result.totals, expected)
+
+
+def test_negative_groups_subtract():
+    result = parse_dice('-1d4').roll(1000, rng())
+    assert result.totals.min() >= -4 and result.totals.max() <= -1
+
+
+def test_exploding_dice_compound():
+    result = parse_dice('1d2!').roll(10000, rng())
+    faces = result.faces[0][:, 0]
+    # A 2 always explodes, so an exploded die never ends on an even total
+    assert (faces % 2 == 1).all()
+    assert faces.max() > 2
+
+
+def test_details_mark_kept_dice():
+    result = parse_dice('4d6kl1+1').roll(1, rng())
+    dice = result.details()
+    assert len(dice) == 4
+    assert sum(d['kept'] for d in dice) == 1
+    kept = [d['value'] for d in dice if d['kept']][0]
+    assert kept == min(d['value'] for d in dice)
+    assert result.totals[0] == kept + 1
+
+
+def test_summary():
+    summary = parse_dice('1d6').roll(600, rng()).summary()
+    assert 1 <= summary['min'] <= summary['max'] <= 6
+    assert sum(summary['histogram'].values()) == 600
+
+
+def test_roll_limits():
+    expression = parse_dice('1d6')
+    with pytest.raises(DiceError):
+        expression.roll(0)
+    with pytest.raises(DiceError):
+        expression.roll(MAX_ROLLS + 1)
+    with pytest.raises(DiceError):
+        parse_dice('1000d6').roll(MAX_DICE_CELLS // 1000 + 1)
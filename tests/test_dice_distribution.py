@@ -0,0 +1,92 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from login_app.dice import MAX_EXACT_KEEP_WORK, DiceError, _keep_work, dice_distribution, parse_dice
+
+
+def brute_force(expression):
+    """Exact distribution by enumerating every outcome (small expressions only)"""
+    counts = {}
+    compiled = parse_dice(expression)
+    faces = [itertools.product(range(1, g.sides + 1), repeat=g.count) for g in compiled.groups]
+    for outcome in itertools.product(*faces):
+        total = compiled.constant
+        for group, dice in zip(compiled.groups, outcome):
+            ordered = sorted(dice)
+            kept = ordered[group.count - group.keep:] if group.keep_highest else ordered[:group.keep]
+            total += group.sign * sum(kept)
+        counts[total] = counts.get(total, 0) + 1
+    outcomes = sum(counts.values())
+    return {total: count / outcomes for total, count in counts.items()}
+
+
+@pytest.mark.parametrize('expression', ['2d6', '4d6kh3', '2d20kl1', '3d4dh1', '1d8-1d4+2'])
+def test_matches_enumeration(expression):
+    distribution = dice_distribution(expression)
+    expected = brute_force(expression)
+    assert set(expected) <= set(distribution.values.tolist())
+    for value, probability in zip(distribution.values.tolist(), distribution.pmf.tolist()):
+        assert probability == pytest.approx(expected.get(value, 0.0), abs=1e-12)
+
+
+def test_moments_and_percentiles():
+    distribution = dice_distribution('2d6')
+    assert distribution.mean == pytest.approx(7)
+    assert distribution.variance == pytest.approx(35 / 6)
+    assert distribution.percentile(50) == 7
+    assert distribution.percentile(100) == 12
+
+    data = distribution.to_dict()
+    assert data['min'] == 2 and data['max'] == 12
+    assert sum(data['probabilities']) == pytest.approx(1)
+    assert data['percentiles']['50'] == 7
+
+
+def test_advantage():
+    distribution = dice_distribution('2d20kh1')
+    assert distribution.pmf[-1] == pytest.approx(39 / 400)
+
+
+def test_exploding_die_mean():
+    # A compounding d6 averages 3.5 * 6/5
+    assert dice_distribution('1d6!').mean == pytest.approx(4.2, rel=1e-9)
+
+
+def test_results_are_memoized_and_read_only():
+    distribution = dice_distribution('3d6')
+    assert dice_distribution(' 3W6 ') is distribution
+    with pytest.raises(ValueError):
+        distribution.pmf[0] = 1
+
+
+def test_large_plain_sums_are_exact():
+    distribution = dice_distribution('100d1000')
+    assert distribution.mean == pytest.approx(50050)
+
+
+def test_support_limit():
+    with pytest.raises(DiceError):
+        dice_distribution('1000d1000')
+
+
+@pytest.mark.parametrize('expression', ['44d1000kh22', '1000d2kh500', '+'.join(['25d100kh12'] * 3)])
+def test_costly_keep_expressions_are_refused(expression):
+    with pytest.raises(DiceError):
+        dice_distribution(expression)
+
+
+def test_keep_work_bound_counts_every_group():
+    group = parse_dice('25d100kh12').groups[0]
+    assert group.exact_work() == _keep_work(100, 25, 12)
+    # One such group is fine, three together are over the limit
+    assert group.exact_work() < MAX_EXACT_KEEP_WORK < 3 * group.exact_work()
+    assert dice_distribution('25d100kh12').mean > 12 * 50.5
+    assert parse_dice('40d100').groups[0].exact_work() == 0
+
+
+def test_sampled_rolls_follow_the_exact_distribution():
+    expression = '4d6kh3'
+    totals = parse_dice(expression).roll(50000, np.random.default_rng(7)).totals
+    assert totals.mean() == pytest.approx(dice_distribution(expression).mean, abs=0.05)
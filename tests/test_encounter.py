@@ -0,0 +1,100 @@
+import pytest
+
+from login_app.encounter import (
+    MAX_COMBATANTS, MAX_DAMAGE_DICE, MAX_HP, MAX_SIMULATIONS, MAX_STAT, EncounterError, parse_encounter,
+    simulate_encounter,
+)
+
+
+def fighter(**overrides):
+    block = {'name': 'Kriegerin', 'hp': 30, 'ac': 16, 'attack_bonus': 5, 'damage': '1d8+3'}
+    block.update(overrides)
+    return block
+
+
+def goblin(**overrides):
+    block = {'name': 'Goblin', 'hp': 7, 'ac': 13, 'attack_bonus': 4, 'damage': '1d6+2'}
+    block.update(overrides)
+    return block
+
+
+def test_parse_numbers_monster_copies():
+    combatants = parse_encounter([fighter()], [goblin(count=3)])
+    assert [c.name for c in combatants] == ['Kriegerin', 'Goblin 1', 'Goblin 2', 'Goblin 3']
+    assert [c.side for c in combatants] == [0, 1, 1, 1]
+    assert combatants[1].damage.notation == '1d6+2'
+    assert combatants[0].dice_count == 1
+
+
+@pytest.mark.parametrize('party, monsters', [
+    ([], [goblin()]),
+    ([fighter()], []),
+    ([fighter()], ['goblin']),
+    ([fighter()], [goblin(count=0)]),
+    ([fighter()], [goblin(count='viele')]),
+    ([fighter()], [goblin(count=MAX_COMBATANTS)]),
+    ([{'name': 'Ohne Werte'}], [goblin()]),
+    ([fighter(hp='viel')], [goblin()]),
+    ([fighter(damage='1d')], [goblin()]),
+    ([fighter(hp=0)], [goblin()]),
+    ([fighter(hp=MAX_HP + 1)], [goblin()]),
+    ([fighter(hp=10 ** 30)], [goblin()]),
+    ([fighter(ac=MAX_STAT + 1)], [goblin()]),
+    ([fighter(attack_bonus=-MAX_STAT - 1)], [goblin()]),
+    ([fighter(initiative=10 ** 20)], [goblin()]),
+    ([fighter(attacks=0)], [goblin()]),
+    ([fighter(damage=f'{MAX_DAMAGE_DICE + 1}d6')], [goblin()]),
+])
+def test_invalid_encounters_raise_encounter_error(party, monsters):
+    with pytest.raises(EncounterError):
+        parse_encounter(party, monsters)
+
+
+def test_simulation_is_reproducible_and_consistent():
+    combatants = parse_encounter([fighter()], [goblin(count=2)])
+    first = simulate_encounter(combatants, n=2000, seed=42)
+    second = simulate_encounter(combatants, n=2000, seed=42)
+    assert first == second
+
+    rates = first['party_win_rate'] + first['monster_win_rate'] + first['draw_rate']
+    assert rates == pytest.approx(1)
+    assert first['simulations'] == 2000
+    assert [m['name'] for m in first['monsters']] == ['Goblin 1', 'Goblin 2']
+    assert 0 <= first['party'][0]['survival_rate'] <= 1
+    assert sum(first['rounds']['histogram'].values()) <= 2000
+
+
+def test_overwhelming_side_wins():
+    combatants = parse_encounter(
+        [fighter(hp=500, attack_bonus=20, damage='10d10', attacks=3)],
+        [goblin()],
+    )
+    result = simulate_encounter(combatants, n=1000, seed=1)
+    assert result['party_win_rate'] == 1
+    assert result['monsters'][0]['survival_rate'] == 0
+    assert result['rounds']['histogram'] == {1: 1000}
+
+
+def test_hit_points_never_go_negative_or_above_maximum():
+    combatants = parse_encounter([fighter(hp=12)], [goblin(hp=12, damage='4d6+4')])
+    result = simulate_encounter(combatants, n=1000, seed=3)
+    for entry in result['party'] + result['monsters']:
+        percentiles = entry['hp_remaining']['percentiles'].values()
+        assert all(0 <= value <= 12 for value in percentiles)
+
+
+def test_many_damage_dice_run_in_small_batches():
+    combatants = parse_encounter(
+        [fighter(hp=MAX_HP, damage=f'{MAX_DAMAGE_DICE}d6', attacks=10) for _ in range(5)],
+        [goblin(hp=MAX_HP, damage=f'{MAX_DAMAGE_DICE}d6', attacks=10, count=5)],
+    )
+    result = simulate_encounter(combatants, n=200, seed=5)
+    assert result['simulations'] == 200
+
+
+def test_simulation_count_limits():
+    combatants = parse_encounter([fighter()], [goblin()])
+    with pytest.raises(EncounterError):
+        simulate_encounter(combatants, n=0)
+    with pytest.raises(EncounterError):
+        simulate_encounter(combatants, n=MAX_SIMULATIONS + 1)
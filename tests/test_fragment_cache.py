@@ -0,0 +1,47 @@
+from flask import Flask, render_template_string
+
+from login_app.fragment_cache import FragmentCache
+
+PAGE = "{% cache 'campaign', campaign_id, version %}{{ render() }}{% endcache %}"
+
+
+def make_app(cache):
+    app = Flask(__name__)
+    cache.init_app(app)
+    return app
+
+
+def test_body_is_rendered_once_per_key():
+    cache = FragmentCache()
+    app = make_app(cache)
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f'render {len(renders)}'
+
+    with app.app_context():
+        first = render_template_string(PAGE, campaign_id=1, version='abc', render=render)
+        again = render_template_string(PAGE, campaign_id=1, version='abc', render=render)
+        changed = render_template_string(PAGE, campaign_id=1, version='def', render=render)
+
+    assert first == again == 'render 1'
+    assert changed == 'render 2'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_memory_limit_evicts_the_oldest_fragments():
+    cache = FragmentCache(max_bytes=1000)
+    cache.set('a', 'x' * 400)
+    cache.set('b', 'y' * 400)
+    cache.set('c', 'z' * 400)
+
+    assert cache.get('a') is None
+    assert cache.get('c') == 'z' * 400
+    assert cache.stats()['bytes'] <= 1000
+
+
+def test_oversized_fragments_are_not_stored():
+    cache = FragmentCache(max_bytes=100)
+    cache.set('big', 'x' * 500)
+    assert cache.get('big') is None
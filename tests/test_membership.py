@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+
+from login_app.membership import MembershipIndex
+
+
+def make_index(app=None):
+    index = MembershipIndex(ttl=60)
+    index.init_app(app or Flask(__name__))
+    return index
+
+
+def counting_loader(roles):
+    calls = []
+
+    def load(user_id):
+        calls.append(user_id)
+        return roles.get(user_id, {})
+    return load, calls
+
+
+def test_roles_are_loaded_once_and_read_only():
+    index = make_index()
+    load, calls = counting_loader({1: {10: 'dm', 11: 'player'}})
+
+    roles = index.roles(1, load)
+    assert dict(roles) == {10: 'dm', 11: 'player'}
+    assert index.roles(1, load) is roles
+    assert calls == [1]
+    with pytest.raises(TypeError):
+        roles[12] = 'dm'
+
+
+def test_invalidate_reloads_in_the_next_request():
+    app = Flask(__name__)
+    index = make_index(app)
+    data = {1: {10: 'player'}}
+    load, calls = counting_loader(data)
+
+    with app.app_context():
+        assert dict(index.roles(1, load)) == {10: 'player'}
+    data[1] = {}
+    with app.app_context():
+        # Still cached across requests until invalidated
+        assert dict(index.roles(1, load)) == {10: 'player'}
+        index.invalidate(1)
+        assert dict(index.roles(1, load)) == {}
+    assert calls == [1, 1]
+
+
+def test_config_controls_the_ttl():
+    app = Flask(__name__)
+    app.config['MEMBERSHIP_CACHE_TTL'] = 0
+    index = make_index(app)
+    load, calls = counting_loader({})
+
+    index.roles(1, load)
+    index.roles(1, load)
+    assert calls == [1, 1]
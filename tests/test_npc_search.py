@@ -0,0 +1,143 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from login_app.npc_search import ensure_npc_search_index, search_npcs
+
+# Just the columns the search reads
+SCHEMA = [
+    """
+    CREATE TABLE npc (
+        id INTEGER PRIMARY KEY,
+        campaign_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        tags TEXT, race TEXT, gender TEXT, notes TEXT,
+        appearance TEXT, personality TEXT, background TEXT,
+        age INTEGER,
+        is_important BOOLEAN NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE TABLE entity_tag (tag_id INTEGER, entity_type TEXT, entity_id INTEGER)",
+]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    return engine
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+def add_npc(engine, campaign_id, name, **columns):
+    columns = dict(columns, campaign_id=campaign_id, name=name)
+    names = ', '.join(columns)
+    values = ', '.join(f':{column}' for column in columns)
+    with engine.begin() as conn:
+        return conn.execute(text(f"INSERT INTO npc ({names}) VALUES ({values})"), columns).lastrowid
+
+
+def names(engine, hits):
+    with engine.connect() as conn:
+        by_id = dict(conn.execute(text("SELECT id, name FROM npc")).all())
+    return [by_id[npc_id] for npc_id, _ in hits]
+
+
+def test_name_matches_rank_above_other_fields(engine, session):
+    ensure_npc_search_index(engine)
+    add_npc(engine, 1, 'Bauer Hans', notes='hat einen Drachen gesehen')
+    add_npc(engine, 1, 'Drachenmeisterin Ilse')
+    add_npc(engine, 1, 'Schmied', tags='drachen, feuer')
+    add_npc(engine, 1, 'Wirt')
+
+    assert names(engine, search_npcs(session, 1, 'drach', 10)) == [
+        'Drachenmeisterin Ilse', 'Schmied', 'Bauer Hans',
+    ]
+
+
+def test_all_words_must_match(engine, session):
+    ensure_npc_search_index(engine)
+    add_npc(engine, 1, 'Alte Hexe', race='Mensch')
+    add_npc(engine, 1, 'Junge Hexe', race='Elf')
+
+    assert names(engine, search_npcs(session, 1, 'hexe elf', 10)) == ['Junge Hexe']
+
+
+def test_results_stay_within_the_campaign(engine, session):
+    ensure_npc_search_index(engine)
+    add_npc(engine, 1, 'Goblin')
+    add_npc(engine, 2, 'Goblin')
+
+    hits = search_npcs(session, 2, 'goblin', 10)
+    assert len(hits) == 1
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT campaign_id FROM npc WHERE id = :id"), {'id': hits[0][0]}).scalar() == 2
+
+
+def test_numeric_query_matches_age(engine, session):
+    ensure_npc_search_index(engine)
+    add_npc(engine, 1, 'Greis', age=87)
+    add_npc(engine, 1, 'Kind', age=8)
+
+    assert names(engine, search_npcs(session, 1, '87', 10)) == ['Greis']
+    assert search_npcs(session, 1, '9' * 30, 10) == []
+
+
+def test_important_and_tag_filters(engine, session):
+    ensure_npc_search_index(engine)
+    wache = add_npc(engine, 1, 'Wache Nord', is_important=True)
+    add_npc(engine, 1, 'Wache Süd')
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO entity_tag VALUES (5, 'npc', :id)"), {'id': wache})
+
+    assert names(engine, search_npcs(session, 1, 'wache', 10, important_only=True)) == ['Wache Nord']
+    assert names(engine, search_npcs(session, 1, 'wache', 10, tag_id=5)) == ['Wache Nord']
+    assert search_npcs(session, 1, 'wache', 10, tag_id=6) == []
+
+
+def test_paging(engine, session):
+    ensure_npc_search_index(engine)
+    for i in range(5):
+        add_npc(engine, 1, f'Soldat {i}')
+
+    first = search_npcs(session, 1, 'soldat', 3)
+    rest = search_npcs(session, 1, 'soldat', 3, offset=3)
+    assert len(first) == 3 and len(rest) == 2
+    assert not {npc_id for npc_id, _ in first} & {npc_id for npc_id, _ in rest}
+
+
+def test_index_follows_updates_and_deletes(engine, session):
+    ensure_npc_search_index(engine)
+    npc_id = add_npc(engine, 1, 'Händlerin')
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE npc SET notes = 'verkauft Tränke' WHERE id = :id"), {'id': npc_id})
+    assert names(engine, search_npcs(session, 1, 'tränke', 10)) == ['Händlerin']
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM npc WHERE id = :id"), {'id': npc_id})
+    assert search_npcs(session, 1, 'tränke', 10) == []
+    assert search_npcs(session, 1, 'händlerin', 10) == []
+
+
+def test_existing_npcs_are_indexed_on_creation(engine, session):
+    add_npc(engine, 1, 'Bürgermeister')
+    ensure_npc_search_index(engine)
+    ensure_npc_search_index(engine)
+
+    assert names(engine, search_npcs(session, 1, 'bürger', 10)) == ['Bürgermeister']
+
+
+def test_queries_without_words_find_nothing(engine, session):
+    ensure_npc_search_index(engine)
+    add_npc(engine, 1, 'Wirt')
+
+    assert search_npcs(session, 1, '"?*', 10) == []
+    assert search_npcs(session, 1, '', 10) == []
@@ -0,0 +1,220 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+from flask_login import LoginManager, UserMixin, current_user
+
+from login_app import supabase_jwt
+from login_app.supabase_jwt import SupabaseTokenVerifier, TokenError, TokenExpired
+
+SECRET = 'test-secret'
+KID = 'test-key'
+
+
+@pytest.fixture(scope='module')
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def verifier(private_key):
+    public = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    public.update(kid=KID, alg='RS256')
+    app = Flask(__name__)
+    app.config['SUPABASE_JWKS'] = {'keys': [public]}
+    app.config['SUPABASE_JWT_SECRET'] = SECRET
+    verifier = SupabaseTokenVerifier()
+    verifier.init_app(app)
+    return verifier
+
+
+def claims(expires_in=60, **overrides):
+    data = {'sub': 'user-1', 'aud': 'authenticated', 'exp': int(time.time()) + expires_in}
+    data.update(overrides)
+    return data
+
+
+def rs256(private_key, payload, kid=KID):
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+def test_valid_rs256_token(verifier, private_key):
+    assert verifier.verify(rs256(private_key, claims()))['sub'] == 'user-1'
+
+
+def test_valid_hs256_token(verifier):
+    token = jwt.encode(claims(), SECRET, algorithm='HS256')
+    assert verifier.verify(token)['sub'] == 'user-1'
+
+
+def test_expired_tokens(verifier, private_key):
+    with pytest.raises(TokenExpired):
+        verifier.verify(rs256(private_key, claims(expires_in=-120)))
+    with pytest.raises(TokenExpired):
+        verifier.verify(jwt.encode(claims(expires_in=-120), SECRET, algorithm='HS256'))
+
+
+def test_expiry_within_leeway_is_accepted(verifier):
+    token = jwt.encode(claims(expires_in=-5), SECRET, algorithm='HS256')
+    assert verifier.verify(token)['sub'] == 'user-1'
+
+
+def test_forged_hs256_token(verifier):
+    token = jwt.encode(claims(), 'not-the-secret', algorithm='HS256')
+    with pytest.raises(TokenError) as excinfo:
+        verifier.verify(token)
+    assert not isinstance(excinfo.value, TokenExpired)
+
+
+def test_forged_rs256_token(verifier):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(TokenError):
+        verifier.verify(rs256(other_key, claims()))
+
+
+def test_tampered_payload(verifier, private_key):
+    header, _, signature = rs256(private_key, claims()).split('.')
+    payload = jwt.utils.base64url_encode(json.dumps(claims(sub='admin')).encode()).decode()
+    with pytest.raises(TokenError):
+        verifier.verify(f'{header}.{payload}.{signature}')
+
+
+def test_unknown_key_id(verifier, private_key):
+    with pytest.raises(TokenError):
+        verifier.verify(rs256(private_key, claims(), kid='rotated-away'))
+
+
+def test_wrong_audience_and_missing_subject(verifier):
+    with pytest.raises(TokenError):
+        verifier.verify(jwt.encode(claims(aud='anon'), SECRET, algorithm='HS256'))
+    payload = claims()
+    del payload['sub']
+    with pytest.raises(TokenError):
+        verifier.verify(jwt.encode(payload, SECRET, algorithm='HS256'))
+
+
+def test_garbage_token(verifier):
+    with pytest.raises(TokenError):
+        verifier.verify('not.a.token')
+
+
+@pytest.fixture
+def refresh(monkeypatch):
+    """Fake Supabase refresh that blocks until ``refresh.release`` is set"""
+    fake = SimpleNamespace(calls=[], release=threading.Event(), token=None)
+
+    def refresh_session(refresh_token):
+        fake.calls.append(refresh_token)
+        fake.release.wait(5)
+        if refresh_token == 'revoked':
+            raise RuntimeError('Invalid Refresh Token')
+        return SimpleNamespace(session=SimpleNamespace(access_token=fake.token, refresh_token='rotated'))
+
+    monkeypatch.setattr(supabase_jwt, 'get_supabase_auth', lambda: SimpleNamespace(refresh_session=refresh_session))
+    yield fake
+    fake.release.set()
+
+
+def test_concurrent_renewals_share_one_background_call(verifier, refresh):
+    futures = []
+    threads = [
+        threading.Thread(target=lambda: futures.append(verifier._renewal('old', start=True))) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Nobody waited for the call
+    assert len(futures) == 4 and not any(future.done() for future in futures)
+    refresh.release.set()
+    assert {future.result(5).refresh_token for future in futures} == {'rotated'}
+    # A request that still carries the old cookie reuses the result as well
+    assert verifier._renewal('old').result().refresh_token == 'rotated'
+    assert refresh.calls == ['old']
+
+
+class SessionUser(UserMixin):
+    id = 'user-1'
+
+
+@pytest.fixture
+def app(verifier):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', SUPABASE_JWT_VERIFY=True, SUPABASE_JWT_SECRET=SECRET)
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: SessionUser() if user_id == 'user-1' else None)
+    verifier.init_app(app)
+
+    @app.route('/')
+    def page():
+        return 'in' if current_user.is_authenticated else 'out'
+    return app
+
+
+def client_with_tokens(app, access_token, refresh_token):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = 'user-1'
+        session[supabase_jwt.SESSION_ACCESS_TOKEN] = access_token
+        session[supabase_jwt.SESSION_REFRESH_TOKEN] = refresh_token
+    return client
+
+
+def session_tokens(client):
+    with client.session_transaction() as session:
+        return session.get(supabase_jwt.SESSION_ACCESS_TOKEN), session.get(supabase_jwt.SESSION_REFRESH_TOKEN)
+
+
+def test_renewal_before_expiry_does_not_block_the_request(app, verifier, refresh):
+    token = jwt.encode(claims(expires_in=120), SECRET, algorithm='HS256')
+    refresh.token = jwt.encode(claims(expires_in=3600), SECRET, algorithm='HS256')
+    client = client_with_tokens(app, token, 'old')
+
+    started = time.monotonic()
+    assert client.get('/').get_data(as_text=True) == 'in'
+    assert time.monotonic() - started < 1
+    assert refresh.calls == ['old'] and session_tokens(client) == (token, 'old')
+
+    refresh.release.set()
+    verifier._renewal('old').result(5)
+    # The next request picks up the renewed tokens
+    assert client.get('/').get_data(as_text=True) == 'in'
+    assert session_tokens(client) == (refresh.token, 'rotated')
+    assert refresh.calls == ['old']
+
+
+def test_expired_token_is_accepted_while_its_renewal_runs(app, verifier, refresh):
+    token = jwt.encode(claims(expires_in=-600), SECRET, algorithm='HS256')
+    refresh.token = jwt.encode(claims(expires_in=3600), SECRET, algorithm='HS256')
+    client = client_with_tokens(app, token, 'old')
+
+    assert client.get('/').get_data(as_text=True) == 'in'
+    refresh.release.set()
+    verifier._renewal('old').result(5)
+    assert client.get('/').get_data(as_text=True) == 'in'
+    assert session_tokens(client) == (refresh.token, 'rotated')
+
+
+def test_failed_renewal_of_an_expired_token_logs_out(app, verifier, refresh):
+    token = jwt.encode(claims(expires_in=-600), SECRET, algorithm='HS256')
+    client = client_with_tokens(app, token, 'revoked')
+    refresh.release.set()
+
+    client.get('/')
+    assert verifier._renewal('revoked').exception(5) is not None
+    assert client.get('/').get_data(as_text=True) == 'out'
+    assert session_tokens(client) == (None, None)
+
+
+def test_forged_expired_token_is_not_accepted(app, refresh):
+    token = jwt.encode(claims(expires_in=-600), 'not-the-secret', algorithm='HS256')
+    client = client_with_tokens(app, token, 'old')
+
+    assert client.get('/').get_data(as_text=True) == 'out'
+    assert refresh.calls == []
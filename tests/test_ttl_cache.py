@@ -0,0 +1,69 @@
+import time
+
+from flask import Flask
+
+from login_app.ttl_cache import TTLCache
+
+
+def test_get_set_and_default():
+    cache = TTLCache(ttl=60)
+    assert cache.get('a') is None
+    assert cache.get('a', 0) == 0
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.set('a', 1)
+    now[0] += 9.9
+    assert cache.get('a') == 1
+    now[0] += 0.2
+    assert cache.get('a') is None
+
+
+def test_per_entry_ttl_can_only_shorten(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.set('short', 1, ttl=2)
+    cache.set('long', 2, ttl=100)
+    now[0] += 5
+    assert cache.get('short') is None
+    assert cache.get('long') == 2
+    now[0] += 6
+    assert cache.get('long') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_invalidate_and_clear():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    cache.invalidate('a', 'b', 'missing')
+    assert cache.get('a') is None and cache.get('b') is None
+    cache.clear()
+    assert cache.get('c') is None
+
+
+def test_init_app_reads_prefixed_settings_and_clears():
+    app = Flask(__name__)
+    app.config['BADGE_TTL'] = 5
+    cache = TTLCache(ttl=60, max_entries=10, config_prefix='BADGE')
+    cache.set('a', 1)
+    cache.init_app(app)
+    assert cache.ttl == 5
+    assert app.config['BADGE_MAX_ENTRIES'] == 10
+    assert cache.get('a') is None
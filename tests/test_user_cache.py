@@ -0,0 +1,113 @@
+import pytest
+from flask import Flask, render_template_string
+from flask_login import LoginManager, UserMixin, current_user
+from flask_sqlalchemy import SQLAlchemy
+
+from login_app.user_cache import UserCache, UserSnapshot
+
+db = SQLAlchemy()
+
+players = db.Table(
+    'players',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('campaign_id', db.Integer, db.ForeignKey('campaign.id'), primary_key=True),
+)
+
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), nullable=False)
+    password_hash = db.Column(db.String(128))
+
+
+class Campaign(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    dm_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    players = db.relationship('User', secondary=players)
+
+
+# Same checks as npcs.html/view_npc.html and manage_players
+PAGE = (
+    "{% if current_user.id == campaign.dm_id or current_user in campaign.players %}player-controls{% endif %}"
+    "|{{ 'self' if candidate == current_user else 'other' }}"
+    "|{{ 'invitable' if candidate != current_user else 'not-invitable' }}"
+)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', SQLALCHEMY_DATABASE_URI='sqlite://')
+    db.init_app(app)
+    cache = UserCache(ttl=60)
+    cache.init_app(app)
+    login_manager = LoginManager(app)
+    app.fetches = []
+
+    def fetch(user_id):
+        app.fetches.append(user_id)
+        return db.session.get(User, int(user_id))
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return cache.load(user_id, lambda: fetch(user_id))
+
+    @app.route('/campaign/<int:campaign_id>/<int:candidate_id>')
+    def page(campaign_id, candidate_id):
+        return render_template_string(
+            PAGE, campaign=db.session.get(Campaign, campaign_id), candidate=db.session.get(User, candidate_id)
+        )
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(id=1, username='dm'), User(id=2, username='anna'), User(id=3, username='ben')])
+        campaign = Campaign(id=1, dm_id=1)
+        campaign.players.append(db.session.get(User, 2))
+        db.session.add(campaign)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def get_as(app, user_id, url):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client.get(url).get_data(as_text=True)
+
+
+def test_cached_player_keeps_player_controls(app):
+    assert get_as(app, 2, '/campaign/1/2') == 'player-controls|self|not-invitable'
+    # Second request is served from the snapshot without loading the row
+    assert get_as(app, 2, '/campaign/1/2') == 'player-controls|self|not-invitable'
+    assert app.fetches == ['2']
+
+
+def test_cached_outsider_and_dm(app):
+    get_as(app, 3, '/campaign/1/2')
+    assert get_as(app, 3, '/campaign/1/2') == '|other|invitable'
+    get_as(app, 1, '/campaign/1/1')
+    # The DM is never offered as an invitable player
+    assert get_as(app, 1, '/campaign/1/1') == 'player-controls|self|not-invitable'
+    assert app.fetches == ['3', '1']
+
+
+def test_snapshots_compare_and_hash_by_id():
+    first = UserSnapshot({'id': 5}, None, None)
+    second = UserSnapshot({'id': 5}, None, None)
+    other = UserSnapshot({'id': 6}, None, None)
+
+    assert first == second and hash(first) == hash(second)
+    assert first != other
+    assert len({first, second, other}) == 2
+    assert first != 5
+
+
+def test_private_columns_are_not_cached(app):
+    cache = UserCache()
+    with app.app_context():
+        snapshot = cache.load(2, lambda: db.session.get(User, 2))
+        assert 'password_hash' not in snapshot._values
+        assert snapshot.username == 'anna'